@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Benchmark the FaultSkin reader (strike smoothing and triangulation)
+against the legacy implementation with one FaultCell object per cell, on a
+synthetic skin file. Also checks that both give the same results.
+
+Usage: python benchmarks/bench_fault_skin.py [--rows 1000] [--cols 1000]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from struct import unpack, calcsize
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # benchmark this tree, not an installed version
+
+from seismic_canvas.fault_skin import FaultCell, FaultSkin
+
+
+def write_synthetic_skin(filename, n_rows, n_cols, hole_fraction=0.05,
+                         seed=0):
+  """ Write a skin file of a wavy n_rows x n_cols grid of cells, with some
+  cells removed at random.
+  """
+  rng = np.random.RandomState(seed)
+  grid = -np.ones((n_rows, n_cols), dtype=int)
+  keep = rng.rand(n_rows, n_cols) >= hole_fraction
+  grid[keep] = np.arange(keep.sum())
+  rows, cols = np.nonzero(keep)
+  n = len(rows)
+
+  params = np.zeros((n, 9))
+  params[:, 0] = rows + 0.1 * rng.rand(n) # z
+  params[:, 1] = cols * 0.5 + 5 * np.sin(cols / 20.) # y
+  params[:, 2] = cols * 0.8 + 0.1 * rng.rand(n) # x
+  params[:, 3:] = rng.rand(n, 6) * 360
+
+  padded = np.pad(grid, 1, constant_values=-1)
+  r, c = rows + 1, cols + 1
+  neighbors = np.stack([padded[r-1, c], padded[r+1, c],
+                        padded[r, c-1], padded[r, c+1]], axis=1)
+
+  with open(filename, 'wb') as f:
+    f.write(np.array([n], dtype='>i4').tobytes())
+    f.write(params.astype('>f4').tobytes())
+    f.write(neighbors.astype('>i4').tobytes())
+  return n
+
+
+def legacy_read_skin(filename):
+  """ The legacy reader: struct.unpack and one FaultCell per cell. Returns
+  the cells, the vertices and the faces.
+  """
+  with open(filename, 'br') as f:
+    num_cells = unpack('>i', f.read(calcsize('>i')))[0]
+    fmt = '>{:d}f'.format(9 * num_cells)
+    cell_params = unpack(fmt, f.read(calcsize(fmt)))
+    cells = []
+    for i in range(num_cells):
+      param = cell_params[9*i: 9*(i+1)]
+      cells.append(FaultCell(i, pos=(param[2], param[1], param[0]),
+        likelihood=param[3], strike=param[4], dip=param[5],
+        slip=(param[8], param[7], param[6])))
+    fmt = '>{:d}i'.format(4 * num_cells)
+    cell_neighbors = unpack(fmt, f.read(calcsize(fmt)))
+  for i in range(num_cells):
+    above, below, left, right = cell_neighbors[4*i: 4*(i+1)]
+    if above >= 0: cells[i].above = cells[above]
+    if below >= 0: cells[i].below = cells[below]
+    if left >= 0: cells[i].left = cells[left]
+    if right >= 0: cells[i].right = cells[right]
+  for cell in cells:
+    cell.smooth_strike()
+
+  vertices = np.array([cell.pos for cell in cells])
+  faces = []
+  for i, cell in enumerate(cells):
+    R = cell.right
+    RB = R.below if R is not None else None
+    B = cell.below
+    BR = B.right if B is not None else None
+    if R and RB:
+      faces.append([i, RB.index, R.index])
+    if B and BR:
+      faces.append([i, B.index, BR.index])
+  faces = np.array(faces).astype(int)
+  return cells, vertices, faces
+
+
+def best_time(func, repeat):
+  times = []
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    result = func()
+    times.append(time.perf_counter() - t0)
+  return min(times), result
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+  parser.add_argument('--rows', type=int, default=1000)
+  parser.add_argument('--cols', type=int, default=1000)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    filename = os.path.join(tmp_dir, 'skin_bench.dat')
+    n_cells = write_synthetic_skin(filename, args.rows, args.cols)
+
+    t_legacy, (cells, legacy_verts, legacy_faces) = best_time(
+      lambda: legacy_read_skin(filename), 1)
+    def load_new():
+      skin = FaultSkin(filename)
+      return skin, skin.get_vertices_and_faces()
+    t_new, (skin, (verts, faces)) = best_time(load_new, args.repeat)
+
+  assert np.array_equal(verts, legacy_verts), 'vertices differ'
+  assert np.array_equal(faces, legacy_faces), 'faces differ'
+  assert np.array_equal(skin.strike, [cell.strike for cell in cells]), \
+    'smoothed strikes differ'
+
+  print('{:d} cells, {:d} faces'.format(n_cells, len(faces)))
+  print('legacy:     {:8.3f} s'.format(t_legacy))
+  print('vectorized: {:8.3f} s  ({:.0f}x)'.format(t_new, t_legacy / t_new))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Benchmark the import time of seismic_canvas, each measured in a fresh
+interpreter. Fails (exit status 1) if 'import seismic_canvas' takes longer
+than the budget, or loads any of the heavy GUI/plotting modules, which must
+only be imported on first use of the names that need them.
+
+Usage: python benchmarks/bench_import.py [--budget 0.05] [--repeat 5]
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+# Modules that 'import seismic_canvas' must not load.
+HEAVY_MODULES = ('vispy', 'matplotlib', 'matplotlib.pyplot', 'tkinter',
+                 'OpenGL', 'PyQt5', 'numpy')
+
+# Statement name -> import statement.
+STATEMENTS = [
+  ('import seismic_canvas', 'import seismic_canvas'),
+  ('volume data only', 'from seismic_canvas import BrickedVolume, SliceCache'),
+  ('SeismicCanvas', 'from seismic_canvas import SeismicCanvas'),
+  ('Colorbar', 'from seismic_canvas import Colorbar'),
+]
+
+_CHILD = """
+import sys, time, json, warnings
+warnings.simplefilter('ignore')
+t0 = time.perf_counter()
+{statement}
+t = time.perf_counter() - t0
+print(json.dumps([t, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+
+def time_import(statement, repeat):
+  """ Best time (seconds) of the statement over repeat fresh interpreters,
+  and the heavy modules it loaded.
+  """
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join(
+    [root] + [p for p in [env.get('PYTHONPATH')] if p])
+  code = _CHILD.format(statement=statement, heavy=HEAVY_MODULES)
+  best, loaded = float('inf'), []
+  for _ in range(repeat):
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    t, loaded = json.loads(output.decode().strip().splitlines()[-1])
+    best = min(best, t)
+  return best, loaded
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+  parser.add_argument('--budget', type=float, default=0.05,
+                      help='max seconds for "import seismic_canvas"')
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  failed = False
+  for name, statement in STATEMENTS:
+    try:
+      t, loaded = time_import(statement, args.repeat)
+    except subprocess.CalledProcessError:
+      print('{:>24}: failed'.format(name))
+      failed = failed or name == 'import seismic_canvas'
+      continue
+    print('{:>24}: {:8.3f} s  loads {}'.format(name, t,
+                                               ', '.join(loaded) or '-'))
+    if name == 'import seismic_canvas':
+      if t > args.budget:
+        print('  over the budget of {:.3f} s'.format(args.budget))
+        failed = True
+      if loaded:
+        print('  must not load {}'.format(', '.join(loaded)))
+        failed = True
+  sys.exit(1 if failed else 0)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Benchmark suite of the hot paths of seismic_canvas, on synthetic data
+and without a display: slicing latency per axis and volume backend, slice
+updates with overlays, fault skin loading, colorbar rendering, import time,
+and (if a headless OpenGL backend is available) rendering and picking.
+
+The results can be saved as JSON (with the git commit they were measured
+at) and compared with a previous run, to catch performance regressions:
+  python benchmarks/run_benchmarks.py --json before.json
+  (checkout another commit)
+  python benchmarks/run_benchmarks.py --compare before.json
+
+Usage: python benchmarks/run_benchmarks.py [--size small|medium|large]
+  [--repeat 5] [--filter slicing] [--json out.json] [--compare old.json]
+  [--threshold 1.25]
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # benchmark this tree, not an installed version
+
+# Synthetic volume shape for each --size.
+SIZES = {'small': (128, 128, 128), 'medium': (256, 256, 256),
+         'large': (512, 512, 512)}
+
+# Synthetic fault skin grid (rows, cols) for each --size.
+SKIN_SIZES = {'small': (200, 200), 'medium': (500, 500),
+              'large': (1000, 1000)}
+
+
+def measure(func, repeat, number=1):
+  """ Run func number times per sample, repeat samples. Returns the median
+  and the min of the time per call (seconds).
+  """
+  times = []
+  for _ in range(repeat):
+    t0 = time.perf_counter()
+    for _ in range(number):
+      func()
+    times.append((time.perf_counter() - t0) / number)
+  return float(np.median(times)), float(np.min(times))
+
+
+def synthetic_volume(shape, seed=0):
+  """ A float32 volume of smoothed noise, like seismic amplitudes.
+  """
+  rng = np.random.RandomState(seed)
+  vol = rng.randn(*shape).astype(np.float32)
+  for axis in range(3):
+    vol += np.roll(vol, 1, axis=axis)
+  return vol
+
+
+def volume_backends(vol, tmp_dir):
+  """ The volume backends to benchmark, {name: 3D array-like}, all with the
+  samples of vol.
+  """
+  from seismic_canvas import convert_to_bricked, SegyVolume, write_segy
+  from seismic_canvas import convert_to_chunked
+  backends = {'ndarray': vol}
+
+  filename = os.path.join(tmp_dir, 'volume_be.dat')
+  vol.astype('>f4').tofile(filename)
+  backends['memmap_be'] = np.memmap(filename, dtype='>f4', mode='r',
+                                    shape=vol.shape)
+  backends['bricked'] = convert_to_bricked(
+    backends['memmap_be'], os.path.join(tmp_dir, 'volume.bvol'))
+  filename = os.path.join(tmp_dir, 'volume.sgy')
+  write_segy(filename, vol, format=1) # IBM floats
+  backends['segy_ibm'] = SegyVolume(filename)
+  # Without the chunk cache, every fetch decompresses its chunks.
+  chunked = convert_to_chunked(vol, os.path.join(tmp_dir, 'volume.cvol'))
+  chunked.cache = None
+  backends['chunked_zlib'] = chunked
+  return backends
+
+
+def bench_slicing(ctx):
+  """ Latency of one slice fetch (slicing_at_axis, without the slice
+  cache) per volume backend and axis, sweeping over the positions.
+  """
+  from seismic_canvas import volume_slices
+  shape = ctx['volume'].shape
+  for name, vol in ctx['backends'].items():
+    nodes = volume_slices(vol, x_pos=0, y_pos=0, z_pos=0, clims=(-1, 1),
+                          cache=False)
+    for node, n in zip(nodes, shape):
+      image_func = node.image_funcs[0]
+      positions = iter(np.tile(np.arange(n), 1000))
+      yield ('slicing/{}/{}'.format(name, node.axis),
+             lambda f=image_func, p=positions: f(next(p)))
+
+
+def bench_update(ctx):
+  """ Cost of moving a slice (_update_location: fetch, stage and set the
+  images) with 1 ~ 4 overlaid volumes, without the slice cache.
+  """
+  from seismic_canvas import volume_slices
+  vol = ctx['volume']
+  for n_vol in (1, 2, 4):
+    for axis in ('x', 'z'):
+      node, = volume_slices([vol] * n_vol, clims=[(-1, 1)] * n_vol,
+                            cmaps=['grays'] * n_vol, cache=False,
+                            **{axis + '_pos': 0})
+      n = vol.shape['xyz'.index(axis)]
+      positions = iter(np.tile(np.arange(1, n), 1000))
+      yield ('update/{}_volumes/{}'.format(n_vol, axis),
+             lambda node=node, p=positions: node.move_to(next(p)))
+
+
+def bench_fault_skin(ctx):
+  """ Reading a fault skin file, and its triangulation.
+  """
+  from bench_fault_skin import write_synthetic_skin
+  from seismic_canvas import FaultSkin
+  filename = os.path.join(ctx['tmp_dir'], 'skin_bench.dat')
+  write_synthetic_skin(filename, *SKIN_SIZES[ctx['size']])
+  skin = FaultSkin(filename)
+  yield 'fault_skin/load', lambda: FaultSkin(filename)
+  yield 'fault_skin/triangulate', skin.get_vertices_and_faces
+  yield 'fault_skin/lod_faces', lambda: skin.get_lod_faces(4)
+
+
+def bench_colorbar(ctx):
+  """ Rendering a Matplotlib colorbar (not cached).
+  """
+  import warnings
+  with warnings.catch_warnings():
+    warnings.simplefilter('ignore') # the fallback warning
+    from seismic_canvas import Colorbar
+  if Colorbar.__module__.endswith('colorbar'):
+    return # matplotlib missing, nothing rendered
+  yield 'colorbar/render', lambda: Colorbar(cmap='viridis', clim=(-1, 1),
+                                            cache=False)
+
+
+def bench_import(ctx):
+  """ Import time of the package, each in a fresh interpreter.
+  """
+  from bench_import import time_import, STATEMENTS
+  for name, statement in STATEMENTS:
+    t = [] # time_import repeats in fresh interpreters itself
+    def run(statement=statement, t=t):
+      t.append(time_import(statement, 1)[0])
+    yield 'import/' + name.replace(' ', '_'), run, t
+
+
+def bench_canvas(ctx):
+  """ Rendering a frame and picking, offscreen. Skipped if no headless
+  OpenGL backend is available.
+  """
+  from seismic_canvas.offscreen import use_headless_backend
+  try:
+    use_headless_backend()
+  except RuntimeError:
+    return
+  from seismic_canvas import SeismicCanvas, volume_slices, XYZAxis
+  nodes = volume_slices(ctx['volume'], x_pos=[10, 60], y_pos=20, z_pos=30,
+                        clims=(-1, 1), cache=False)
+  canvas = SeismicCanvas(size=(800, 720), visual_nodes=nodes,
+                         xyz_axis=XYZAxis(), show=False)
+  canvas.render() # compile the shaders and upload the textures
+  yield 'canvas/render', canvas.render
+  def pick(cpu_picking):
+    canvas.cpu_picking = cpu_picking
+    return canvas.pick((400, 360))
+  yield 'canvas/pick_cpu', lambda: pick(True)
+  yield 'canvas/pick_gpu', lambda: pick(False)
+  node = nodes[0]
+  positions = iter(np.tile(np.arange(1, ctx['volume'].shape[0]), 1000))
+  def drag_frame():
+    node.move_to(next(positions))
+    canvas.render()
+  yield 'canvas/drag_frame', drag_frame
+  canvas.cpu_picking = True
+
+
+BENCHMARKS = [bench_slicing, bench_update, bench_fault_skin, bench_colorbar,
+              bench_import, bench_canvas]
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+      cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run(size='small', repeat=5, number=10, pattern=None):
+  """ Run the benchmarks whose name contains pattern. Returns the results
+  as a JSON serializable dict.
+  """
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    ctx = {'size': size, 'tmp_dir': tmp_dir,
+           'volume': synthetic_volume(SIZES[size])}
+    ctx['backends'] = volume_backends(ctx['volume'], tmp_dir)
+    for bench in BENCHMARKS:
+      for case in bench(ctx):
+        name, func = case[:2]
+        if pattern is not None and pattern not in name:
+          continue
+        func() # warm up
+        if len(case) > 2: # the case measures itself
+          times = case[2]
+          del times[:]
+          for _ in range(repeat):
+            func()
+          median, best = float(np.median(times)), float(np.min(times))
+        else:
+          median, best = measure(func, repeat, number)
+        results[name] = {'median': median, 'min': best}
+        print('{:<32} {:>10.3f} ms  (min {:.3f} ms)'.format(
+          name, median * 1e3, best * 1e3))
+        sys.stdout.flush()
+  import vispy
+  return {'commit': git_commit(),
+          'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+          'size': size, 'repeat': repeat,
+          'python': platform.python_version(),
+          'numpy': np.__version__, 'vispy': vispy.__version__,
+          'machine': platform.platform(), 'results': results}
+
+
+def compare(report, baseline, threshold=1.25):
+  """ Print the ratio of every result to the baseline report. Returns the
+  names of the results slower than threshold times the baseline.
+  """
+  print('\nCompared to {} ({}):'.format(baseline.get('commit'),
+                                        baseline.get('date')))
+  if baseline.get('size') != report['size']:
+    print('  warning: different --size ({} vs {})'.format(
+      baseline.get('size'), report['size']))
+  regressions = []
+  for name, result in report['results'].items():
+    old = baseline['results'].get(name)
+    if old is None:
+      print('{:<32} {:>10}'.format(name, 'new'))
+      continue
+    ratio = result['median'] / old['median']
+    flag = ''
+    if ratio > threshold:
+      flag = '  SLOWER'
+      regressions.append(name)
+    elif ratio < 1 / threshold:
+      flag = '  faster'
+    print('{:<32} {:>10.3f} ms -> {:>10.3f} ms  {:5.2f}x{}'.format(
+      name, old['median'] * 1e3, result['median'] * 1e3, ratio, flag))
+  return regressions
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+  parser.add_argument('--size', choices=sorted(SIZES), default='small')
+  parser.add_argument('--repeat', type=int, default=5,
+                      help='number of samples of each benchmark')
+  parser.add_argument('--number', type=int, default=10,
+                      help='calls per sample')
+  parser.add_argument('--filter', default=None,
+                      help='only run the benchmarks containing this string')
+  parser.add_argument('--json', default=None, help='save the results here')
+  parser.add_argument('--compare', default=None,
+                      help='results of a previous run (JSON) to compare to')
+  parser.add_argument('--threshold', type=float, default=1.25,
+                      help='slowdown ratio reported as a regression')
+  args = parser.parse_args()
+
+  report = run(args.size, args.repeat, args.number, args.filter)
+  if args.json is not None:
+    with open(args.json, 'w') as f:
+      json.dump(report, f, indent=2)
+  if args.compare is not None:
+    with open(args.compare) as f:
+      baseline = json.load(f)
+    regressions = compare(report, baseline, args.threshold)
+    if regressions:
+      print('\n{:d} regression(s): {}'.format(len(regressions),
+                                              ', '.join(regressions)))
+      sys.exit(1)
@@ -13,10 +13,20 @@ import os
 import numpy as np
 from vispy import app
 from vispy.color import get_colormap, Colormap, Color
-from vispy.scene.visuals import Mesh, Markers
+from vispy.scene.visuals import Markers
 
-from seismic_canvas import (SeismicCanvas, volume_slices, XYZAxis, Colorbar)
-from osv_read_skin import FaultSkin
+from seismic_canvas import (SeismicCanvas, volume_slices, XYZAxis, Colorbar,
+                            BrickedVolume, precompute_volume,
+                            load_fault_skins, LODMesh)
+
+
+# Preprocessing function to warp strike angles in range 0 ~ 180 degrees.
+# Defined at module level so that it can be sent to worker processes.
+def strike_warp(strike):
+  warped = strike.copy()
+  warp_index = np.where(strike > 180)
+  warped[warp_index] = 180 - warped[warp_index]
+  return warped
 
 
 if __name__ == '__main__':
@@ -94,16 +104,15 @@ if __name__ == '__main__':
   strike_cmap = 'hsl'
   strike_range = (0, 180)
 
-  # Use preprocess function to warp strike angles in range 0 ~ 180 degrees.
-  def strike_warp(strike):
-    warped = strike.copy()
-    warp_index = np.where(strike > 180)
-    warped[warp_index] = 180 - warped[warp_index]
-    return warped
+  # Warp the strike angles once for the whole volume (in parallel), rather
+  # than with preproc_funcs=strike_warp on every slice fetch.
+  warped_strike_file = './F3_strike_warped.bvol'
+  if not os.path.exists(warped_strike_file):
+    precompute_volume(strike_vol, strike_warp, warped_strike_file)
+  warped_strike_vol = BrickedVolume(warped_strike_file)
 
-  visual_nodes = volume_slices(strike_vol,
+  visual_nodes = volume_slices(warped_strike_vol,
     cmaps=strike_cmap, clims=strike_range,
-    preproc_funcs=strike_warp,
     interpolation='bilinear', **slicing)
   xyz_axis = XYZAxis()
   colorbar = Colorbar(cmap=strike_cmap, clim=strike_range,
@@ -166,43 +175,22 @@ if __name__ == '__main__':
   fault_cmap = 'hsl'
   fault_range = (0, 180)
 
-  # Read from skin files using FaultSkin class.
+  # Read and merge all the skin files (cached after the first launch), with
+  # 4 levels of detail used while the camera moves.
   skin_dir = './F3_fault_skins'
-  all_verts = None
-  all_faces = None
-  all_strikes = None
-  for filename in os.listdir(skin_dir):
-    if filename.startswith('skin') and filename.endswith('.dat'):
-      skin = FaultSkin(os.path.join(skin_dir, filename))
-      verts, faces = skin.get_vertices_and_faces()
-      # Convert to seismic coord system.
-      verts[:, 1] = volume_shape[1] - verts[:, 1]
-      verts[:, 2] = volume_shape[2] - verts[:, 2]
-
-      strikes = np.zeros(verts.shape[0])
-      for i, cell in enumerate(skin.cells):
-        strike = cell.strike
-        if strike > 180: strike = 360 - strike
-        strikes[i] = strike
-
-      # Append to all collected verts/faces/values.
-      if all_verts is None:
-        all_verts = verts
-        all_faces = faces
-        all_strikes = strikes
-      else:
-        faces += all_verts.shape[0]
-        all_verts = np.concatenate((all_verts, verts))
-        all_faces = np.concatenate((all_faces, faces))
-        all_strikes = np.concatenate((all_strikes, strikes))
-
-  fault_surface = Mesh(all_verts, all_faces,
+  all_verts, all_faces, all_strikes = load_fault_skins(skin_dir, n_levels=4)
+  # Convert to seismic coord system.
+  all_verts = all_verts * [1, -1, -1] + [0, volume_shape[1], volume_shape[2]]
+  all_strikes = np.where(all_strikes > 180, 360 - all_strikes, all_strikes)
+
+  fault_surface = LODMesh(all_verts, all_faces,
     vertex_values=all_strikes, shading='smooth')
-  fault_surface.cmap = fault_cmap
-  fault_surface.clim = fault_range
-  fault_surface.shininess = 0.01
-  fault_surface.ambient_light_color = Color([.2, .2, .2, 1])
-  fault_surface.light_dir = (5, -10, 5)
+  for mesh in fault_surface.meshes:
+    mesh.cmap = fault_cmap
+    mesh.clim = fault_range
+    mesh.shininess = 0.01
+    mesh.ambient_light_color = Color([.2, .2, .2, 1])
+    mesh.light_dir = (5, -10, 5)
 
   visual_nodes = volume_slices(seismic_vol,
     cmaps=seismic_cmap,
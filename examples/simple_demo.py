@@ -51,7 +51,8 @@ if __name__ == '__main__':
     x_pos=100, y_pos=128, z_pos=30,
     seismic_coord_system=False)
   xyz_axis = XYZAxis(seismic_coord_system=False)
-  colorbar = Colorbar(cmap='grays', clim=(volume.min(), volume.max()),
+  # The clim was set automatically from the 1%/99% percentiles of volume.
+  colorbar = Colorbar(cmap='grays', clim=visual_nodes[0].clim,
                       label_str='Amplitude', label_size=8, tick_size=6)
 
 
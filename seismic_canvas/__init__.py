@@ -5,21 +5,68 @@
 # Distributed under the MIT License. See LICENSE for more info.
 # -----------------------------------------------------------------------------
 
-from .seismic_canvas import SeismicCanvas
-from .axis_aligned_image import AxisAlignedImage
-from .volume_slices import volume_slices
-from .xyz_axis import XYZAxis
-
-try:
-  # Check Python module dependencies.
-  import matplotlib.pyplot
-  # Only import the MPL generated colorbar if MPL is available.
-  from .colorbar_MPL import Colorbar
-except ImportError:
-  from warnings import warn
-  warn("Module matplotlib/tkinter missing, using vispy stock colorbar")
-  # Use vispy stock colorbar if MPL is not available.
-  from .colorbar import Colorbar
+""" The public names are imported lazily (PEP 562): 'import seismic_canvas'
+does not load vispy, matplotlib or any OpenGL backend; each submodule is
+imported on the first use of one of its names, e.g. seismic_canvas.Colorbar.
+"""
+
+import importlib
+
+
+# Public name -> submodule that defines it.
+_LAZY_NAMES = {
+  'SeismicCanvas': 'seismic_canvas',
+  'AxisAlignedImage': 'axis_aligned_image',
+  'TiledAxisAlignedImage': 'tiled_image',
+  'volume_slices': 'volume_slices',
+  'XYZAxis': 'xyz_axis',
+  'SliceCache': 'slice_cache',
+  'SlicePrefetcher': 'slice_prefetcher',
+  'BrickedVolume': 'bricked_volume',
+  'convert_to_bricked': 'bricked_volume',
+  'ChunkedVolume': 'chunked_volume',
+  'convert_to_chunked': 'chunked_volume',
+  'SegyVolume': 'segy_volume',
+  'write_segy': 'segy_volume',
+  'VolumePyramid': 'volume_pyramid',
+  'estimate_stats': 'volume_stats',
+  'estimate_clim': 'volume_stats',
+  'precompute_volume': 'precompute',
+  'FaultSkin': 'fault_skin',
+  'load_fault_skins': 'fault_skin',
+  'LODMesh': 'lod_mesh',
+}
+
+__all__ = sorted(list(_LAZY_NAMES) + ['Colorbar'])
+
+
+def _import_colorbar():
+  try:
+    # Only use the MPL generated colorbar if MPL is available.
+    from .colorbar_MPL import Colorbar
+  except ImportError:
+    from warnings import warn
+    warn("Module matplotlib missing, using vispy stock colorbar")
+    # Use vispy stock colorbar if MPL is not available.
+    from .colorbar import Colorbar
+  return Colorbar
+
+
+def __getattr__(name):
+  if name == 'Colorbar':
+    value = _import_colorbar()
+  elif name in _LAZY_NAMES:
+    module = importlib.import_module('.' + _LAZY_NAMES[name], __name__)
+    value = getattr(module, name)
+  else:
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+                         __name__, name))
+  globals()[name] = value # later lookups do not come here again
+  return value
+
+
+def __dir__():
+  return sorted(list(globals()) + __all__)
 
 
 __version__ = '0.1.0'
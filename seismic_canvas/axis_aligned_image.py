@@ -5,32 +5,96 @@
 # Distributed under the MIT License. See LICENSE for more info.
 # -----------------------------------------------------------------------------
 
+import time
+
 import numpy as np
-from vispy import scene
+from vispy import scene, app
 from vispy.visuals.transforms import MatrixTransform, STTransform
 
 
+# The private members of the vispy Image visual used to build the textures
+# ahead of the draw, so that the uploads can be timed on their own. They are
+# checked before use, see tests/test_vispy_compat.py.
+TEXTURE_HOOKS = ('_need_texture_upload', '_need_interpolation_update',
+                 '_build_texture')
+
+
+def build_pending_textures(images, stats, node):
+  """ Build the textures of the vispy Image visuals whose data changed
+  since their last draw, and add the time to the 'upload' stage of stats
+  (FrameStats) for node. Does nothing with a vispy version without the
+  texture hooks (the textures are then built, untimed, when drawn).
+  """
+  images = [image for image in images if image._data is not None
+            and all(hasattr(image, name) for name in TEXTURE_HOOKS)
+            and image._need_texture_upload
+            and not image._need_interpolation_update]
+  if images:
+    t0 = time.perf_counter()
+    for image in images:
+      image._build_texture()
+    stats.add('upload', time.perf_counter() - t0, node)
+
+
 class AxisAlignedImage(scene.visuals.Image):
   """ Visual subclass displaying an image that aligns to an axis.
   This image should be able to move along the perpendicular direction when
   user gives corresponding inputs.
 
   Parameters:
-
+  seismic_coord_system: bool, if True, the images are displayed in the
+    z-axis down seismic coordinate system, i.e. flipped along the y and z
+    axis by the transform (the image functions return unflipped slices).
+  prefetcher: SlicePrefetcher, if given, the slices ahead of this image are
+    read on background threads while it is being dragged.
+  drag_lod: int, level of detail shown while dragging, the image functions
+    are called with level=drag_lod and should return the slice decimated by
+    2**drag_lod. 0 always shows the full resolution.
+  lod_idle: float, seconds without moving before the full resolution is
+    restored during a drag.
+  texture_format: str or None, passed to the vispy Image visuals. 'auto'
+    (default) uploads the staged float32 images as they are and applies the
+    clim on the GPU; None lets vispy rescale a copy of them on the CPU at
+    every upload (e.g. for GPUs without float textures).
+  quantize: None, 'uint8' or 'uint16', if given, the images are quantized
+    against their clim on the CPU and uploaded as 8/16-bit textures (4x/2x
+    fewer bytes than float32). Values outside the clim are clipped, which
+    looks the same since the colormap saturates there. Use 'set_clim' to
+    change the clim without fetching the images again.
   """
   def __init__(self, image_funcs, axis='z', pos=0, limit=None,
                seismic_coord_system=True,
                cmaps=['grays'], clims=None,
-               interpolation='nearest', method='auto'):
+               interpolation='nearest', method='auto',
+               prefetcher=None, drag_lod=0, lod_idle=0.3,
+               texture_format='auto', quantize=None):
 
     assert clims is not None, 'clim must be specified explicitly.'
 
+    # Quantized images are displayed with clim (0, max integer).
+    self._quantize_dtype = None
+    self.clims = list(clims[:len(image_funcs)]) # in data units
+    if quantize is not None:
+      self._quantize_dtype = np.dtype(quantize)
+      if self._quantize_dtype not in (np.uint8, np.uint16):
+        raise ValueError("quantize must be None, 'uint8' or 'uint16'.")
+      levels = np.iinfo(self._quantize_dtype).max
+      clims = [(0, levels)] * len(image_funcs)
+      # Upload the integers as they are, not rescaled to float on the CPU.
+      if texture_format is None:
+        texture_format = 'auto'
+
+    # None is vispy's default (CPU rescaling), do not pass it.
+    image_kwargs = {}
+    if texture_format is not None:
+      image_kwargs['texture_format'] = texture_format
+
     # Create an Image obj and unfreeze it so we can add more
     # attributes inside.
     # First image (from image_funcs[0])
     scene.visuals.Image.__init__(self, parent=None, # no image func yet
       cmap=cmaps[0], clim=clims[0],
-      interpolation=interpolation, method=method)
+      interpolation=interpolation, method=method, **image_kwargs)
     self.unfreeze()
     self.interactive = True
 
@@ -39,8 +103,18 @@ class AxisAlignedImage(scene.visuals.Image):
     for i_img in range(1, len(image_funcs)):
       overlaid_image = scene.visuals.Image(parent=self,
         cmap=cmaps[i_img], clim=clims[i_img],
-        interpolation=interpolation, method=method)
+        interpolation=interpolation, method=method, **image_kwargs)
       self.overlaid_images.append(overlaid_image)
+    # Kept to create more images alike, see TiledAxisAlignedImage.
+    self._image_kwargs = dict(interpolation=interpolation, method=method,
+                              **image_kwargs)
+
+    # Preallocated staging buffers that receive the transposed images,
+    # {(i_img, shape): np array}, see '_stage'. The quantized images and a
+    # float scratch buffer are also preallocated, see '_quantize'.
+    self._staging = {}
+    self._quantized = {}
+    self._scratch = {}
 
     # Set GL state. Must check depth test, otherwise weird in 3D.
     self.set_gl_state(depth_test=True, depth_func='lequal',
@@ -59,6 +133,14 @@ class AxisAlignedImage(scene.visuals.Image):
     # Get the image_func that returns either image or image shape.
     self.image_funcs = image_funcs # a list of functions!
     shape = self.image_funcs[0](self.pos, get_shape=True)
+    self.image_shape = shape # full resolution (width, height)
+
+    # Level of detail: the displayed images are decimated by 2**level, and
+    # scaled back up by the transform.
+    self.level = 0
+    self.drag_lod = drag_lod
+    self.lod_idle = lod_idle
+    self._lod_timer = None # created at first drag
 
     # The selection highlight (a Plane visual with transparent color).
     # The plane is initialized before any rotation, on '+z' direction.
@@ -76,6 +158,10 @@ class AxisAlignedImage(scene.visuals.Image):
     # drag this image by anchor point moving in the normal direction.
     self.anchor = None # None by default
     self.offset = 0
+    self.prefetcher = prefetcher
+    # FrameStats recording the time of each stage of the updates, set by
+    # SeismicCanvas(frame_stats=True). None: not recorded.
+    self.stats = None
 
     # Apply SRT transform according to the axis attribute.
     self.transform = MatrixTransform()
@@ -106,6 +192,7 @@ class AxisAlignedImage(scene.visuals.Image):
     tr = self.canvas.scene.node_transform(self)
 
     # Get click (camera) coordinate in the local world.
+    lod_scale = self._lod_scale()
     click_pos = tr.map([*mouse_press_event.pos, 0, 1])
     click_pos /= click_pos[3] # rescale to cancel out the pos.w factor
     # Get the view direction (camera-to-target) vector in the local world.
@@ -118,6 +205,12 @@ class AxisAlignedImage(scene.visuals.Image):
     # The following equation can be derived by Eq 1 and Eq 2.
     distance = (0. - click_pos[2]) / view_vector[2]
     self.anchor = click_pos[:2] + distance * view_vector[:2] # only need vec2
+    # Store the anchor in full resolution units, the level may change.
+    self.anchor = self.anchor * lod_scale
+
+    # A new drag starts, the previous drag direction is irrelevant.
+    if self.prefetcher is not None:
+      self.prefetcher.forget(self)
 
   def drag_visual_node(self, mouse_move_event):
     """ Drag this visual node while holding left click in the selection mode
@@ -126,20 +219,27 @@ class AxisAlignedImage(scene.visuals.Image):
     'set_anchor') will move along the normal direction to stay as close to
     the mouse as possible, so that user feels like 'dragging' the plane.
     """
+    self.move_to(self.drag_target(mouse_move_event))
+
+  def drag_target(self, mouse_move_event):
+    """ Compute the position that this image should be dragged to, following
+    the mouse, without moving it. See 'drag_visual_node'.
+    """
     # Get the screen-to-local transform to get camera coordinates.
     tr = self.canvas.scene.node_transform(self)
 
     # Unlike in 'set_anchor', we now convert most coordinates to the screen
     # coordinate system, because it's more intuitive for user to do operations
     # in 2D and get 2D feedbacks, e.g. mouse leading the anchor point.
-    anchor = [*self.anchor, self.pos, 1] # 2D -> 3D
+    anchor_local = self.anchor / self._lod_scale() # to current level units
+    anchor = [*anchor_local, self.pos, 1] # 2D -> 3D
     anchor_screen = tr.imap(anchor) # screen coordinates of the anchor point
     anchor_screen /= anchor_screen[3] # rescale to cancel out 'w' term
     anchor_screen = anchor_screen[:2] # only need vec2
 
     # Compute the normal vector, starting from the anchor point and
     # perpendicular to the image plane.
-    normal = [*self.anchor, self.pos+1, 1] # +[0,0,1,0] from anchor
+    normal = [*anchor_local, self.pos+1, 1] # +[0,0,1,0] from anchor
     normal_screen = tr.imap(normal) # screen coordinates of anchor + [0,0,1,0]
     normal_screen /= normal_screen[3] # rescale to cancel out 'w' term
     normal_screen = normal_screen[:2] # only need vec2
@@ -184,11 +284,37 @@ class AxisAlignedImage(scene.visuals.Image):
     if self.limit is not None:
       if self.pos + offset < self.limit[0]: offset = self.limit[0] - self.pos
       if self.pos + offset > self.limit[1]: offset = self.limit[1] - self.pos
-    self.offset = offset
-    # Note: must reverse normal direction from +y direction to -y!
-    if self.axis == 'y': offset = -offset
+    return self.pos + offset
 
+  def move_to(self, pos):
+    """ Move this image to pos (rounded to the nearest integer) and update
+    the images. While being dragged, the coarse level of detail is shown
+    until the mouse stays idle. Returns False if nothing had to be updated.
+    """
+    pos = int(np.round(pos))
+    if pos == self.pos:
+      return False # no-op move, nothing to fetch or upload
+
+    self.offset = pos - self.pos
+    self.level = self.drag_lod if self.anchor is not None else 0
     self._update_location()
+    if self.level > 0:
+      if self._lod_timer is None:
+        self._lod_timer = app.Timer(interval=self.lod_idle, iterations=1,
+          connect=lambda event: self.refine(), start=False)
+      self._lod_timer.stop()
+      self._lod_timer.start() # restart the idle countdown
+    return True
+
+  def refine(self):
+    """ Switch back to the full resolution images, e.g. when the drag is
+    finished or the mouse stays idle.
+    """
+    if self._lod_timer is not None:
+      self._lod_timer.stop()
+    if self.level != 0:
+      self.level = 0
+      self._update_location()
 
   def _update_location(self):
     """ Update the image plane to the dragged location and redraw this image.
@@ -196,8 +322,31 @@ class AxisAlignedImage(scene.visuals.Image):
     self.pos += self.offset
     self.pos = int(np.round(self.pos)) # must round to nearest integer location
 
+    # Let the prefetcher read ahead if this image is being dragged.
+    if self.prefetcher is not None and self.anchor is not None:
+      self.prefetcher.observe(self, self.pos, self.level)
+
+    # Update image on the slice based on current position.
+    self._update_images()
+
     # Update the transformation in order to move to new location.
     self.transform.reset()
+    # Scale a decimated image up to the full resolution size, and keep the
+    # highlight plane (a child of self) at full resolution size.
+    sx, sy = self._lod_scale()
+    # Flip the image in the z-axis down seismic coordinate system: the
+    # image y-axis (z or y in 3D) is always reverted, the image x-axis only
+    # for the x slices (whose image x-axis is y in 3D).
+    fx, fy = 1, 1
+    if self.seismic_coord_system:
+      fy = -1
+      if self.axis == 'x': fx = -1
+    self.transform.scale((fx * sx, fy * sy, 1))
+    self.transform.translate((self.image_shape[0] if fx < 0 else 0,
+                              self.image_shape[1] if fy < 0 else 0, 0))
+    self.highlight.transform.scale = (1/sx, 1/sy, 1)
+    self.highlight.transform.translate = (self.image_shape[0]/2/sx,
+                                          self.image_shape[1]/2/sy, 0)
     if self.axis == 'z':
       # 1. No rotation to do for z axis (y-x) slice. Only translate.
       self.transform.translate((0, 0, self.pos))
@@ -211,18 +360,116 @@ class AxisAlignedImage(scene.visuals.Image):
       self.transform.rotate(90, (0, 0, 1))
       self.transform.translate((self.pos, 0, 0))
 
-    # Update image on the slice based on current position. The numpy array
-    # is transposed due to a conversion from i-j to x-y axis system.
+    # Reset attributes after dragging completes.
+    self.offset = 0
+    self._bounds_changed() # update the bounds with new self.pos
+
+  def _update_images(self):
+    """ Fetch the images at the current position and level of detail. The
+    numpy arrays are transposed due to a conversion from i-j to x-y axis
+    system.
+    """
+    if self.stats is not None:
+      self._update_images_timed()
+      return
     # First image, the primary one:
-    self.set_data(self.image_funcs[0](self.pos).T)
+    self.set_data(self._stage(0, self._get_image(0)))
     # Other images, overlaid on the primary image:
     for i_img in range(1, len(self.image_funcs)):
       self.overlaid_images[i_img].set_data(
-        self.image_funcs[i_img](self.pos).T)
+        self._stage(i_img, self._get_image(i_img)))
 
-    # Reset attributes after dragging completes.
-    self.offset = 0
-    self._bounds_changed() # update the bounds with new self.pos
+  def _update_images_timed(self):
+    """ Same as updating the images in '_update_location', recording the
+    time of the stages in self.stats.
+    """
+    stats = self.stats
+    for i_img, image in enumerate(self.overlaid_images):
+      t0 = time.perf_counter()
+      with stats.activate(self): # the image functions record read/preproc
+        data = self._get_image(i_img)
+      t1 = time.perf_counter()
+      image.set_data(self._stage(i_img, data))
+      t2 = time.perf_counter()
+      stats.add('fetch', t1 - t0, self)
+      stats.add('stage', t2 - t1, self)
+
+  def _prepare_draw(self, view):
+    """ Build the textures of the images changed since the last draw, timed
+    as the 'upload' stage if self.stats is set.
+    """
+    if self.stats is not None:
+      build_pending_textures(self.overlaid_images, self.stats, self)
+    return scene.visuals.Image._prepare_draw(self, view)
+
+  def _get_image(self, i_img):
+    """ Get the i-th image at the current position and level of detail.
+    """
+    if self.level > 0:
+      return self.image_funcs[i_img](self.pos, level=self.level)
+    return self.image_funcs[i_img](self.pos)
+
+  def _stage(self, i_img, image):
+    """ Transpose the i-th image into its staging buffer: a reusable,
+    C-contiguous, native float32 array. The transpose, the byte swapping
+    (e.g. of '>f4' memmap slices) and the type conversion are done in one
+    pass, without allocating a new array at every drag step.
+    """
+    shape = image.shape[::-1]
+    buffer = self._staging.get((i_img, shape))
+    if buffer is None:
+      buffer = np.empty(shape, dtype=np.float32)
+      self._staging[(i_img, shape)] = buffer
+    np.copyto(buffer, image.T, casting='unsafe')
+    if self._quantize_dtype is not None:
+      return self._quantize(i_img, buffer)
+    return buffer
+
+  def _quantize(self, i_img, buffer):
+    """ Quantize the staged (float32) i-th image against its clim into a
+    reusable integer buffer: round((x - cmin) / (cmax - cmin) * max_int),
+    clipped to [0, max_int], NaNs mapped to 0.
+    """
+    shape = buffer.shape
+    quantized = self._quantized.get((i_img, shape))
+    if quantized is None:
+      quantized = np.empty(shape, dtype=self._quantize_dtype)
+      self._quantized[(i_img, shape)] = quantized
+    scratch = self._scratch.get(shape)
+    if scratch is None:
+      scratch = self._scratch[shape] = np.empty(shape, dtype=np.float32)
+
+    levels = np.iinfo(self._quantize_dtype).max
+    cmin, cmax = self.clims[i_img]
+    scale = levels / (cmax - cmin) if cmax != cmin else 0.
+    np.subtract(buffer, cmin, out=scratch)
+    np.multiply(scratch, scale, out=scratch)
+    np.clip(scratch, 0, levels, out=scratch)
+    np.add(scratch, 0.5, out=scratch) # round to nearest when truncating
+    np.nan_to_num(scratch, copy=False, nan=0.)
+    np.copyto(quantized, scratch, casting='unsafe')
+    return quantized
+
+  def set_clim(self, clim, i_img=0):
+    """ Change the clim of the i-th image (0: primary image, 1~: overlaid
+    images). Quantized images are requantized from their staging buffer,
+    without calling the image functions again.
+    """
+    self.clims[i_img] = clim
+    image = self.overlaid_images[i_img]
+    if self._quantize_dtype is None:
+      image.clim = clim
+    else:
+      buffer = self._staging[(i_img, image._data.shape)]
+      image.set_data(self._quantize(i_img, buffer))
+
+  def _lod_scale(self):
+    """ The (x, y) scale factors from the displayed image pixels to the full
+    resolution pixels.
+    """
+    if self._data is None or self.level == 0:
+      return np.ones(2)
+    return np.array(self.image_shape, dtype=float) / self.size
 
   def _compute_bounds(self, axis_3d, view):
     """ Overwrite the original 2D bounds of the Image class. This will correct 
@@ -237,16 +484,18 @@ class AxisAlignedImage(scene.visuals.Image):
     The function returns a tuple (low_bounds, high_bounds) that represents
     the spatial limits of self obj in the 3D scene.
     """
-    # Note: self.size[0] is slow dim size, self.size[1] is fast dim size.
+    # Note: size[0] is slow dim size, size[1] is fast dim size. Use the full
+    # resolution size, the displayed image may be decimated.
+    size = self.image_shape
     if self.axis == 'z':
-      if   axis_3d==0: return (0, self.size[0])
-      elif axis_3d==1: return (0, self.size[1])
+      if   axis_3d==0: return (0, size[0])
+      elif axis_3d==1: return (0, size[1])
       elif axis_3d==2: return (self.pos, self.pos)
     elif self.axis == 'y':
-      if   axis_3d==0: return (0, self.size[0])
+      if   axis_3d==0: return (0, size[0])
       elif axis_3d==1: return (self.pos, self.pos)
-      elif axis_3d==2: return (0, self.size[1])
+      elif axis_3d==2: return (0, size[1])
     elif self.axis == 'x':
       if   axis_3d==0: return (self.pos, self.pos)
-      elif axis_3d==1: return (0, self.size[0])
-      elif axis_3d==2: return (0, self.size[1])
+      elif axis_3d==1: return (0, size[0])
+      elif axis_3d==2: return (0, size[1])
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" A bricked on-disk volume format. The volume is stored as cubic bricks
+(64^3 samples by default), so that slicing along any of the three axes
+reads about the same amount of data, unlike a row-major memmap where
+slicing along the last axis touches every page of the file.
+
+File layout:
+  - 8 bytes magic b'SCBRICK1', 4 bytes little-endian header length,
+  - a JSON header {'shape', 'dtype', 'brick_size'},
+  - zero padding up to the first multiple of 4096 bytes,
+  - all bricks in C-order of the brick grid, each brick is a C-order
+    brick_size^3 array (bricks on the edges are zero padded).
+
+Convert a raw binary volume from the command line (as a module, for the
+relative imports):
+  python -m seismic_canvas.bricked_volume src.dat dst.bvol --shape n0 n1 n2
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from .out_of_core_volume import OutOfCoreVolume
+
+
+_MAGIC = b'SCBRICK1'
+_ALIGNMENT = 4096
+
+
+def _data_offset(header_bytes):
+  n = len(_MAGIC) + 4 + len(header_bytes)
+  return (n + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _brick_grid(shape, brick_size):
+  return tuple((n + brick_size - 1) // brick_size for n in shape)
+
+
+class BrickedVolume(OutOfCoreVolume):
+  """ A read-only 3D volume stored in the bricked format, which can be
+  passed to volume_slices directly.
+
+  Parameters:
+  filename: str, the bricked volume file, see 'convert_to_bricked' to
+    create one from a raw binary file.
+  """
+  def __init__(self, filename):
+    with open(filename, 'rb') as f:
+      magic = f.read(len(_MAGIC))
+      if magic != _MAGIC:
+        raise ValueError('{} is not a bricked volume file.'.format(filename))
+      header_len = struct.unpack('<I', f.read(4))[0]
+      header_bytes = f.read(header_len)
+    header = json.loads(header_bytes.decode('utf-8'))
+
+    OutOfCoreVolume.__init__(self, header['shape'], header['dtype'])
+    self.filename = filename
+    self.brick_size = header['brick_size']
+    self._grid = _brick_grid(header['shape'], self.brick_size)
+    self._offset = _data_offset(header_bytes)
+    self._open()
+
+  def _open(self):
+    b = self.brick_size
+    self._bricks = np.memmap(self.filename, dtype=self.dtype, mode='r',
+      offset=self._offset, shape=(*self._grid, b, b, b))
+
+  def __getstate__(self):
+    # Do not pickle the memmap (it would pickle all the data), reopen it.
+    state = self.__dict__.copy()
+    del state['_bricks']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._open()
+
+  def _read_box(self, lo, hi):
+    b = self.brick_size
+    out = np.empty([h - l for l, h in zip(lo, hi)], dtype=self.dtype)
+    # Copy the intersection of the box with every brick it touches.
+    for bi in range(lo[0] // b, (hi[0] - 1) // b + 1):
+      i0, i1 = max(lo[0], bi*b), min(hi[0], (bi+1)*b)
+      for bj in range(lo[1] // b, (hi[1] - 1) // b + 1):
+        j0, j1 = max(lo[1], bj*b), min(hi[1], (bj+1)*b)
+        for bk in range(lo[2] // b, (hi[2] - 1) // b + 1):
+          k0, k1 = max(lo[2], bk*b), min(hi[2], (bk+1)*b)
+          out[i0-lo[0]:i1-lo[0], j0-lo[1]:j1-lo[1], k0-lo[2]:k1-lo[2]] = \
+            self._bricks[bi, bj, bk,
+                         i0-bi*b:i1-bi*b, j0-bj*b:j1-bj*b, k0-bk*b:k1-bk*b]
+    return out
+
+
+class BrickedVolumeWriter(object):
+  """ Create a bricked volume file and fill it block by block, so that
+  volumes larger than the memory can be converted.
+
+  Parameters:
+  filename: str, the bricked volume file to create (overwritten).
+  shape: tuple of 3 ints, the shape of the volume.
+  dtype: the sample type, stored in native byte order by default.
+  brick_size: int, the edge length of the cubic bricks.
+  """
+  def __init__(self, filename, shape, dtype=np.float32, brick_size=64):
+    self.filename = filename
+    self.shape = tuple(int(n) for n in shape)
+    self.dtype = np.dtype(dtype)
+    self.brick_size = int(brick_size)
+
+    header = {'shape': self.shape, 'dtype': self.dtype.str,
+              'brick_size': self.brick_size}
+    header_bytes = json.dumps(header).encode('utf-8')
+    offset = _data_offset(header_bytes)
+    with open(filename, 'wb') as f:
+      f.write(_MAGIC)
+      f.write(struct.pack('<I', len(header_bytes)))
+      f.write(header_bytes)
+      f.write(b'\0' * (offset - f.tell()))
+
+    b = self.brick_size
+    grid = _brick_grid(self.shape, b)
+    self._bricks = np.memmap(filename, dtype=self.dtype, mode='r+',
+                             offset=offset, shape=(*grid, b, b, b))
+
+  def write_block(self, lo, block):
+    """ Write block (an array) to the box starting at lo. lo must be aligned
+    to the bricks, and block must cover whole bricks except at the far edges
+    of the volume.
+    """
+    b = self.brick_size
+    assert all(l % b == 0 for l in lo), 'lo must be aligned to the bricks.'
+    hi = [l + n for l, n in zip(lo, block.shape)]
+    assert all(h == s or h % b == 0 for h, s in zip(hi, self.shape)), \
+      'block must cover whole bricks.'
+    for bi in range(lo[0] // b, (hi[0] + b - 1) // b):
+      di = bi*b - lo[0]
+      for bj in range(lo[1] // b, (hi[1] + b - 1) // b):
+        dj = bj*b - lo[1]
+        for bk in range(lo[2] // b, (hi[2] + b - 1) // b):
+          dk = bk*b - lo[2]
+          part = block[di:di+b, dj:dj+b, dk:dk+b]
+          brick = self._bricks[bi, bj, bk]
+          brick[:part.shape[0], :part.shape[1], :part.shape[2]] = part
+
+  def close(self):
+    self._bricks.flush()
+    del self._bricks
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def convert_to_bricked(src, dst, shape=None, dtype='>f4',
+                       out_dtype=np.float32, brick_size=64):
+  """ Convert a volume into the bricked format out-of-core. The source is
+  read one column of bricks at a time, so the memory usage is bounded by
+  brick_size^2 * shape[2] samples.
+
+  Parameters:
+  src: str or array-like, a raw binary file (then shape and dtype describe
+    its content, e.g. dtype='>f4' for SEG-Y derived data) or any 3D
+    array-like volume (e.g. np.memmap).
+  dst: str, the bricked volume file to create.
+  out_dtype: the sample type of the bricked volume, native float32 by
+    default so that no byte swapping is needed when reading.
+
+  Returns the BrickedVolume opened from dst.
+  """
+  if isinstance(src, str):
+    assert shape is not None, 'shape must be specified for a raw file.'
+    src = np.memmap(src, dtype=dtype, mode='r', shape=tuple(shape))
+  b = brick_size
+  n0, n1, _ = src.shape
+  with BrickedVolumeWriter(dst, src.shape, dtype=out_dtype,
+                           brick_size=b) as writer:
+    for i0 in range(0, n0, b):
+      for j0 in range(0, n1, b):
+        block = np.asarray(src[i0:i0+b, j0:j0+b, :], dtype=out_dtype)
+        writer.write_block((i0, j0, 0), block)
+  return BrickedVolume(dst)
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(
+    prog='python -m seismic_canvas.bricked_volume',
+    description='Convert a raw binary volume into the bricked format.')
+  parser.add_argument('src', help='raw binary volume file, e.g. seismic.dat')
+  parser.add_argument('dst', help='bricked volume file to create')
+  parser.add_argument('--shape', type=int, nargs=3, required=True)
+  parser.add_argument('--dtype', default='>f4',
+                      help="sample type of src (default: '>f4')")
+  parser.add_argument('--brick-size', type=int, default=64)
+  args = parser.parse_args()
+  convert_to_bricked(args.src, args.dst, shape=args.shape, dtype=args.dtype,
+                     brick_size=args.brick_size)
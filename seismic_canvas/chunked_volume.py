@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" A chunked, compressed on-disk volume format, for surveys too large to be
+kept uncompressed. The volume is stored as cubic chunks (64^3 samples by
+default) compressed independently, so that a slice only decompresses the
+chunks it crosses; the decompressed chunks are kept in a LRU cache.
+
+File layout:
+  - 8 bytes magic b'SCCHUNK1', 4 bytes little-endian header length,
+  - a JSON header {'shape', 'dtype', 'chunk_size', 'codec', 'shuffle'},
+  - the compressed chunks, in the order they were written,
+  - the chunk table: (offset, nbytes) of every chunk in C-order of the
+    chunk grid, as little-endian uint64,
+  - 8 bytes little-endian uint64, the offset of the chunk table.
+
+Each chunk is a C-order chunk_size^3 array (chunks on the edges are zero
+padded), byte-shuffled (the i-th bytes of all the samples grouped together,
+which compresses floats much better) if 'shuffle' is set, then compressed
+with the codec: 'zlib', 'lzma' (Python standard library), 'lz4' (requires
+the lz4 package) or 'none'.
+
+Convert a raw binary file from the command line with
+  python -m seismic_canvas.chunked_volume src dst --shape n0 n1 n2
+(run as a module, not as a script: it uses relative imports).
+"""
+
+import json
+import lzma
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .out_of_core_volume import OutOfCoreVolume
+from .slice_cache import SliceCache
+
+
+_MAGIC = b'SCCHUNK1'
+
+try:
+  import lz4.frame as _lz4
+except ImportError:
+  _lz4 = None
+
+
+def _compress(data, codec, level):
+  if codec == 'zlib':
+    return zlib.compress(data, 1 if level is None else level)
+  elif codec == 'lzma':
+    return lzma.compress(data, preset=0 if level is None else level)
+  elif codec == 'lz4':
+    return _lz4.compress(data, compression_level=level or 0)
+  elif codec == 'none':
+    return bytes(data)
+
+
+def _decompress(data, codec):
+  if codec == 'zlib':
+    return zlib.decompress(data)
+  elif codec == 'lzma':
+    return lzma.decompress(data)
+  elif codec == 'lz4':
+    return _lz4.decompress(data)
+  elif codec == 'none':
+    return data
+
+
+def _check_codec(codec):
+  if codec not in ('zlib', 'lzma', 'lz4', 'none'):
+    raise ValueError("codec must be 'zlib', 'lzma', 'lz4' or 'none', " +
+                     "got {}.".format(codec))
+  if codec == 'lz4' and _lz4 is None:
+    raise ImportError("Module lz4 missing, required by codec='lz4'.")
+
+
+def _chunk_grid(shape, chunk_size):
+  return tuple((n + chunk_size - 1) // chunk_size for n in shape)
+
+
+class ChunkedVolume(OutOfCoreVolume):
+  """ A read-only 3D volume stored in the chunked format, which can be
+  passed to volume_slices directly. Thread-safe: the chunks are
+  decompressed in parallel (zlib, lzma and lz4 release the GIL).
+
+  Parameters:
+  filename: str, the chunked volume file, see 'convert_to_chunked' to
+    create one from a raw binary file or any volume.
+  cache: bool or SliceCache, the LRU cache of the decompressed chunks. True
+    creates a cache of cache_bytes for this volume (and its views), False
+    decompresses the chunks at every read.
+  cache_bytes: int, budget of the cache created by cache=True.
+  n_workers: int, threads decompressing the chunks of one read. 1 reads
+    them one after another.
+  """
+  def __init__(self, filename, cache=True, cache_bytes=512*1024**2,
+               n_workers=4):
+    with open(filename, 'rb') as f:
+      magic = f.read(len(_MAGIC))
+      if magic != _MAGIC:
+        raise ValueError('{} is not a chunked volume file.'.format(filename))
+      header_len = struct.unpack('<I', f.read(4))[0]
+      header = json.loads(f.read(header_len).decode('utf-8'))
+      f.seek(-8, 2)
+      table_offset = struct.unpack('<Q', f.read(8))[0]
+
+    OutOfCoreVolume.__init__(self, header['shape'], header['dtype'])
+    self.filename = filename
+    self.chunk_size = header['chunk_size']
+    self.codec = header['codec']
+    self.shuffle = header['shuffle']
+    _check_codec(self.codec)
+    self._grid = _chunk_grid(header['shape'], self.chunk_size)
+    self._table_offset = table_offset
+
+    if cache is True:
+      cache = SliceCache(max_bytes=cache_bytes)
+    elif cache is False:
+      cache = None
+    elif not isinstance(cache, SliceCache):
+      raise ValueError('Wrong type of cache={}'.format(cache))
+    self.cache = cache
+    self.n_workers = n_workers
+    self._open()
+
+  def _open(self):
+    self._file = np.memmap(self.filename, dtype=np.uint8, mode='r')
+    n_chunks = int(np.prod(self._grid))
+    self._table = np.frombuffer(self._file, dtype='<u8',
+      count=2 * n_chunks, offset=self._table_offset).reshape(
+      self._grid + (2,))
+    self._executor = None # created at the first parallel read
+    self._executor_lock = threading.Lock()
+    # Token of the file in the cache keys, the views share the memmap.
+    self._token = self.cache.token(self._file) if self.cache is not None \
+                  else None
+
+  def __getstate__(self):
+    # Do not pickle the memmap, the threads and the cache, reopen them.
+    state = self.__dict__.copy()
+    for name in ('_file', '_table', '_executor', '_executor_lock', '_token'):
+      del state[name]
+    if self.cache is not None:
+      state['cache'] = self.cache.max_bytes
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    if self.cache is not None:
+      self.cache = SliceCache(max_bytes=self.cache)
+    self._open()
+
+  def chunk(self, index):
+    """ The decompressed chunk at index (3 ints, position in the chunk
+    grid), a read-only chunk_size^3 array.
+    """
+    if self.cache is None:
+      return self._load_chunk(index)
+    key = (self._token, None, 'chunk') + tuple(index)
+    # The chunk is a view of its own decompressed buffer, no need to copy it.
+    return self.cache.fetch(key, lambda: self._load_chunk(index),
+                            copy_views=False)
+
+  def _load_chunk(self, index):
+    offset, nbytes = (int(n) for n in self._table[tuple(index)])
+    data = _decompress(self._file[offset:offset + nbytes], self.codec)
+    c = self.chunk_size
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if self.shuffle:
+      raw = raw.reshape(self.dtype.itemsize, -1).T.copy()
+    return raw.view(self.dtype).reshape(c, c, c)
+
+  def _read_box(self, lo, hi):
+    c = self.chunk_size
+    out = np.empty([h - l for l, h in zip(lo, hi)], dtype=self.dtype)
+    ranges = [range(l // c, (h - 1) // c + 1) for l, h in zip(lo, hi)]
+    indexes = [(ci, cj, ck) for ci in ranges[0] for cj in ranges[1]
+               for ck in ranges[2]]
+
+    # Copy the intersection of the box with every chunk it touches; each
+    # chunk fills its own part of out, so they can run in parallel.
+    def copy_chunk(index):
+      src, dst = [], []
+      for l, h, ci in zip(lo, hi, index):
+        i0, i1 = max(l, ci*c), min(h, (ci+1)*c)
+        src.append(slice(i0 - ci*c, i1 - ci*c))
+        dst.append(slice(i0 - l, i1 - l))
+      out[tuple(dst)] = self.chunk(index)[tuple(src)]
+
+    if self.n_workers > 1 and len(indexes) > 1:
+      # Reads may come from several threads (e.g. a SlicePrefetcher), create
+      # only one pool.
+      with self._executor_lock:
+        if self._executor is None:
+          self._executor = ThreadPoolExecutor(max_workers=self.n_workers,
+                                              thread_name_prefix='chunks')
+      list(self._executor.map(copy_chunk, indexes))
+    else:
+      for index in indexes:
+        copy_chunk(index)
+    return out
+
+
+class ChunkedVolumeWriter(object):
+  """ Create a chunked volume file and fill it block by block, so that
+  volumes larger than the memory can be converted. The chunks of a block
+  are compressed in parallel.
+
+  Parameters:
+  filename: str, the chunked volume file to create (overwritten).
+  shape: tuple of 3 ints, the shape of the volume.
+  dtype: the sample type, stored in native byte order by default.
+  chunk_size: int, the edge length of the cubic chunks.
+  codec: 'zlib', 'lzma', 'lz4' or 'none'.
+  level: int or None, the compression level (default: the fastest).
+  shuffle: bool, byte-shuffle the chunks before compressing them.
+  n_workers: int, threads compressing the chunks.
+  """
+  def __init__(self, filename, shape, dtype=np.float32, chunk_size=64,
+               codec='zlib', level=None, shuffle=True, n_workers=4):
+    _check_codec(codec)
+    self.filename = filename
+    self.shape = tuple(int(n) for n in shape)
+    self.dtype = np.dtype(dtype)
+    self.chunk_size = int(chunk_size)
+    self.codec = codec
+    self.level = level
+    self.shuffle = shuffle
+    self.n_workers = n_workers
+
+    header = {'shape': self.shape, 'dtype': self.dtype.str,
+              'chunk_size': self.chunk_size, 'codec': codec,
+              'shuffle': bool(shuffle)}
+    header_bytes = json.dumps(header).encode('utf-8')
+    self._f = open(filename, 'wb')
+    self._f.write(_MAGIC)
+    self._f.write(struct.pack('<I', len(header_bytes)))
+    self._f.write(header_bytes)
+    self._grid = _chunk_grid(self.shape, self.chunk_size)
+    self._table = np.zeros(self._grid + (2,), dtype='<u8')
+    self._executor = ThreadPoolExecutor(max_workers=n_workers)
+
+  def _encode(self, chunk):
+    if self.shuffle:
+      chunk = chunk.reshape(-1).view(np.uint8).reshape(
+        -1, self.dtype.itemsize).T
+    return _compress(np.ascontiguousarray(chunk), self.codec, self.level)
+
+  def write_block(self, lo, block):
+    """ Write block (an array) to the box starting at lo. lo must be aligned
+    to the chunks, and block must cover whole chunks except at the far edges
+    of the volume.
+    """
+    c = self.chunk_size
+    assert all(l % c == 0 for l in lo), 'lo must be aligned to the chunks.'
+    hi = [l + n for l, n in zip(lo, block.shape)]
+    assert all(h == s or h % c == 0 for h, s in zip(hi, self.shape)), \
+      'block must cover whole chunks.'
+    block = np.asarray(block)
+    indexes, chunks = [], []
+    for ci in range(lo[0] // c, (hi[0] + c - 1) // c):
+      di = ci*c - lo[0]
+      for cj in range(lo[1] // c, (hi[1] + c - 1) // c):
+        dj = cj*c - lo[1]
+        for ck in range(lo[2] // c, (hi[2] + c - 1) // c):
+          dk = ck*c - lo[2]
+          part = block[di:di+c, dj:dj+c, dk:dk+c]
+          chunk = np.zeros((c, c, c), dtype=self.dtype)
+          chunk[:part.shape[0], :part.shape[1], :part.shape[2]] = part
+          indexes.append((ci, cj, ck))
+          chunks.append(chunk)
+    for index, data in zip(indexes, self._executor.map(self._encode, chunks)):
+      self._table[index] = (self._f.tell(), len(data))
+      self._f.write(data)
+
+  def close(self):
+    table_offset = self._f.tell()
+    self._f.write(self._table.tobytes())
+    self._f.write(struct.pack('<Q', table_offset))
+    self._f.close()
+    self._executor.shutdown()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def convert_to_chunked(src, dst, shape=None, dtype='>f4',
+                       out_dtype=np.float32, chunk_size=64, codec='zlib',
+                       level=None, shuffle=True, n_workers=4):
+  """ Convert a volume into the chunked format out-of-core. The source is
+  read one column of chunks at a time, so the memory usage is bounded by
+  chunk_size^2 * shape[2] samples.
+
+  Parameters:
+  src: str or array-like, a raw binary file (then shape and dtype describe
+    its content, e.g. dtype='>f4' for SEG-Y derived data) or any 3D
+    array-like volume (e.g. np.memmap, SegyVolume).
+  dst: str, the chunked volume file to create.
+  out_dtype: the sample type of the chunked volume, native float32 by
+    default so that no byte swapping is needed when reading.
+  Other parameters: see ChunkedVolumeWriter.
+
+  Returns the ChunkedVolume opened from dst.
+  """
+  if isinstance(src, str):
+    assert shape is not None, 'shape must be specified for a raw file.'
+    src = np.memmap(src, dtype=dtype, mode='r', shape=tuple(shape))
+  c = chunk_size
+  n0, n1, _ = src.shape
+  with ChunkedVolumeWriter(dst, src.shape, dtype=out_dtype, chunk_size=c,
+                           codec=codec, level=level, shuffle=shuffle,
+                           n_workers=n_workers) as writer:
+    for i0 in range(0, n0, c):
+      for j0 in range(0, n1, c):
+        block = np.asarray(src[i0:i0+c, j0:j0+c, :], dtype=out_dtype)
+        writer.write_block((i0, j0, 0), block)
+  return ChunkedVolume(dst)
+
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(
+    prog='python -m seismic_canvas.chunked_volume',
+    description='Convert a raw binary volume into the chunked format.')
+  parser.add_argument('src', help='raw binary volume file, e.g. seismic.dat')
+  parser.add_argument('dst', help='chunked volume file to create')
+  parser.add_argument('--shape', type=int, nargs=3, required=True)
+  parser.add_argument('--dtype', default='>f4',
+                      help="sample type of src (default: '>f4')")
+  parser.add_argument('--chunk-size', type=int, default=64)
+  parser.add_argument('--codec', default='zlib',
+                      choices=['zlib', 'lzma', 'lz4', 'none'])
+  parser.add_argument('--level', type=int, default=None)
+  parser.add_argument('--workers', type=int, default=4)
+  args = parser.parse_args()
+  convert_to_chunked(args.src, args.dst, shape=args.shape, dtype=args.dtype,
+                     chunk_size=args.chunk_size, codec=args.codec,
+                     level=args.level, n_workers=args.workers)
@@ -5,32 +5,52 @@
 # Distributed under the MIT License. See LICENSE for more info.
 # ------------------------------------------------------------------------------
 
-import io
+import hashlib
+import json
+import os
 import numpy as np
 import matplotlib as mpl
-import matplotlib.pyplot as plt
-plt.style.use('seaborn-notebook')
-from matplotlib.colors import LinearSegmentedColormap
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+from matplotlib import style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import LinearSegmentedColormap, Normalize
+from matplotlib.figure import Figure
 from vispy import scene
 from vispy.color import get_colormap
 from vispy.util.dpi import get_dpi
 from vispy.visuals.transforms import MatrixTransform
 
 
+# The Matplotlib style of the colorbars (renamed in Matplotlib 3.6).
+STYLE = 'seaborn-v0_8-notebook' \
+  if 'seaborn-v0_8-notebook' in style.available else 'seaborn-notebook'
+
+# The rendered colorbars are cached in memory, and optionally on disk in this
+# directory so that they are also reused after a restart (see disk_cache).
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                         os.path.join(os.path.expanduser('~'), '.cache'),
+                         'seismic_canvas', 'colorbars')
+_memory_cache = {} # key -> RGBA uint8 array
+
+
 class Colorbar(scene.visuals.Image):
   """ A colorbar visual fixed to the right side of the canvas. This is
   based on the rendering from Matplotlib, then display this rendered
   image as a scene.visuals.Image visual node on the canvas.
 
   Parameters:
-
+  cache: bool, reuse the colorbars already rendered with the same cmap,
+    clim, size, label and style in this session.
+  disk_cache: bool or str, also keep the rendered colorbars on disk, to
+    reuse them after a restart. True uses CACHE_DIR
+    ($XDG_CACHE_HOME/seismic_canvas/colorbars, ~/.cache by default), a str
+    is the directory to use. Write errors are ignored.
   """
   def __init__(self, size=(500, 10), cmap='grays', clim=None,
                label_str="Colorbar", label_color='black',
                label_size=12, tick_size=10,
                border_width=1.0, border_color='black',
-               visible=True, parent=None):
+               visible=True, parent=None, cache=True, disk_cache=False):
 
     assert clim is not None, 'clim must be specified explicitly.'
 
@@ -56,7 +76,7 @@ class Colorbar(scene.visuals.Image):
     self.border_color = border_color
 
     # Draw colorbar using Matplotlib.
-    self.set_data(self._draw_colorbar())
+    self.set_data(self._get_colorbar(cache, disk_cache))
 
     # Give a Matrix transform to self in order to move around canvas.
     self.transform = MatrixTransform()
@@ -82,15 +102,49 @@ class Colorbar(scene.visuals.Image):
     # Update the canvas size.
     self.canvas_size = event.size
 
+  def _get_colorbar(self, cache=True, disk_cache=False):
+    """ Get the colorbar image (float RGBA), from the cache if it was already
+    rendered with the same parameters.
+    """
+    if not cache:
+      return self._draw_colorbar() / np.float32(255)
+    key = self._cache_key()
+    image = _memory_cache.get(key)
+    if image is None and disk_cache:
+      directory = CACHE_DIR if disk_cache is True else disk_cache
+      filename = os.path.join(directory, key + '.npy')
+      try:
+        image = np.load(filename)
+      except (OSError, ValueError):
+        image = self._draw_colorbar()
+        try:
+          os.makedirs(directory, exist_ok=True)
+          np.save(filename, image)
+        except OSError:
+          pass # e.g. read-only cache directory, just do not persist
+    elif image is None:
+      image = self._draw_colorbar()
+    _memory_cache[key] = image
+    return image / np.float32(255)
+
+  def _cache_key(self):
+    """ A hash of everything that changes the rendered colorbar.
+    """
+    params = [self.bar_size, self.clim, self.label_str, self.label_color,
+              self.label_size, self.tick_size, self.border_width,
+              self.border_color, get_dpi(), STYLE, mpl.__version__]
+    h = hashlib.sha1(json.dumps([str(p) for p in params]).encode('utf-8'))
+    h.update(np.ascontiguousarray(self.cmap.colors.rgba).tobytes())
+    return h.hexdigest()
+
   def _draw_colorbar(self):
-    """ Draw a Matplotlib colorbar, save this figure without any boundary to a
-    rendering buffer, and return this buffer as a numpy array.
+    """ Draw a Matplotlib colorbar with the Agg renderer, and return the
+    rendering buffer, cropped to the colorbar without any boundary, as a
+    (height, width, 4) uint8 numpy array.
     """
     dpi = get_dpi()
-    # Compute the Matplotlib figsize: note the order of width, height.
-    # The width is doubled because we will only keep the colorbar portion
-    # before we export this image to buffer!
-    figsize = (self.bar_size[1]/dpi * 2, self.bar_size[0]/dpi)
+    # The colorbar size in inches: note the order of width, height.
+    bar_w, bar_h = self.bar_size[1]/dpi, self.bar_size[0]/dpi
 
     # Convert cmap and clim to Matplotlib format.
     rgba = self.cmap.colors.rgba
@@ -102,32 +156,60 @@ class Colorbar(scene.visuals.Image):
     if len(rgba) < 2: # in special case of 'grays' cmap!
       rgba = np.array([[0,0,0, 1.], [1,1,1, 1.]])
     cmap = LinearSegmentedColormap.from_list('vispy_cmap', rgba)
-    norm = mpl.colors.Normalize(vmin=self.clim[0], vmax=self.clim[1])
-    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
-
-    # Put the colorbar at proper location on the Matplotlib fig.
-    fig = plt.figure(figsize=figsize, dpi=dpi)
-    ax = plt.Axes(fig, [0, 0, 1, 1])
-    ax.set_axis_off()
-    fig.add_axes(ax)
-    divider = make_axes_locatable(ax)
-    cax = divider.append_axes('right', size='100%', pad=0.)
-    cb = fig.colorbar(sm, cax=cax)
-    ax.remove()
-
-    # Apply styling to the colorbar.
-    cb.set_label(self.label_str,
-      color=self.label_color, fontsize=self.label_size)
-    plt.setp(plt.getp(cb.ax.axes, 'yticklabels'),
-      color=self.label_color, fontsize=self.tick_size)
-    cb.ax.yaxis.set_tick_params(color=self.label_color)
-    cb.outline.set_linewidth(self.border_width)
-    cb.outline.set_edgecolor(self.border_color)
-
-    # Export the rendering to a numpy array in the buffer.
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png',
-      bbox_inches='tight', pad_inches=0, dpi=dpi, transparent=True)
-    buf.seek(0)
-
-    return plt.imread(buf)
+    norm = Normalize(vmin=self.clim[0], vmax=self.clim[1])
+    sm = ScalarMappable(cmap=cmap, norm=norm)
+
+    # The ticks and label are drawn outside of the colorbar axes, leave a
+    # margin (in inches) around it for them, enlarged if it is not enough.
+    margin = 1.
+    while True:
+      image, bbox = self._render_agg(sm, dpi, bar_w, bar_h, margin)
+      fig_w, fig_h = bar_w + 2 * margin, bar_h + 2 * margin
+      overflow = max(-bbox.x0, -bbox.y0, bbox.x1 - fig_w, bbox.y1 - fig_h)
+      if overflow <= 0:
+        break
+      margin += overflow + 0.5
+
+    # Crop to the tight bounding box of the drawn artists, the same as
+    # savefig(bbox_inches='tight', pad_inches=0).
+    # Include every pixel the bbox touches (rows from the top), and the
+    # outline, drawn half outside of the axes and of the bbox.
+    height = image.shape[0]
+    x0, x1 = np.floor(bbox.x0 * dpi), np.ceil(bbox.x1 * dpi)
+    y0, y1 = np.floor(height - bbox.y1 * dpi), np.ceil(height - bbox.y0 * dpi)
+    drawn = image[..., 3] > 0
+    rows, cols = np.nonzero(drawn.any(axis=1))[0], \
+                 np.nonzero(drawn.any(axis=0))[0]
+    if len(rows):
+      y0, y1 = min(y0, rows[0]), max(y1, rows[-1] + 1)
+      x0, x1 = min(x0, cols[0]), max(x1, cols[-1] + 1)
+    x0, y0 = max(int(x0), 0), max(int(y0), 0)
+    return image[y0:int(y1), x0:int(x1)].copy()
+
+  def _render_agg(self, sm, dpi, bar_w, bar_h, margin):
+    """ Render the colorbar of sm (bar_w x bar_h inches) in the middle of a
+    transparent figure with the given margin (inches). Returns the RGBA
+    buffer of the Agg canvas and the tight bounding box (inches).
+    """
+    with style.context(STYLE):
+      # A bare Figure, not managed by pyplot, so nothing needs to be closed.
+      fig_w, fig_h = bar_w + 2 * margin, bar_h + 2 * margin
+      fig = Figure(figsize=(fig_w, fig_h), dpi=dpi)
+      fig.patch.set_alpha(0) # transparent background
+      agg = FigureCanvasAgg(fig)
+      cax = fig.add_axes([margin / fig_w, margin / fig_h,
+                          bar_w / fig_w, bar_h / fig_h])
+      cb = fig.colorbar(sm, cax=cax)
+
+      # Apply styling to the colorbar.
+      cb.set_label(self.label_str,
+        color=self.label_color, fontsize=self.label_size)
+      cb.ax.tick_params(labelcolor=self.label_color,
+                        labelsize=self.tick_size, color=self.label_color)
+      cb.outline.set_linewidth(self.border_width)
+      cb.outline.set_edgecolor(self.border_color)
+
+      # Render, and take the pixels straight from the Agg buffer.
+      agg.draw()
+      image = np.asarray(agg.buffer_rgba())
+      return image, fig.get_tightbbox(agg.get_renderer())
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Read in fault skin files from the research: 'Optimal Surface Voting':
+https://github.com/xinwucwp/osv, and merge them into one triangle mesh.
+"""
+
+import fnmatch
+import json
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+class FaultCell(object):
+  """ A class that contains fault attribute on each fault pixel,
+  including pos (x,y,z), likelihood, strike and dip angle,
+  slip vector(sx,sy,sz).
+  Each object also can include its neighboring cell, (above, below,
+  left, right).
+  """
+  def __init__(self, index, pos=(0,0,0), likelihood=0.,
+               strike=0., dip=0., slip=(0.,0.,0.)):
+    self.pos = pos
+    self.likelihood = likelihood
+    self.strike = strike
+    self.dip = dip
+    self.slip = slip
+
+    # The index in the cell list of a skin.
+    self.index = index
+
+    # The neighboring cells.
+    self.above = None
+    self.below = None
+    self.left = None
+    self.right = None
+
+  def smooth_strike(self):
+    """ Smooth the strike angle value using neighboring cells.
+    """
+    L = self.left; R = self.right
+    L_strike = 0.; R_strike = 0.
+    scs = 0. # not sure what it means ...
+    if L is not None:
+      dy = self.pos[1] - L.pos[1]
+      dx = self.pos[0] - L.pos[0]
+      ds = np.sqrt(dy**2 + dx**2)
+      L_strike = np.degrees(np.arccos(dx / ds))
+      scs += 1
+    if R is not None:
+      dy = -self.pos[1] + R.pos[1]
+      dx = -self.pos[0] + R.pos[0]
+      ds = np.sqrt(dy**2 + dx**2)
+      R_strike = np.degrees(np.arccos(dx / ds))
+      scs += 1
+    if scs > 0:
+      self.strike = (L_strike + R_strike) / scs
+
+
+class FaultCellView(object):
+  """ A read-only FaultCell-like view of one cell of a FaultSkin, created on
+  demand by FaultSkin.cells. The attributes are read from the arrays of the
+  skin, and the neighboring cells are views as well.
+  """
+  def __init__(self, skin, index):
+    self.skin = skin
+    self.index = index
+
+  @property
+  def pos(self):
+    return tuple(float(v) for v in self.skin.pos[self.index])
+
+  @property
+  def likelihood(self):
+    return float(self.skin.likelihood[self.index])
+
+  @property
+  def strike(self):
+    return float(self.skin.strike[self.index])
+
+  @property
+  def dip(self):
+    return float(self.skin.dip[self.index])
+
+  @property
+  def slip(self):
+    return tuple(float(v) for v in self.skin.slip[self.index])
+
+  @property
+  def above(self):
+    return self._neighbor(0)
+
+  @property
+  def below(self):
+    return self._neighbor(1)
+
+  @property
+  def left(self):
+    return self._neighbor(2)
+
+  @property
+  def right(self):
+    return self._neighbor(3)
+
+  def _neighbor(self, k):
+    j = self.skin.neighbors[self.index, k]
+    return FaultCellView(self.skin, int(j)) if j >= 0 else None
+
+  def __eq__(self, other):
+    return isinstance(other, FaultCellView) and other.skin is self.skin \
+      and other.index == self.index
+
+  def __hash__(self):
+    return hash((id(self.skin), self.index))
+
+
+class _FaultCellList(Sequence):
+  """ The lazy list of FaultCellView of a FaultSkin.
+  """
+  def __init__(self, skin):
+    self.skin = skin
+
+  def __len__(self):
+    return self.skin.n_cells
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0: i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('cell index out of range')
+    return FaultCellView(self.skin, i)
+
+
+class FaultSkin(object):
+  """ A class that corresponding to the data structure from each skin
+  file. The cell attributes are stored column-wise in NumPy arrays (one row
+  per cell), read directly from the big-endian file content:
+    pos: (n_cells, 3) float32, cell positions (x, y, z).
+    likelihood, dip: (n_cells,) float32.
+    strike: (n_cells,) float64, strike angles smoothed along the skin.
+    slip: (n_cells, 3) float32, slip vectors (sx, sy, sz).
+    neighbors: (n_cells, 4) int32, indexes of the neighboring cells (above,
+      below, left, right), -1 for no neighbor.
+  The 'cells' attribute is a lazy list of FaultCell-like views, kept for
+  compatibility. The get_vertices_and_faces() method will try to organize
+  the cells within this FaultSkin object and returns an array of vertices
+  and an array of face indexes, which can be used to build a triangle mesh.
+  """
+  def __init__(self, filename):
+    self.filename = filename
+    with open(filename, 'rb') as f:
+      buffer = f.read()
+
+    num_cells = int(np.frombuffer(buffer, dtype='>i4', count=1)[0])
+    self.n_cells = num_cells
+
+    # 9 floats per cell: pos (zyx), likelihood, strike, dip, slip (zyx).
+    params = np.frombuffer(buffer, dtype='>f4', count=9*num_cells,
+                           offset=4).reshape(num_cells, 9)
+    # 4 neighbor indexes per cell: above, below, left, right.
+    neighbors = np.frombuffer(buffer, dtype='>i4', count=4*num_cells,
+                              offset=4 + 36*num_cells).reshape(num_cells, 4)
+
+    # Convert to native byte order, and reverse the zyx order to xyz.
+    self.pos = params[:, 2::-1].astype(np.float32)
+    self.likelihood = params[:, 3].astype(np.float32)
+    self.strike = params[:, 4].astype(np.float64)
+    self.dip = params[:, 5].astype(np.float32)
+    self.slip = params[:, 8:5:-1].astype(np.float32)
+    self.neighbors = neighbors.astype(np.int32)
+
+    # Smooth the strike angle on the skin.
+    self._smooth_strikes()
+
+  @property
+  def cells(self):
+    return _FaultCellList(self)
+
+  def _smooth_strikes(self):
+    """ Smooth the strike angle values using neighboring cells, see
+    FaultCell.smooth_strike. Vectorized over all cells at once.
+    """
+    pos = self.pos.astype(np.float64)
+    left = self.neighbors[:, 2]
+    right = self.neighbors[:, 3]
+    has_L = left >= 0
+    has_R = right >= 0
+    # Strike of the segment from the left neighbor, and to the right one.
+    with np.errstate(invalid='ignore', divide='ignore'):
+      L_strike = _segment_strike(pos[left[has_L]], pos[has_L])
+      R_strike = _segment_strike(pos[has_R], pos[right[has_R]])
+    strike_sum = np.zeros(self.n_cells)
+    strike_sum[has_L] = L_strike
+    strike_sum[has_R] += R_strike
+    scs = has_L.astype(np.float64) + has_R
+    smoothed = scs > 0
+    self.strike[smoothed] = strike_sum[smoothed] / scs[smoothed]
+
+  def get_vertices_and_faces(self):
+    """ Get an array of vertices corresponding to an indexed triangle mesh.
+    """
+    # Directly copy the cell position to vertices.
+    vertices = self.pos.astype(np.float64)
+    faces = _triangulate(np.arange(self.n_cells),
+                         self.neighbors[:, 3], self.neighbors[:, 1])
+    return vertices, faces
+
+  def get_lod_faces(self, n_levels):
+    """ Get the faces of the mesh at n_levels levels of detail, decimated
+    along the cell grid of the skin: level k only keeps every 2**k-th cell
+    along the rows and columns of the grid, and triangulates them with the
+    neighbors 2**k cells away. The faces index the same vertices as
+    get_vertices_and_faces(), and level 0 gives the same faces.
+
+    Returns a list of n_levels (m_k, 3) face arrays.
+    """
+    rows, cols = _grid_coordinates(self.neighbors)
+    right = self.neighbors[:, 3]
+    below = self.neighbors[:, 1]
+    lod_faces = []
+    for k in range(n_levels):
+      if k > 0: # neighbors twice as far away
+        right = _compose(right, right)
+        below = _compose(below, below)
+      step = 2 ** k
+      cells = np.flatnonzero((rows % step == 0) & (cols % step == 0))
+      lod_faces.append(_triangulate(cells, right, below))
+    return lod_faces
+
+
+def _triangulate(cells, right, below):
+  """ Each cell with its right, below and below-right neighbors forms a pair
+  of triangles. right and below are the neighbor indexes of all the cells
+  (-1 for no neighbor), only the given cells are triangulated.
+  """
+  R = right[cells]
+  RB = _compose(R, below)
+  B = below[cells]
+  BR = _compose(B, right)
+
+  # First triangle: 0 - 2
+  #                   \ |
+  #                     1, facing outwards.
+  # Second triangle: 0
+  #                  | \
+  #                  1 - 2, also facing outwards.
+  triangles = np.stack([np.stack([cells, RB, R], axis=-1),
+                        np.stack([cells, B, BR], axis=-1)], axis=1)
+  valid = np.stack([(R >= 0) & (RB >= 0), (B >= 0) & (BR >= 0)], axis=1)
+  # Boolean indexing keeps the cell order, with the two triangles of a cell
+  # next to each other.
+  return triangles[valid].astype(int)
+
+
+def _compose(index, neighbor):
+  """ The neighbor of the cells in index (-1 stays -1).
+  """
+  return np.where(index >= 0, neighbor[index], -1)
+
+
+def _grid_coordinates(neighbors):
+  """ Integer (row, col) coordinates of the cells on the skin grid. They are
+  propagated breadth-first through the neighbor links (above/below move by
+  one row, left/right by one column) from the first cell of each connected
+  patch, which is at (0, 0).
+  """
+  n = len(neighbors)
+  rows = np.zeros(n, dtype=np.int64)
+  cols = np.zeros(n, dtype=np.int64)
+  visited = np.zeros(n, dtype=bool)
+  steps = ((0, -1, 0), (1, 1, 0), (2, 0, -1), (3, 0, 1)) # (link, drow, dcol)
+  seed = 0
+  while seed < n:
+    visited[seed] = True
+    frontier = np.array([seed])
+    while frontier.size:
+      reached = []
+      for link, drow, dcol in steps:
+        src = frontier
+        dst = neighbors[src, link]
+        keep = dst >= 0
+        src, dst = src[keep], dst[keep]
+        keep = ~visited[dst]
+        src, dst = src[keep], dst[keep]
+        dst, first = np.unique(dst, return_index=True)
+        src = src[first]
+        rows[dst] = rows[src] + drow
+        cols[dst] = cols[src] + dcol
+        visited[dst] = True
+        reached.append(dst)
+      frontier = np.concatenate(reached)
+    # Next patch.
+    unvisited = np.flatnonzero(~visited[seed:])
+    seed = seed + unvisited[0] if unvisited.size else n
+  return rows, cols
+
+
+def _segment_strike(p0, p1):
+  """ Strike angles (in degrees) of the segments from points p0 to p1.
+  """
+  dy = p1[:, 1] - p0[:, 1]
+  dx = p1[:, 0] - p0[:, 0]
+  ds = np.sqrt(dy**2 + dx**2)
+  return np.degrees(np.arccos(dx / ds))
+
+
+def load_fault_skins(directory, pattern='skin*.dat', attribute='strike',
+                     n_levels=1, n_workers=None, cache=True):
+  """ Load all the skin files of a directory and merge them into one
+  indexed triangle mesh. The files are read and triangulated in parallel by
+  a process pool, and copied into preallocated buffers (the face indexes of
+  each skin are offset by the number of vertices before it).
+
+  The merged mesh is cached as .npy files in the subdirectory
+  'merged_skins' of directory, and reused (memory-mapped, read-only) as
+  long as the skin files are unchanged (same names, sizes and mtimes).
+
+  Parameters:
+  directory: str, the directory of the skin files.
+  pattern: str, glob pattern of the skin file names.
+  attribute: str, the cell attribute used as vertex values: 'strike',
+    'dip' or 'likelihood'.
+  n_levels: int, number of levels of detail of the faces, see
+    FaultSkin.get_lod_faces and LODMesh.
+  n_workers: int, number of worker processes (default: number of CPUs).
+  cache: bool, read/write the merged mesh cache.
+
+  Returns (vertices, faces, values): vertices is a (n, 3) float32 array of
+  (x, y, z) positions, faces a (m, 3) int32 array of vertex indexes, and
+  values a (n,) float32 array of the attribute. If n_levels > 1, faces is
+  a list of the face arrays of each level (level 0 first).
+  """
+  assert attribute in ('strike', 'dip', 'likelihood'), \
+    'Wrong attribute: {}'.format(attribute)
+  filenames = sorted(os.path.join(directory, name)
+                     for name in fnmatch.filter(os.listdir(directory), pattern))
+  cache_dir = os.path.join(directory, 'merged_skins')
+  manifest = {'files': [_file_signature(f) for f in filenames],
+              'attribute': attribute, 'n_levels': n_levels}
+  names = _cache_names(n_levels)
+  if cache:
+    arrays = _read_mesh_cache(cache_dir, manifest, names)
+    if arrays is not None:
+      return _unpack_mesh(arrays, n_levels)
+
+  # The vertex count of each skin is in its header, which gives the size of
+  # the buffers. Each cell gives at most two triangles. The coarse levels are
+  # much smaller, they are collected and concatenated once.
+  n_cells = [_read_num_cells(f) for f in filenames]
+  vertex_offsets = np.concatenate([[0], np.cumsum(n_cells)]).astype(int)
+  n_vertices = vertex_offsets[-1]
+  vertices = np.empty((n_vertices, 3), dtype=np.float32)
+  faces = np.empty((2 * n_vertices, 3), dtype=np.int32)
+  values = np.empty(n_vertices, dtype=np.float32)
+  lod_faces = [[] for _ in range(1, n_levels)]
+
+  n_faces = 0
+  n_workers = n_workers or os.cpu_count() or 1
+  if n_workers > 1 and len(filenames) > 1:
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+    results = executor.map(_read_skin_mesh, filenames,
+                           [attribute] * len(filenames),
+                           [n_levels] * len(filenames), chunksize=4)
+  else:
+    executor = None
+    results = (_read_skin_mesh(f, attribute, n_levels) for f in filenames)
+  try:
+    for k, (skin_verts, skin_faces, skin_values) in enumerate(results):
+      v0, v1 = vertex_offsets[k], vertex_offsets[k+1]
+      vertices[v0:v1] = skin_verts
+      values[v0:v1] = skin_values
+      faces[n_faces:n_faces+len(skin_faces[0])] = skin_faces[0] + v0
+      n_faces += len(skin_faces[0])
+      for level_faces, faces_k in zip(lod_faces, skin_faces[1:]):
+        level_faces.append((faces_k + v0).astype(np.int32))
+  finally:
+    if executor is not None:
+      executor.shutdown()
+  arrays = [vertices, faces[:n_faces], values]
+  for level_faces in lod_faces:
+    arrays.append(np.concatenate(level_faces) if level_faces
+                  else np.empty((0, 3), dtype=np.int32))
+
+  if cache:
+    _write_mesh_cache(cache_dir, manifest, names, arrays)
+  return _unpack_mesh(arrays, n_levels)
+
+
+def _read_num_cells(filename):
+  with open(filename, 'rb') as f:
+    return int(np.frombuffer(f.read(4), dtype='>i4')[0])
+
+
+def _read_skin_mesh(filename, attribute, n_levels):
+  """ The task run by the workers of load_fault_skins.
+  """
+  skin = FaultSkin(filename)
+  vertices, faces = skin.get_vertices_and_faces()
+  faces = [faces.reshape(-1, 3)]
+  if n_levels > 1:
+    faces += skin.get_lod_faces(n_levels)[1:]
+  return (vertices.astype(np.float32), faces,
+          getattr(skin, attribute).astype(np.float32))
+
+
+def _cache_names(n_levels):
+  return ['vertices', 'faces', 'values'] + \
+    ['faces_lod{:d}'.format(k) for k in range(1, n_levels)]
+
+
+def _unpack_mesh(arrays, n_levels):
+  vertices, faces, values = arrays[:3]
+  if n_levels > 1:
+    faces = [faces] + list(arrays[3:])
+  return vertices, faces, values
+
+
+def _file_signature(filename):
+  st = os.stat(filename)
+  return [os.path.basename(filename), st.st_size, st.st_mtime]
+
+
+def _read_mesh_cache(cache_dir, manifest, names):
+  try:
+    with open(os.path.join(cache_dir, 'manifest.json'), 'r') as f:
+      if json.load(f) != manifest:
+        return None # the skin files changed
+    return tuple(np.load(os.path.join(cache_dir, name + '.npy'),
+                         mmap_mode='r') for name in names)
+  except (OSError, ValueError):
+    return None
+
+
+def _write_mesh_cache(cache_dir, manifest, names, arrays):
+  try:
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write the manifest last, so that an interrupted write is not valid.
+    manifest_file = os.path.join(cache_dir, 'manifest.json')
+    if os.path.exists(manifest_file):
+      os.remove(manifest_file)
+    for name, array in zip(names, arrays):
+      np.save(os.path.join(cache_dir, name + '.npy'), array)
+    with open(manifest_file, 'w') as f:
+      json.dump(manifest, f, indent=2)
+  except OSError:
+    pass # e.g. read-only data directory, just do not cache
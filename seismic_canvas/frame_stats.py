@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Opt-in timing of the stages of every frame, to find out where the time
+goes when the interaction is slow. See SeismicCanvas(frame_stats=True).
+"""
+
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# The recorded stages, in the order of the columns.
+STAGES = (
+  'pick', # finding the visual node under the mouse
+  'drag', # computing the drag target from the mouse position
+  'update', # applying the coalesced slice moves (includes the next four)
+  'fetch', # the image functions (cache lookup, read and preprocessing)
+  'read', # slicing the volume (uncached slices only)
+  'preproc', # the preprocessing functions (uncached slices only)
+  'stage', # transposing/converting/quantizing into the staging buffers
+  'upload', # building the textures (queues the upload commands)
+  'draw', # the whole draw event (includes the OpenGL execution)
+)
+
+# The stats recording in the current thread (see 'activate').
+_local = threading.local()
+
+
+def active_stats():
+  """ The (FrameStats, node) recording the stages of the slice being
+  fetched in the current thread, or None.
+  """
+  return getattr(_local, 'active', None)
+
+
+class FrameStats(object):
+  """ Ring buffers of the stage timings of the last frames, and of the
+  individual slices updated in these frames.
+
+  The stages (see STAGES) recorded between two frames are summed up into
+  the next frame, which is closed by 'end_frame' at the end of the draw.
+
+  Parameters:
+  capacity: int, number of frames kept.
+  slice_capacity: int, number of per-slice records kept (default: 8 per
+    frame).
+  """
+  def __init__(self, capacity=600, slice_capacity=None):
+    self.capacity = capacity
+    self.columns = ('time', 'interval') + STAGES
+    self._column_index = {name: i for i, name in enumerate(self.columns)}
+    self._frames = np.zeros((capacity, len(self.columns)))
+    self._pending = np.zeros(len(self.columns)) # the frame in progress
+    self._slices = deque(maxlen=slice_capacity or 8 * capacity)
+    self.n_frames = 0 # frames recorded in total
+    self._last_end = None
+
+  def add(self, stage, seconds, node=None):
+    """ Add the time of a stage to the current frame, and to the records of
+    node (an AxisAlignedImage) if given.
+    """
+    self._pending[self._column_index[stage]] += seconds
+    if node is not None:
+      self._slices.append((self.n_frames, node.axis, node.pos, stage,
+                           seconds))
+
+  @contextmanager
+  def timer(self, stage, node=None):
+    """ Context manager adding the time spent in its block to stage.
+    """
+    t0 = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add(stage, time.perf_counter() - t0, node)
+
+  @contextmanager
+  def activate(self, node):
+    """ Context manager recording the stages of the slices fetched in its
+    block by the current thread (e.g. in volume_slices) for node.
+    """
+    previous = getattr(_local, 'active', None)
+    _local.active = (self, node)
+    try:
+      yield
+    finally:
+      _local.active = previous
+
+  def end_frame(self, draw_seconds=0.):
+    """ Close the current frame, drawn in draw_seconds.
+    """
+    now = time.perf_counter()
+    row = self._pending
+    row[0] = now
+    row[1] = np.nan if self._last_end is None else now - self._last_end
+    row[self._column_index['draw']] += draw_seconds
+    self._frames[self.n_frames % self.capacity] = row
+    row[:] = 0
+    self.n_frames += 1
+    self._last_end = now
+
+  def reset(self):
+    self._frames[:] = 0
+    self._pending[:] = 0
+    self._slices.clear()
+    self.n_frames = 0
+    self._last_end = None
+
+  def frames(self):
+    """ The recorded frames, oldest first, as {column: (n,) array} in
+    seconds ('time' is the time.perf_counter() at the end of the frame,
+    'interval' the time since the previous frame).
+    """
+    n = min(self.n_frames, self.capacity)
+    order = (np.arange(n) + self.n_frames - n) % self.capacity
+    rows = self._frames[order]
+    return {name: rows[:, i] for i, name in enumerate(self.columns)}
+
+  def slices(self):
+    """ The per-slice records, oldest first, as a list of dicts (frame
+    number, axis and position of the slice, stage and seconds).
+    """
+    keys = ('frame', 'axis', 'pos', 'stage', 'seconds')
+    return [dict(zip(keys, record)) for record in self._slices]
+
+  def summary(self, last=None):
+    """ Statistics of every stage over the last frames (all the recorded
+    ones by default): {stage: {'mean', 'median', 'p95', 'max'}} in
+    milliseconds, and the frame rate 'fps' (from the median interval).
+    """
+    frames = self.frames()
+    if last is not None:
+      frames = {name: values[-last:] for name, values in frames.items()}
+    result = {}
+    for name in ('interval',) + STAGES:
+      values = frames[name] * 1e3
+      values = values[~np.isnan(values)]
+      if len(values) == 0:
+        result[name] = {'mean': 0., 'median': 0., 'p95': 0., 'max': 0.}
+        continue
+      result[name] = {'mean': float(np.mean(values)),
+                      'median': float(np.median(values)),
+                      'p95': float(np.percentile(values, 95)),
+                      'max': float(np.max(values))}
+    median_interval = result['interval']['median']
+    result['fps'] = 1e3 / median_interval if median_interval > 0 else 0.
+    result['n_frames'] = len(frames['time'])
+    return result
+
+  def format_summary(self, last=None):
+    """ The summary as text, one line per stage (mean and max in ms).
+    """
+    summary = self.summary(last)
+    lines = ['{:.1f} fps ({:d} frames)'.format(summary['fps'],
+                                               summary['n_frames'])]
+    for stage in STAGES:
+      lines.append('{:<8}{:7.2f} ms  max {:7.2f}'.format(
+        stage, summary[stage]['mean'], summary[stage]['max']))
+    return '\n'.join(lines)
+
+  def save_json(self, filename):
+    """ Save the summary, frames and per-slice records as JSON.
+    """
+    frames = self.frames()
+    rows = [[None if np.isnan(v) else float(v) for v in row] # valid JSON
+            for row in zip(*[frames[name] for name in self.columns])]
+    data = {'summary': self.summary(), 'columns': list(self.columns),
+            'frames': rows, 'slices': self.slices()}
+    with open(filename, 'w') as f:
+      json.dump(data, f)
+
+  def save_csv(self, filename, slices=False):
+    """ Save the frames (one row per frame, seconds), or the per-slice
+    records if slices is True, as CSV.
+    """
+    with open(filename, 'w', newline='') as f:
+      writer = csv.writer(f)
+      if slices:
+        writer.writerow(('frame', 'axis', 'pos', 'stage', 'seconds'))
+        writer.writerows(self._slices)
+      else:
+        frames = self.frames()
+        writer.writerow(self.columns)
+        for row in zip(*[frames[name] for name in self.columns]):
+          writer.writerow(['{:.9g}'.format(v) for v in row])
+
+  def save(self, prefix):
+    """ Save everything: prefix.json, prefix_frames.csv and
+    prefix_slices.csv. Returns the filenames.
+    """
+    filenames = (prefix + '.json', prefix + '_frames.csv',
+                 prefix + '_slices.csv')
+    self.save_json(filenames[0])
+    self.save_csv(filenames[1])
+    self.save_csv(filenames[2], slices=True)
+    return filenames
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Streaming PNG and TIFF writers: the image is written row by row, so that
+images larger than the memory (e.g. tiled high resolution exports) can be
+saved. Only numpy and zlib are needed. ImageWriter writes images on
+background threads.
+"""
+
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class PNGWriter(object):
+  """ Write an 8-bit RGB or RGBA PNG file row by row.
+
+  Parameters:
+  filename: str, the PNG file to create.
+  width, height: int, the image size.
+  channels: int, 3 (RGB) or 4 (RGBA).
+  compression: int, zlib compression level 0 ~ 9.
+  """
+  _CHUNK_SIZE = 1 << 20 # bytes of compressed data per IDAT chunk
+
+  def __init__(self, filename, width, height, channels=4, compression=6):
+    assert channels in (3, 4), 'channels must be 3 (RGB) or 4 (RGBA).'
+    self.filename = filename
+    self.width = int(width)
+    self.height = int(height)
+    self.channels = channels
+    self.rows_written = 0
+
+    self._file = open(filename, 'wb')
+    self._file.write(b'\x89PNG\r\n\x1a\n')
+    color_type = 6 if channels == 4 else 2
+    self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width,
+                      self.height, 8, color_type, 0, 0, 0))
+    self._compressor = zlib.compressobj(compression)
+    self._pending = [] # compressed data not yet written
+    self._pending_size = 0
+
+  def write_rows(self, rows):
+    """ Write the next rows, a (n, width, channels) uint8 array.
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.uint8)
+    assert rows.shape[1:] == (self.width, self.channels), \
+      'Wrong row shape {}.'.format(rows.shape)
+    assert self.rows_written + len(rows) <= self.height, 'Too many rows.'
+    # Every row starts with its filter type (0: none).
+    filtered = np.zeros((len(rows), 1 + self.width * self.channels),
+                        dtype=np.uint8)
+    filtered[:, 1:] = rows.reshape(len(rows), -1)
+    self._add(self._compressor.compress(filtered.tobytes()))
+    self.rows_written += len(rows)
+
+  def close(self):
+    if self._file is None:
+      return
+    assert self.rows_written == self.height, \
+      'Only {} of {} rows written.'.format(self.rows_written, self.height)
+    self._add(self._compressor.flush())
+    self._flush_idat()
+    self._write_chunk(b'IEND', b'')
+    self._file.close()
+    self._file = None
+
+  def _add(self, data):
+    if data:
+      self._pending.append(data)
+      self._pending_size += len(data)
+      if self._pending_size >= self._CHUNK_SIZE:
+        self._flush_idat()
+
+  def _flush_idat(self):
+    if self._pending:
+      self._write_chunk(b'IDAT', b''.join(self._pending))
+      self._pending = []
+      self._pending_size = 0
+
+  def _write_chunk(self, chunk_type, data):
+    self._file.write(struct.pack('>I', len(data)))
+    self._file.write(chunk_type)
+    self._file.write(data)
+    self._file.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class TIFFWriter(object):
+  """ Write an 8-bit RGB or RGBA baseline TIFF file row by row, in strips
+  of rows_per_strip rows, optionally deflate compressed. The file must be
+  smaller than 4GB (classic TIFF).
+
+  Parameters:
+  filename: str, the TIFF file to create.
+  width, height: int, the image size.
+  channels: int, 3 (RGB) or 4 (RGBA).
+  compression: int, zlib compression level 1 ~ 9 (deflate), or 0 for
+    uncompressed strips.
+  rows_per_strip: int, number of rows per strip.
+  """
+  def __init__(self, filename, width, height, channels=4, compression=0,
+               rows_per_strip=16):
+    assert channels in (3, 4), 'channels must be 3 (RGB) or 4 (RGBA).'
+    self.filename = filename
+    self.width = int(width)
+    self.height = int(height)
+    self.channels = channels
+    self.compression = compression
+    self.rows_per_strip = rows_per_strip
+    self.rows_written = 0
+
+    self._file = open(filename, 'wb')
+    self._file.write(b'II*\0' + struct.pack('<I', 0)) # IFD offset, see close
+    self._strip_offsets = []
+    self._strip_sizes = []
+    self._rows = [] # rows of the current strip
+
+  def write_rows(self, rows):
+    """ Write the next rows, a (n, width, channels) uint8 array.
+    """
+    rows = np.asarray(rows, dtype=np.uint8)
+    assert rows.shape[1:] == (self.width, self.channels), \
+      'Wrong row shape {}.'.format(rows.shape)
+    assert self.rows_written + len(rows) <= self.height, 'Too many rows.'
+    for row in rows:
+      self._rows.append(row)
+      if len(self._rows) == self.rows_per_strip:
+        self._write_strip()
+    self.rows_written += len(rows)
+
+  def _write_strip(self):
+    data = np.ascontiguousarray(self._rows).tobytes()
+    if self.compression:
+      data = zlib.compress(data, self.compression)
+    offset = self._file.tell()
+    if offset + len(data) >= 2**32:
+      raise ValueError('TIFF files larger than 4GB are not supported, '
+                       'use PNG instead.')
+    self._file.write(data)
+    if len(data) % 2: # keep the offsets word aligned
+      self._file.write(b'\0')
+    self._strip_offsets.append(offset)
+    self._strip_sizes.append(len(data))
+    self._rows = []
+
+  def close(self):
+    if self._file is None:
+      return
+    assert self.rows_written == self.height, \
+      'Only {} of {} rows written.'.format(self.rows_written, self.height)
+    if self._rows:
+      self._write_strip()
+
+    # The arrays referenced by the IFD entries, then the IFD itself.
+    f = self._file
+    def write_array(fmt, values):
+      offset = f.tell()
+      f.write(struct.pack('<{:d}{}'.format(len(values), fmt), *values))
+      return offset
+    n_strips = len(self._strip_offsets)
+    bits_offset = write_array('H', [8] * self.channels)
+    offsets_offset = write_array('I', self._strip_offsets)
+    sizes_offset = write_array('I', self._strip_sizes)
+
+    SHORT, LONG = 3, 4
+    entries = [
+      (256, LONG, 1, self.width), # ImageWidth
+      (257, LONG, 1, self.height), # ImageLength
+      (258, SHORT, self.channels, bits_offset), # BitsPerSample
+      (259, SHORT, 1, 8 if self.compression else 1), # Compression
+      (262, SHORT, 1, 2), # PhotometricInterpretation: RGB
+      (273, LONG, n_strips, offsets_offset), # StripOffsets
+      (277, SHORT, 1, self.channels), # SamplesPerPixel
+      (278, LONG, 1, self.rows_per_strip), # RowsPerStrip
+      (279, LONG, n_strips, sizes_offset), # StripByteCounts
+      (284, SHORT, 1, 1), # PlanarConfiguration: chunky
+    ]
+    if self.channels == 4:
+      entries.append((338, SHORT, 1, 2)) # ExtraSamples: unassociated alpha
+    if n_strips == 1: # a single value is stored in the entry itself
+      entries[5] = (273, LONG, 1, self._strip_offsets[0])
+      entries[8] = (279, LONG, 1, self._strip_sizes[0])
+
+    if f.tell() % 2:
+      f.write(b'\0')
+    ifd_offset = f.tell()
+    f.write(struct.pack('<H', len(entries)))
+    for tag, field_type, count, value in entries:
+      if field_type == SHORT and count == 1:
+        f.write(struct.pack('<HHIHH', tag, field_type, count, value, 0))
+      else:
+        f.write(struct.pack('<HHII', tag, field_type, count, value))
+    f.write(struct.pack('<I', 0)) # no next IFD
+    f.seek(4)
+    f.write(struct.pack('<I', ifd_offset))
+    f.close()
+    self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+def open_image_writer(filename, width, height, channels=4, compression=6):
+  """ Open a PNGWriter or TIFFWriter depending on the extension of filename
+  ('.png', '.tif' or '.tiff').
+  """
+  ext = os.path.splitext(filename)[1].lower()
+  if ext == '.png':
+    return PNGWriter(filename, width, height, channels=channels,
+                     compression=compression)
+  elif ext in ('.tif', '.tiff'):
+    return TIFFWriter(filename, width, height, channels=channels,
+                      compression=compression)
+  else:
+    raise ValueError('Wrong image format: {} (use .png or .tif)'.format(ext))
+
+
+def write_image(filename, image, compression=6):
+  """ Write a (height, width, 3 or 4) uint8 image to a PNG or TIFF file
+  (chosen by the extension of filename).
+  """
+  image = np.asarray(image)
+  height, width, channels = image.shape
+  with open_image_writer(filename, width, height, channels=channels,
+                         compression=compression) as writer:
+    writer.write_rows(image)
+
+
+class ImageWriter(object):
+  """ Encode and write images on background threads, so that capturing a
+  screenshot does not block the UI (or a scripted sequence of captures)
+  while the image is compressed.
+
+  Parameters:
+  format: str, 'png' or 'tiff', the format used when the filename passed to
+    'submit' has no extension.
+  compression: int, zlib compression level (0 ~ 9).
+  n_workers: int, number of writer threads.
+  max_pending: int, maximum number of images waiting to be written; 'submit'
+    blocks when it is reached, which bounds the memory usage.
+  """
+  def __init__(self, format='png', compression=6, n_workers=1,
+               max_pending=8):
+    assert format in ('png', 'tiff'), "format must be 'png' or 'tiff'."
+    self.format = format
+    self.compression = compression
+    self.n_workers = n_workers
+    self._executor = None # created on first use
+    self._slots = threading.BoundedSemaphore(max_pending)
+    self._futures = []
+    self._lock = threading.Lock()
+
+  def submit(self, filename, image):
+    """ Queue the image (a (height, width, 3 or 4) uint8 array, which must
+    not be modified afterwards) to be written to filename. Returns a Future
+    of the filename.
+    """
+    if not os.path.splitext(filename)[1]:
+      filename = filename + '.' + self.format
+    self._slots.acquire()
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=self.n_workers,
+                                            thread_name_prefix='image_writer')
+      future = self._executor.submit(self._write, filename, image)
+      # Forget the images written successfully; the failed ones are kept
+      # for 'wait' to raise their error.
+      self._futures = [f for f in self._futures
+                       if not f.done() or f.exception() is not None]
+      self._futures.append(future)
+    return future
+
+  def _write(self, filename, image):
+    try:
+      write_image(filename, image, compression=self.compression)
+      return filename
+    finally:
+      self._slots.release()
+
+  @property
+  def pending(self):
+    """ Number of images not written yet.
+    """
+    with self._lock:
+      return sum(not f.done() for f in self._futures)
+
+  def wait(self, timeout=None):
+    """ Wait until all the submitted images are written. Raises the first
+    error that occurred while writing them, if any, once the others are
+    written.
+    """
+    with self._lock:
+      futures, self._futures = self._futures, []
+    errors = [future.exception(timeout=timeout) for future in futures]
+    errors = [error for error in errors if error is not None]
+    if errors:
+      raise errors[0]
+
+  flush = wait
+
+  def close(self):
+    self.wait()
+    with self._lock:
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from vispy import scene
+
+
+class LODMesh(scene.Node):
+  """ A triangle mesh with several levels of detail, e.g. fault surfaces
+  from load_fault_skins(..., n_levels=4). Each level is a separate Mesh
+  visual (with only the vertices its faces use), and only the current level
+  is visible, so switching levels costs nothing. SeismicCanvas shows a coarse
+  level, chosen from the camera distance, while the camera moves, and the
+  full detail (level 0) when it stops.
+
+  Parameters:
+  vertices: (n, 3) array of vertex positions.
+  faces: list of (m_k, 3) arrays of vertex indexes, faces[k] is the mesh at
+    level k; level k is expected to have a vertex spacing of about 2**k
+    times the spacing of level 0.
+  vertex_values: (n,) array or None, values mapped to colors by the cmap.
+  max_pixels: float, the coarsest level used while the camera moves is the
+    one whose vertex spacing is at most max_pixels pixels on the screen.
+  mesh_kwargs: passed to every Mesh visual (e.g. shading='smooth').
+  """
+  def __init__(self, vertices, faces, vertex_values=None, max_pixels=4.,
+               parent=None, **mesh_kwargs):
+    scene.Node.__init__(self, parent=parent)
+    self.max_pixels = max_pixels
+    if isinstance(faces, np.ndarray): # a single level
+      faces = [faces]
+
+    self.meshes = []
+    for k, faces_k in enumerate(faces):
+      faces_k = np.asarray(faces_k)
+      if k == 0:
+        verts_k, values_k = vertices, vertex_values
+      else:
+        # Only keep the vertices used by this level.
+        used, faces_k = np.unique(faces_k, return_inverse=True)
+        faces_k = faces_k.reshape(-1, 3)
+        verts_k = np.asarray(vertices)[used]
+        values_k = None if vertex_values is None \
+          else np.asarray(vertex_values)[used]
+      mesh = scene.visuals.Mesh(verts_k, faces_k, vertex_values=values_k,
+                                parent=self, **mesh_kwargs)
+      mesh.visible = (k == 0)
+      self.meshes.append(mesh)
+    self.level = 0
+
+  @property
+  def n_levels(self):
+    return len(self.meshes)
+
+  def set_level(self, level):
+    """ Show the mesh at the given level of detail (clipped to the available
+    levels). Returns True if the level changed.
+    """
+    level = int(np.clip(level, 0, self.n_levels - 1))
+    if level == self.level:
+      return False
+    self.meshes[self.level].visible = False
+    self.meshes[level].visible = True
+    self.level = level
+    return True
+
+  def level_for_scale(self, pixels_per_unit):
+    """ The coarsest level whose vertex spacing (2**level units) is at most
+    max_pixels on the screen, given the number of screen pixels per scene
+    unit (i.e. the camera distance).
+    """
+    if pixels_per_unit <= 0:
+      return self.n_levels - 1
+    level = int(np.floor(np.log2(self.max_pixels / pixels_per_unit)))
+    return int(np.clip(level, 0, self.n_levels - 1))
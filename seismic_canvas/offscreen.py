@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Headless (offscreen) rendering of SeismicCanvas scenes, e.g. to produce
+many figures from scripts on a machine without a display.
+
+Typical usage:
+  from seismic_canvas.offscreen import use_headless_backend, BatchRenderer
+  use_headless_backend() # before creating any canvas
+  renderer = BatchRenderer(size=(800, 720))
+  for survey in surveys:
+    renderer.render(make_visual_nodes(survey), state=saved_view_state,
+                    filename=survey.name + '.png')
+  renderer.report()
+"""
+
+import os
+import time
+
+import vispy
+
+
+# Backends that do not need a display, in order of preference.
+HEADLESS_BACKENDS = ('egl', 'osmesa')
+
+
+def use_headless_backend(backend=None):
+  """ Select a vispy backend that renders without a window. Must be called
+  before any canvas is created.
+
+  Parameters:
+  backend: str or None, 'egl' (hardware or Mesa EGL) or 'osmesa' (Mesa
+    software rendering), or None to try them in that order.
+
+  Returns the name of the backend in use, raises RuntimeError if none of
+  them is available.
+  """
+  backends = HEADLESS_BACKENDS if backend is None else (backend,)
+  errors = []
+  for name in backends:
+    if name == 'egl' and 'DISPLAY' not in os.environ:
+      # Without an X server, Mesa EGL must not look for one.
+      os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+    try:
+      vispy.use(app=name)
+      return name
+    except Exception as error:
+      errors.append('{}: {}'.format(name, error))
+  raise RuntimeError('No headless vispy backend available:\n  ' +
+                     '\n  '.join(errors))
+
+
+class BatchRenderer(object):
+  """ Render many scenes offscreen with one (hidden) SeismicCanvas, i.e. one
+  OpenGL context, which saves creating a window and a context per figure.
+  The render time of every figure is recorded, see 'report'.
+
+  Parameters:
+  size: tuple of 2 ints, the default image size (width, height).
+  canvas_params: passed to SeismicCanvas, e.g. bgcolor, fov, azimuth.
+  """
+  def __init__(self, size=(800, 720), **canvas_params):
+    from .seismic_canvas import SeismicCanvas
+    self.canvas = SeismicCanvas(size=size, show=False, **canvas_params)
+    self.default_camera_state = self.canvas.camera.get_state()
+    self.times = [] # [(name, seconds)] of each rendered figure
+
+  def render(self, visual_nodes, xyz_axis=None, colorbar=None, state=None,
+             filename=None, name=None):
+    """ Render a scene and return it as a (height, width, 4) uint8 RGBA
+    array.
+
+    Parameters:
+    visual_nodes, xyz_axis, colorbar: the contents of the scene, as for
+      SeismicCanvas.
+    state: dict or None, the view to reproduce (camera, slice positions,
+      size, ...), as returned by SeismicCanvas.get_view_state (e.g. saved
+      as JSON). Otherwise the camera is fit to the scene.
+    filename: str or None, if given, the image is also saved (PNG or TIFF,
+      by extension) on the background writer of the canvas, so that the
+      encoding overlaps with rendering the next scenes. See 'wait'.
+    name: str, the name of the figure in the timing report (default:
+      filename, or the index of the figure).
+    """
+    t0 = time.perf_counter()
+    canvas = self.canvas
+    canvas.set_scene(visual_nodes, xyz_axis, colorbar)
+    if state is not None:
+      canvas.set_view_state(state)
+    else:
+      canvas.camera.set_state(self.default_camera_state)
+      canvas.camera.set_range()
+      canvas.camera.scale_factor /= canvas.zoom_factor
+    image = canvas.render()
+    if filename is not None:
+      canvas.image_writer.submit(filename, image)
+    if name is None:
+      name = filename if filename is not None else str(len(self.times))
+    self.times.append((name, time.perf_counter() - t0))
+    return image
+
+  def wait(self):
+    """ Wait until all the rendered images are written.
+    """
+    self.canvas.image_writer.wait()
+
+  def report(self):
+    """ Print the render time of every figure (excluding the image
+    encoding, which runs in the background), and the total.
+    """
+    for name, seconds in self.times:
+      print('{:>8.3f} s  {}'.format(seconds, name))
+    total = sum(seconds for _, seconds in self.times)
+    print('{:>8.3f} s  total ({:d} figures)'.format(total, len(self.times)))
+
+  def close(self):
+    self.wait()
+    self.canvas.set_scene([]) # release the nodes
+    self.canvas.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
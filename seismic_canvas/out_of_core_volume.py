@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import copy
+import mmap
+
+import numpy as np
+
+
+def memmap_offset(m):
+  """ The byte offset in its file where the data of the np.memmap m starts,
+  or None if it cannot be determined. Unlike m.offset (the offset of the
+  mapped array), this is also right for views, e.g. m[100:200].
+  """
+  mm = getattr(m, '_mmap', None)
+  if mm is None:
+    return None
+  try:
+    base = np.frombuffer(mm, dtype=np.uint8).ctypes.data
+  except (TypeError, ValueError, BufferError):
+    return None
+  # np.memmap maps the file from the allocation granularity below offset.
+  start = m.offset - m.offset % mmap.ALLOCATIONGRANULARITY
+  return start + m.ctypes.data - base
+
+
+class OutOfCoreVolume(object):
+  """ Base class of the NumPy-like 3D volumes that read their samples from
+  disk on demand, so that they can be passed to volume_slices in place of
+  an np.ndarray or np.memmap.
+
+  Indexing with only slices (e.g. vol[:, ::-1, ::-1]) returns a lazy view of
+  the volume without reading anything. Indexing with at least one integer
+  (e.g. vol[pos, :, :]) reads the samples and returns an np.ndarray.
+
+  Subclasses implement '_read_box(lo, hi)', which returns the samples in the
+  box [lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]] of the full volume as an
+  np.ndarray.
+  """
+  ndim = 3
+
+  def __init__(self, shape, dtype):
+    assert len(shape) == 3, 'Only 3D volumes are supported.'
+    self.dtype = np.dtype(dtype)
+    # Indexes of the full volume covered by this (view of the) volume.
+    self._ranges = tuple(range(int(n)) for n in shape)
+
+  @property
+  def shape(self):
+    return tuple(len(r) for r in self._ranges)
+
+  @property
+  def size(self):
+    return int(np.prod(self.shape))
+
+  @property
+  def nbytes(self):
+    return self.size * self.dtype.itemsize
+
+  def __len__(self):
+    return self.shape[0]
+
+  def __repr__(self):
+    return '<{} shape={} dtype={}>'.format(
+      type(self).__name__, self.shape, self.dtype)
+
+  def __getitem__(self, key):
+    if not isinstance(key, tuple):
+      key = (key,)
+    # Expand the Ellipsis and the missing trailing axes.
+    if any(k is Ellipsis for k in key):
+      i = [k is Ellipsis for k in key].index(True)
+      key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i+1:]
+    key = key + (slice(None),) * (self.ndim - len(key))
+    if len(key) != self.ndim:
+      raise IndexError('Too many indices for a 3D volume.')
+
+    items = []
+    for r, k in zip(self._ranges, key):
+      if isinstance(k, slice):
+        items.append(r[k])
+      elif isinstance(k, (int, np.integer)):
+        items.append(r[int(k)]) # raises IndexError if out of range
+      else:
+        raise IndexError('Only integers and slices are supported, ' +
+                         'got {}.'.format(k))
+
+    if all(isinstance(item, range) for item in items):
+      # Only slices: return a lazy view.
+      view = copy.copy(self)
+      view._ranges = tuple(items)
+      return view
+    return self._read(items)
+
+  def __array__(self, dtype=None, copy=None):
+    data = self.read()
+    return data if dtype is None else data.astype(dtype)
+
+  def read(self):
+    """ Read the whole (view of the) volume into an np.ndarray.
+    """
+    return self._read(self._ranges)
+
+  def iter_slabs(self, n=64):
+    """ Iterate over the volume in slabs of n slices along the first axis,
+    each slab is read into an np.ndarray.
+    """
+    for i0 in range(0, self.shape[0], n):
+      yield self[i0:i0+n].read()
+
+  def min(self):
+    return min(slab.min() for slab in self.iter_slabs())
+
+  def max(self):
+    return max(slab.max() for slab in self.iter_slabs())
+
+  def _read(self, items):
+    """ Read the samples indexed by items (a list of ints and ranges of the
+    full volume indexes).
+    """
+    lo, hi, local = [], [], []
+    for item in items:
+      if isinstance(item, range):
+        if len(item) == 0:
+          shape = [len(i) for i in items if isinstance(i, range)]
+          return np.empty(shape, dtype=self.dtype)
+        start, stop = min(item), max(item) + 1
+        # The same range, relative to the start of the box.
+        local_stop = item.start - start + item.step * len(item)
+        local.append(slice(item.start - start,
+                           local_stop if local_stop >= 0 else None,
+                           item.step))
+      else:
+        start, stop = item, item + 1
+        local.append(0)
+      lo.append(start)
+      hi.append(stop)
+    return self._read_box(lo, hi)[tuple(local)]
+
+  def _read_box(self, lo, hi):
+    raise NotImplementedError
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from vispy.scene.visuals import VisualNode
+
+from .axis_aligned_image import AxisAlignedImage
+
+
+class RayPicker(object):
+  """ Find the draggable visual node under the mouse on the CPU, instead of
+  a picking render: the slices (AxisAlignedImage) are planar rectangles
+  with a known transform, so the nearest one is found by intersecting the
+  view ray with each of them, and the axis legend (XYZAxis) is picked within
+  its highlight disc on the screen.
+
+  This only works if the slices and the axis legend are the only
+  interactive visuals of the scene; see 'supports'. SeismicCanvas falls
+  back to the GPU picking (SceneCanvas.visual_at) otherwise.
+
+  Parameters:
+  canvas: SeismicCanvas, the canvas to pick in.
+  """
+  def __init__(self, canvas):
+    self.canvas = canvas
+
+  def supports(self):
+    """ Whether all the interactive visuals of the scene can be picked on
+    the CPU, i.e. there are no other interactive visuals (e.g. meshes made
+    interactive by the user) than the slices and the axis legend.
+    """
+    def other_interactive(node):
+      if not node.visible:
+        return False
+      if isinstance(node, AxisAlignedImage):
+        return False # its children (overlays, highlight) are not pickable
+      if isinstance(node, VisualNode) and node.interactive:
+        return True
+      return any(other_interactive(child) for child in node.children)
+    return not any(other_interactive(node)
+                   for node in self.canvas.view.scene.children)
+
+  def pick(self, pos):
+    """ The axis legend or the nearest slice at the canvas position pos
+    (logical pixels), or None.
+    """
+    xyz_axis = self.canvas.xyz_axis
+    if xyz_axis is not None and xyz_axis.visible and xyz_axis.interactive:
+      # The legend is drawn over the scene.
+      distance = np.hypot(*(np.asarray(pos[:2]) - np.asarray(xyz_axis.loc)))
+      if distance <= xyz_axis.size:
+        return xyz_axis
+    images = [node for node in self.canvas.view.scene.children
+              if isinstance(node, AxisAlignedImage) and node.visible
+              and node.interactive]
+    hits = self.intersect(pos, images)
+    if not hits:
+      return None
+    return min(hits, key=lambda hit: hit[1])[0]
+
+  def ray(self, pos):
+    """ The view ray at the canvas position pos, as two of its points, on
+    the near clipping plane and half way in the depth range (the far plane
+    is too far away with a perspective camera to be mapped accurately),
+    (2, 4) homogeneous scene coordinates.
+    """
+    canvas = self.canvas
+    tr = canvas.scene.node_transform(canvas.view.scene)
+    ends = tr.map(np.array([[pos[0], pos[1], -1, 1],
+                            [pos[0], pos[1], 0, 1]], dtype=float))
+    return ends / ends[:, 3:]
+
+  def intersect(self, pos, images):
+    """ Intersect the view ray at pos with the images. Returns a list of
+    (image, depth) of the images hit, where depth increases away from the
+    camera (0: near plane, in units of the length of the ray, see 'ray').
+    """
+    ends = self.ray(pos)
+    hits = []
+    for image in images:
+      # The image is the rectangle (0, 0) ~ (width, height) of the z=0 plane
+      # in its local coordinates (the displayed pixels, which are scaled to
+      # the full resolution image_shape by the transform; affine, so the
+      # depth is preserved).
+      near, mid = image.transform.imap(ends)[:, :3]
+      direction = mid - near
+      if abs(direction[2]) < 1e-12:
+        continue # the ray is parallel to the image
+      depth = -near[2] / direction[2]
+      if depth < 0:
+        continue # behind the camera
+      x, y = near[:2] + depth * direction[:2]
+      width, height = np.asarray(image.image_shape) / image._lod_scale()
+      if 0 <= x <= width and 0 <= y <= height:
+        hits.append((image, depth))
+    return hits
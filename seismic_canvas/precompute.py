@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Apply a preprocessing function over a whole volume out-of-core, in
+parallel, and write the result to a new volume. volume_slices can then
+display the derived volume without running preproc_funcs on every slice.
+
+From the command line (run as a module, it uses relative imports):
+  python -m seismic_canvas.precompute src dst --func module:name \
+    --shape n0 n1 n2
+"""
+
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .bricked_volume import BrickedVolume, BrickedVolumeWriter
+from .chunked_volume import ChunkedVolume, ChunkedVolumeWriter
+from .out_of_core_volume import OutOfCoreVolume, memmap_offset
+
+
+_AXES = {'x': 0, 'y': 1, 'z': 2}
+
+
+def precompute_volume(src, func, dst, shape=None, dtype='>f4',
+                      out_dtype=np.float32, per_slice=None,
+                      chunk=64, n_workers=None, brick_size=64):
+  """ Apply func over the volume src, chunk by chunk across a process pool,
+  and write the result to dst.
+
+  Parameters:
+  src: str or array-like, a raw binary file (then shape and dtype describe
+    its content) or a 3D volume (np.ndarray, np.memmap, BrickedVolume, ...).
+  func: the preprocessing function, e.g. one of the preproc_funcs of
+    volume_slices. It must accept an np array and return an array of the
+    same shape.
+  dst: str, the output file. The format is chosen by the extension: '.bvol'
+    writes a BrickedVolume, '.cvol' a ChunkedVolume (zlib compressed chunks
+    of brick_size^3), '.npy' a NumPy array file, anything else a raw binary
+    file of out_dtype (in native byte order).
+  per_slice: None, 'x', 'y' or 'z'. None applies func to whole chunks, which
+    is right for per-voxel functions. Otherwise func is applied to each 2D
+    slice along that axis, the same way volume_slices would apply it.
+  chunk: int, number of slices per chunk (rounded up to a multiple of
+    brick_size for a bricked or chunked output).
+  n_workers: int, number of worker processes (default: number of CPUs).
+    If func cannot be pickled (e.g. a lambda), or src is an in-memory
+    array, threads are used instead of processes.
+
+  Returns the output volume: a BrickedVolume, a ChunkedVolume or a
+  read-only np.memmap.
+  """
+  if isinstance(src, str):
+    assert shape is not None, 'shape must be specified for a raw file.'
+    src = np.memmap(src, dtype=dtype, mode='r', shape=tuple(shape))
+  shape = src.shape
+  out_dtype = np.dtype(out_dtype)
+  axis = 0 if per_slice is None else _AXES[per_slice]
+  n_workers = n_workers or os.cpu_count() or 1
+
+  # Open the output.
+  ext = os.path.splitext(dst)[1].lower()
+  if ext == '.bvol':
+    chunk = (chunk + brick_size - 1) // brick_size * brick_size
+    writer = BrickedVolumeWriter(dst, shape, dtype=out_dtype,
+                                 brick_size=brick_size)
+  elif ext == '.cvol':
+    chunk = (chunk + brick_size - 1) // brick_size * brick_size
+    writer = ChunkedVolumeWriter(dst, shape, dtype=out_dtype,
+                                 chunk_size=brick_size)
+  elif ext == '.npy':
+    out = np.lib.format.open_memmap(dst, mode='w+', dtype=out_dtype,
+                                    shape=shape)
+  else:
+    out = np.memmap(dst, dtype=out_dtype, mode='w+', shape=shape)
+
+  # Processes need a picklable task (src is sent as a file reference).
+  src_ref = _picklable_source(src)
+  if src_ref is not None and _is_picklable(func):
+    executor = ProcessPoolExecutor(max_workers=n_workers)
+  else:
+    src_ref = src
+    executor = ThreadPoolExecutor(max_workers=n_workers)
+
+  def write(i0, result):
+    if ext in ('.bvol', '.cvol'):
+      lo = [0, 0, 0]
+      lo[axis] = i0
+      writer.write_block(lo, result)
+    else:
+      index = [slice(None)] * 3
+      index[axis] = slice(i0, i0 + result.shape[axis])
+      out[tuple(index)] = result
+
+  # Keep a bounded number of chunks in flight to bound the memory usage.
+  complete = False
+  try:
+    with executor:
+      pending = []
+      try:
+        for i0 in range(0, shape[axis], chunk):
+          pending.append((i0, executor.submit(_process_chunk, src_ref, func,
+            axis, i0, min(i0 + chunk, shape[axis]), per_slice is not None,
+            out_dtype)))
+          if len(pending) >= 2 * n_workers:
+            write(pending[0][0], pending[0][1].result())
+            pending.pop(0)
+        for i0, future in pending:
+          write(i0, future.result())
+      except BaseException:
+        for _, future in pending: # do not wait for the queued chunks
+          future.cancel()
+        raise
+    complete = True
+  finally:
+    if ext in ('.bvol', '.cvol'):
+      writer.close()
+    else:
+      out.flush()
+      del out
+    if not complete: # do not leave a volume that looks valid
+      os.remove(dst)
+
+  if ext in ('.bvol', '.cvol'):
+    return BrickedVolume(dst) if ext == '.bvol' else ChunkedVolume(dst)
+  if ext == '.npy':
+    return np.load(dst, mmap_mode='r')
+  return np.memmap(dst, dtype=out_dtype, mode='r', shape=shape)
+
+
+def _process_chunk(src, func, axis, i0, i1, per_slice, out_dtype):
+  """ The task run by the workers: read the chunk [i0:i1] along axis and
+  apply func, either on the whole chunk or on each slice.
+  """
+  if isinstance(src, tuple): # a raw file reference, see _picklable_source
+    filename, dtype, shape, offset = src
+    src = np.memmap(filename, dtype=dtype, mode='r', shape=shape,
+                    offset=offset)
+  index = [slice(None)] * 3
+  index[axis] = slice(i0, i1)
+  block = np.asarray(src[tuple(index)])
+  if not per_slice:
+    return np.asarray(func(block), dtype=out_dtype)
+  result = np.empty(block.shape, dtype=out_dtype)
+  for i in range(i1 - i0):
+    index[axis] = i
+    result[tuple(index)] = func(block[tuple(index)])
+  return result
+
+
+def _picklable_source(src):
+  """ Get a reference to src that can be cheaply sent to worker processes,
+  or None if src only lives in memory.
+  """
+  if isinstance(src, np.memmap):
+    # A memmap would be pickled with all its data, send the file instead.
+    # src.offset is the offset of the mapped array, not of a view of it.
+    offset = memmap_offset(src)
+    if src.filename is None or offset is None \
+        or not src.flags['C_CONTIGUOUS']:
+      return None
+    return (src.filename, src.dtype.str, src.shape, offset)
+  if isinstance(src, OutOfCoreVolume):
+    return src # pickled as a file reference
+  return None
+
+
+def _is_picklable(obj):
+  try:
+    pickle.dumps(obj)
+    return True
+  except Exception:
+    return False
+
+
+if __name__ == '__main__':
+  import argparse
+  import importlib
+  parser = argparse.ArgumentParser(
+    prog='python -m seismic_canvas.precompute',
+    description='Apply a preprocessing function over a whole volume.')
+  parser.add_argument('src', help='raw binary volume file, e.g. strike.dat')
+  parser.add_argument('dst', help='output file (.bvol, .cvol, .npy or raw)')
+  parser.add_argument('--func', required=True,
+                      help='the function to apply, as module:name')
+  parser.add_argument('--shape', type=int, nargs=3, required=True)
+  parser.add_argument('--dtype', default='>f4',
+                      help="sample type of src (default: '>f4')")
+  parser.add_argument('--per-slice', choices=['x', 'y', 'z'], default=None)
+  parser.add_argument('--workers', type=int, default=None)
+  args = parser.parse_args()
+  module_name, func_name = args.func.split(':')
+  func = getattr(importlib.import_module(module_name), func_name)
+  precompute_volume(args.src, func, args.dst, shape=args.shape,
+                    dtype=args.dtype, per_slice=args.per_slice,
+                    n_workers=args.workers)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Read 3D post-stack SEG-Y files directly, without converting them into a
+raw binary volume first.
+
+The trace headers are scanned once to map every (inline, crossline) to its
+trace number; this index is saved next to the file ('<filename>.index.npz')
+so that reopening the survey does not scan it again. The traces are then
+read through a memmap, and IBM floats are converted to IEEE floats with
+vectorized integer arithmetic.
+
+Only fixed length traces (the number of samples of the binary header) are
+supported, as in SEG-Y rev 1 files with the fixed length trace flag, and
+in virtually all post-stack files.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .out_of_core_volume import OutOfCoreVolume
+
+
+_TEXT_HEADER_SIZE = 3200
+_BINARY_HEADER_SIZE = 400
+_TRACE_HEADER_SIZE = 240
+
+# Data sample format code -> on-disk sample type ('ibm': IBM float, read as
+# big-endian 32-bit words and converted).
+_SAMPLE_FORMATS = {1: 'ibm', 2: '>i4', 3: '>i2', 5: '>f4', 8: 'i1'}
+
+# The fields of the binary header used here (byte offset in the header).
+_BINARY_HEADER = np.dtype({
+  'names': ['sample_interval', 'n_samples', 'format', 'revision',
+            'fixed_length', 'n_extended_headers'],
+  'formats': ['>u2', '>u2', '>i2', '>u2', '>i2', '>i2'],
+  'offsets': [16, 20, 24, 300, 302, 304],
+  'itemsize': _BINARY_HEADER_SIZE})
+
+
+def ibm_to_ieee(words):
+  """ Convert IBM System/360 single precision floats, given as their 32-bit
+  words (e.g. '>u4' samples), into float32. Values out of the float32 range
+  become +-inf or 0.
+  """
+  words = np.asarray(words).astype(np.uint32, copy=False)
+  sign = (words >> 31).astype(bool)
+  exponent = ((words >> 24) & 0x7f).astype(np.int32)
+  mantissa = (words & 0xffffff).astype(np.float32) # 24 bits, exact
+  # value = mantissa / 2**24 * 16**(exponent - 64)
+  with np.errstate(over='ignore', under='ignore'):
+    values = np.ldexp(mantissa, 4 * exponent - 280)
+  return np.where(sign, -values, values)
+
+
+def ieee_to_ibm(values):
+  """ Convert floats into IBM System/360 single precision floats, returned
+  as uint32 words (rounded to the nearest, clipped to the IBM range).
+  """
+  shape = np.shape(values)
+  values = np.asarray(values, dtype=np.float64).ravel() # scalars too
+  sign = np.signbit(values).astype(np.uint32) << 31
+  fraction, exponent = np.frexp(np.abs(values)) # fraction in [0.5, 1)
+  # |value| = fraction * 2**exponent = f * 16**e with f in [1/16, 1).
+  e = -(-exponent // 4)
+  mantissa = np.round(np.ldexp(fraction, exponent - 4 * e + 24))
+  carry = mantissa >= 2**24 # rounded up to the next power of 16
+  mantissa[carry] /= 16
+  e[carry] += 1
+  biased = e + 64
+  zero = (fraction == 0) | (biased < 0)
+  huge = biased > 127
+  mantissa[huge] = 2**24 - 1
+  biased = np.clip(biased, 0, 127)
+  words = sign | (biased.astype(np.uint32) << 24) | \
+          mantissa.astype(np.uint32)
+  words[zero] = 0
+  return words.reshape(shape)
+
+
+class SegyVolume(OutOfCoreVolume):
+  """ A read-only 3D volume (inline, crossline, sample) read from a SEG-Y
+  file, which can be passed to volume_slices directly.
+
+  The (inline, crossline) positions without a trace read as zeros. Slicing
+  along the sample axis reads a few bytes of every trace; for frequent
+  time slices, convert the survey with convert_to_bricked(SegyVolume(...),
+  dst) once.
+
+  Parameters:
+  filename: str, the SEG-Y file (big-endian, fixed length traces).
+  iline, xline: int, byte locations (1-based, as in the SEG-Y standard) of
+    the inline and crossline numbers (4-byte integers) in the trace headers.
+    189 and 193 in SEG-Y rev 1.
+  index: bool, save the trace index next to the file and reuse it as long
+    as the file does not change.
+  """
+  def __init__(self, filename, iline=189, xline=193, index=True):
+    self.filename = filename
+    self.iline = iline
+    self.xline = xline
+
+    with open(filename, 'rb') as f:
+      f.seek(_TEXT_HEADER_SIZE)
+      header = np.frombuffer(f.read(_BINARY_HEADER_SIZE),
+                             dtype=_BINARY_HEADER)[0]
+    fmt = int(header['format'])
+    if fmt not in _SAMPLE_FORMATS:
+      raise ValueError('Unsupported SEG-Y sample format {} in {}.'.format(
+                       fmt, filename))
+    self.format = fmt
+    self.sample_interval = int(header['sample_interval']) # microseconds
+    n_samples = int(header['n_samples'])
+    n_extended = max(int(header['n_extended_headers']), 0)
+    self._offset = _TEXT_HEADER_SIZE + _BINARY_HEADER_SIZE + \
+                   n_extended * _TEXT_HEADER_SIZE
+
+    sample_type = _SAMPLE_FORMATS[fmt]
+    self._sample_dtype = np.dtype('>u4' if sample_type == 'ibm'
+                                  else sample_type)
+    self._trace_size = _TRACE_HEADER_SIZE + \
+                       n_samples * self._sample_dtype.itemsize
+    self.n_traces = (os.path.getsize(filename) - self._offset) // \
+                    self._trace_size
+    if n_samples == 0 or self.n_traces == 0:
+      raise ValueError('No traces in {}.'.format(filename))
+
+    self._open()
+    # The trace index: inline and crossline numbers of the volume axes, and
+    # the trace number at each (inline, crossline), -1 if missing.
+    loaded = _load_index(self) if index else None
+    if loaded is None:
+      loaded = self._scan()
+      if index:
+        _save_index(self, *loaded)
+    self.inlines, self.crosslines, self._trace_grid = loaded
+    self.complete = bool(np.all(self._trace_grid >= 0))
+
+    dtype = np.float32 if sample_type == 'ibm' \
+            else self._sample_dtype.newbyteorder('=')
+    shape = (len(self.inlines), len(self.crosslines), n_samples)
+    OutOfCoreVolume.__init__(self, shape, dtype)
+
+  def _open(self):
+    n_samples = (self._trace_size - _TRACE_HEADER_SIZE) // \
+                self._sample_dtype.itemsize
+    trace_dtype = np.dtype({
+      'names': ['iline', 'xline', 'samples'],
+      'formats': ['>i4', '>i4', (self._sample_dtype, n_samples)],
+      'offsets': [self.iline - 1, self.xline - 1, _TRACE_HEADER_SIZE],
+      'itemsize': self._trace_size})
+    self._traces = np.memmap(self.filename, dtype=trace_dtype, mode='r',
+                             offset=self._offset, shape=(self.n_traces,))
+
+  def __getstate__(self):
+    # Do not pickle the memmap (it would pickle all the data), reopen it.
+    state = self.__dict__.copy()
+    del state['_traces']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._open()
+
+  def _scan(self):
+    """ Read the inline and crossline numbers of all the traces (one pass
+    over the trace headers) and build the trace index.
+    """
+    ilines = np.array(self._traces['iline'], dtype=np.int64)
+    xlines = np.array(self._traces['xline'], dtype=np.int64)
+    inlines, i = np.unique(ilines, return_inverse=True)
+    crosslines, j = np.unique(xlines, return_inverse=True)
+    grid = np.full((len(inlines), len(crosslines)), -1, dtype=np.int64)
+    grid[i, j] = np.arange(self.n_traces)
+    return inlines, crosslines, grid
+
+  def _read_box(self, lo, hi):
+    traces = self._trace_grid[lo[0]:hi[0], lo[1]:hi[1]].ravel()
+    shape = [h - l for l, h in zip(lo, hi)]
+    # Fancy indexing on the memmap only reads the requested samples.
+    samples = self._traces['samples']
+    if self.complete:
+      out = self._convert(samples[traces, lo[2]:hi[2]])
+    else:
+      out = np.zeros((len(traces), shape[2]), dtype=self.dtype)
+      valid = traces >= 0
+      out[valid] = self._convert(samples[traces[valid], lo[2]:hi[2]])
+    return out.reshape(shape)
+
+  def _convert(self, raw):
+    if self.format == 1:
+      return ibm_to_ieee(raw)
+    return raw.astype(self.dtype)
+
+
+def _index_filename(filename):
+  return filename + '.index.npz'
+
+
+def _index_signature(vol):
+  """ Describe the SEG-Y file and how it is indexed, the saved index is only
+  valid for the same signature.
+  """
+  st = os.stat(vol.filename)
+  return json.dumps({'size': st.st_size, 'mtime': st.st_mtime,
+                     'iline': vol.iline, 'xline': vol.xline,
+                     'trace_size': vol._trace_size, 'offset': vol._offset},
+                    sort_keys=True)
+
+
+def _load_index(vol):
+  try:
+    with np.load(_index_filename(vol.filename)) as f:
+      if str(f['signature']) != _index_signature(vol):
+        return None # the file changed, or is indexed differently
+      return f['inlines'], f['crosslines'], f['grid']
+  except (OSError, ValueError, KeyError):
+    return None
+
+
+def _save_index(vol, inlines, crosslines, grid):
+  try:
+    with open(_index_filename(vol.filename), 'wb') as f:
+      np.savez(f, signature=np.array(_index_signature(vol)),
+               inlines=inlines, crosslines=crosslines, grid=grid)
+  except OSError:
+    pass # e.g. read-only data directory, just do not persist
+
+
+def write_segy(filename, vol, format=1, sample_interval=4000,
+               first_inline=1, first_crossline=1):
+  """ Write a 3D volume (inline, crossline, sample) as a SEG-Y rev 1 file,
+  e.g. to create synthetic surveys. The traces are written one inline at a
+  time, so vol can be larger than the memory (np.memmap, OutOfCoreVolume).
+
+  Parameters:
+  format: int, data sample format code, 1 (IBM float), 2 (int32), 3 (int16),
+    5 (IEEE float) or 8 (int8).
+  sample_interval: int, in microseconds.
+  first_inline, first_crossline: int, numbers of the first inline and
+    crossline, incremented by 1 along the volume axes.
+  """
+  assert format in _SAMPLE_FORMATS, \
+    'Unsupported sample format {}.'.format(format)
+  n_il, n_xl, n_samples = vol.shape
+  sample_type = _SAMPLE_FORMATS[format]
+  sample_dtype = np.dtype('>u4' if sample_type == 'ibm' else sample_type)
+  trace_dtype = np.dtype({
+    'names': ['sequence', 'n_samples', 'sample_interval', 'iline', 'xline',
+              'samples'],
+    'formats': ['>i4', '>u2', '>u2', '>i4', '>i4', (sample_dtype, n_samples)],
+    'offsets': [0, 114, 116, 188, 192, _TRACE_HEADER_SIZE],
+    'itemsize': _TRACE_HEADER_SIZE + n_samples * sample_dtype.itemsize})
+
+  text = 'C 1 SYNTHETIC SURVEY WRITTEN BY SEISMIC_CANVAS'.ljust(80)
+  text += ''.join('C{:2d}'.format(i).ljust(80) for i in range(2, 41))
+  header = np.zeros(1, dtype=_BINARY_HEADER)
+  header['sample_interval'] = sample_interval
+  header['n_samples'] = n_samples
+  header['format'] = format
+  header['revision'] = 0x0100
+  header['fixed_length'] = 1
+
+  with open(filename, 'wb') as f:
+    f.write(text.encode('ascii'))
+    f.write(header.tobytes())
+    traces = np.zeros(n_xl, dtype=trace_dtype)
+    traces['n_samples'] = n_samples
+    traces['sample_interval'] = sample_interval
+    traces['xline'] = first_crossline + np.arange(n_xl)
+    for i in range(n_il):
+      data = np.asarray(vol[i])
+      traces['sequence'] = i * n_xl + 1 + np.arange(n_xl)
+      traces['iline'] = first_inline + i
+      if sample_type == 'ibm':
+        traces['samples'] = ieee_to_ibm(data)
+      else:
+        traces['samples'] = data
+      traces.tofile(f)
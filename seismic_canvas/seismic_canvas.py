@@ -5,12 +5,21 @@
 # Distributed under the MIT License. See LICENSE for more info.
 # -----------------------------------------------------------------------------
 
-from vispy import scene, io
+import time
+import warnings
+
+import numpy as np
+from vispy import scene, app, gloo
 from vispy.util import keys
 from vispy.gloo.util import _screenshot
 
 from .xyz_axis import XYZAxis
 from .axis_aligned_image import AxisAlignedImage
+from .update_scheduler import UpdateScheduler
+from .lod_mesh import LODMesh
+from .picking import RayPicker
+from .frame_stats import FrameStats, STAGES
+from .image_io import open_image_writer, ImageWriter
 
 
 class SeismicCanvas(scene.SceneCanvas):
@@ -19,7 +28,29 @@ class SeismicCanvas(scene.SceneCanvas):
   legend, colorbar, etc.
 
   Parameters:
-
+  coalesce_updates: bool, if True, the slice drags are applied at most once
+    per slice per frame, right before drawing, instead of at every mouse
+    move event. See 'update_stats'.
+  mesh_lod_idle: float, the LODMesh nodes among visual_nodes are drawn at a
+    coarse level (chosen from the camera distance) while the camera moves,
+    and in full detail after it stays still for mesh_lod_idle seconds.
+  show: bool, show the canvas window. Use show=False to render offscreen
+    with 'render' (see also seismic_canvas.offscreen).
+  screenshot_format: str, 'png' or 'tiff', the format of the screenshots
+    saved with the <s> key or 'save_screenshot'.
+  screenshot_compression: int, zlib compression level (0 ~ 9) of the
+    screenshots.
+  cpu_picking: bool, find the slice or axis legend under the mouse by
+    intersecting the view ray with them on the CPU, instead of a picking
+    render at every mouse move. The picking render is still used if the
+    scene has other interactive visuals. See 'pick'.
+  frame_stats: bool or FrameStats, record the time spent in each stage of
+    every frame (picking, dragging, slice reads, preprocessing, staging,
+    texture uploads, draw) for the slices and the canvas, see 'frame_stats'
+    and 'set_frame_stats'. Press <p> to save them. Off by default, which
+    costs nothing.
+  stats_overlay: bool, show a summary of the frame stats on the canvas
+    (requires frame_stats).
   """
   def __init__(self, size=(800, 720), bgcolor='white',
                visual_nodes=[], xyz_axis=None, colorbar=None,
@@ -28,7 +59,10 @@ class SeismicCanvas(scene.SceneCanvas):
                fov=45, azimuth=120, elevation=30,
                zoom_factor=1.2,
                axis_scales=(1.0, 1.0, 1.0),
-               auto_range=True, title='Seismic Canvas'):
+               auto_range=True, title='Seismic Canvas',
+               coalesce_updates=True, mesh_lod_idle=0.3, show=True,
+               screenshot_format='png', screenshot_compression=6,
+               cpu_picking=True, frame_stats=False, stats_overlay=False):
     # Create a SceneCanvas obj and unfreeze it so we can add more
     # attributes inside.
     scene.SceneCanvas.__init__(self, title=title,
@@ -54,11 +88,95 @@ class SeismicCanvas(scene.SceneCanvas):
     # NOTE: this is kind of a cheating... not sure what issue it may bring up.
     self.camera._flip_factors = axis_scales
 
+    # Create a secondary ViewBox to host the Colorbar visual.
+    # Make it solid background, image from primary ViewBox shall be
+    # blocked if overlapping.
+    self.view2 = self.grid.add_view(row=0, col=1, bgcolor=self.bgcolor)
+    self.view2.width_max = colorbar_region_ratio * self.size[0]
+    self.view2.interactive = False # disable so that it won't be selectable
+
+    # Attach the visual nodes, axis legend and colorbar.
+    self.frame_stats = None # see 'set_frame_stats'
+    self.visual_nodes = []
+    self.xyz_axis = None
+    self.colorbar = None
+    self.lod_meshes = []
+    self.set_scene(visual_nodes, xyz_axis, colorbar)
+
+    # Manage the selected visual node.
+    self.drag_mode = False
+    self.selected = None # no selection by default
+    self.hover_on = None # visual node that mouse hovers on, None by default
+    self.cpu_picking = cpu_picking
+    self.picker = RayPicker(self)
+
+    # Apply the pending slice drags once per frame, before drawing.
+    self.coalesce_updates = coalesce_updates
+    self.update_scheduler = UpdateScheduler()
+    self.events.draw.connect(self._flush_updates, position='first')
+
+    # Record the stage timings of every frame if requested.
+    self.stats_overlay = None
+    self._draw_start = None
+    self._overlay_updated = 0.
+    self._refreshing_overlay = False # see 'update'
+    self.events.draw.connect(self._on_draw_begin, position='first')
+    self.events.draw.connect(self._on_draw_end, position='last')
+    self.set_frame_stats(frame_stats, overlay=stats_overlay)
+
+    # Automatically set the range of the canvas, display, and wrap up.
+    if auto_range: self.camera.set_range()
+    # Record the scale factor for a consistent camera reset.
+    self.scale_factor = self.camera.scale_factor
+    # Zoom in or out after auto range setting.
+    self.zoom_factor = zoom_factor
+    self.camera.scale_factor /= self.zoom_factor
+
+    # Draw the LOD meshes coarse while the camera moves.
+    self.mesh_lod_idle = mesh_lod_idle
+    self._camera_idle_timer = None # created at first camera move
+    self.view.scene.events.transform_change.connect(self._on_camera_move)
+
+    # The screenshots are encoded and written on a background thread.
+    self.image_writer = ImageWriter(format=screenshot_format,
+                                    compression=screenshot_compression)
+    self.events.close.connect(self._on_close)
+
+    if show: self.show()
+    self.freeze()
+
+  def set_scene(self, visual_nodes=[], xyz_axis=None, colorbar=None):
+    """ Replace the contents of the canvas (the visual nodes, axis legend
+    and colorbar) without creating a new canvas, e.g. to render many scenes
+    offscreen with the same OpenGL context. The camera is unchanged.
+    """
+    # Detach the previous contents.
+    for node in self.visual_nodes:
+      node.parent = None
+      if isinstance(node, AxisAlignedImage):
+        node.stats = None
+    if self.xyz_axis is not None:
+      self.events.resize.disconnect(self.xyz_axis.on_resize)
+      self.events.mouse_move.disconnect(self.xyz_axis.on_mouse_move)
+      self.xyz_axis.parent = None
+      self.xyz_axis.highlight.parent = None
+    if self.colorbar is not None:
+      self.events.resize.disconnect(self.colorbar.on_resize)
+      self.colorbar.parent = None
+    self.selected = None
+    self.hover_on = None
+
     # Attach all main visual nodes (e.g. slices, meshs, volumes) to the ViewBox.
-    for node in visual_nodes:
+    self.visual_nodes = list(visual_nodes)
+    for node in self.visual_nodes:
       self.view.add(node)
+      if isinstance(node, AxisAlignedImage):
+        node.stats = self.frame_stats
+    self.lod_meshes = [node for node in self.visual_nodes
+                       if isinstance(node, LODMesh)]
 
     # Connect the XYZAxis visual to the primary ViewBox.
+    self.xyz_axis = xyz_axis
     if xyz_axis is not None:
       # Set the parent to view, instead of view.scene, so that this legend will
       # stay at its location on the canvas, and won't rotate away.
@@ -69,13 +187,8 @@ class SeismicCanvas(scene.SceneCanvas):
       xyz_axis._update_axis()
       self.events.mouse_move.connect(xyz_axis.on_mouse_move)
 
-    # Create a secondary ViewBox to host the Colorbar visual.
-    # Make it solid background, image from primary ViewBox shall be
-    # blocked if overlapping.
-    self.view2 = self.grid.add_view(row=0, col=1, bgcolor=self.bgcolor)
-    self.view2.width_max = colorbar_region_ratio * self.size[0]
-    self.view2.interactive = False # disable so that it won't be selectable
     # Connect the Colorbar visual to the secondary ViewBox.
+    self.colorbar = colorbar
     if colorbar is not None:
       colorbar.parent = self.view2
       # Pad a gap horizontally, and put the bar in the middle vertically.
@@ -83,31 +196,11 @@ class SeismicCanvas(scene.SceneCanvas):
       colorbar.canvas_size = self.size
       self.events.resize.connect(colorbar.on_resize)
 
-    # Manage the selected visual node.
-    self.drag_mode = False
-    self.selected = None # no selection by default
-    self.hover_on = None # visual node that mouse hovers on, None by default
-
-    # Automatically set the range of the canvas, display, and wrap up.
-    if auto_range: self.camera.set_range()
-    # Record the scale factor for a consistent camera reset.
-    self.scale_factor = self.camera.scale_factor
-    # Zoom in or out after auto range setting.
-    self.zoom_factor = zoom_factor
-    self.camera.scale_factor /= self.zoom_factor
-    self.show()
-    self.freeze()
-
   def on_mouse_press(self, event):
     # Hold <Ctrl> to enter drag mode or press <d> to toggle.
     if keys.CONTROL in event.modifiers or self.drag_mode:
-      # Temporarily disable the interactive flag of the ViewBox because it
-      # is masking all the visuals. See details at:
-      # https://github.com/vispy/vispy/issues/1336
-      self.view.interactive = False
-      hover_on = self.visual_at(event.pos)
-
       if event.button == 1 and self.selected is None:
+        hover_on = self.pick(event.pos)
         # If no previous selection, make a new selection if cilck on a valid
         # visual node, and highlight this node.
         if hover_on is not None:
@@ -118,13 +211,14 @@ class SeismicCanvas(scene.SceneCanvas):
 
         # Nothing to do if the cursor is NOT on a valid visual node.
 
-      # Reenable the ViewBox interactive flag.
-      self.view.interactive = True
-
   def on_mouse_release(self, event):
     # Hold <Ctrl> to enter drag mode or press <d> to toggle.
     if keys.CONTROL in event.modifiers or self.drag_mode:
       if self.selected is not None:
+        # Show the full resolution again if the slice was dragged coarsely.
+        if isinstance(self.selected, AxisAlignedImage):
+          self.update_scheduler.flush(frame=False) # last pending move
+          self.selected.refine()
         # Erase the anchor point on this node.
         self.selected.anchor = None
         # Then, deselect any previous selection.
@@ -133,18 +227,25 @@ class SeismicCanvas(scene.SceneCanvas):
   def on_mouse_move(self, event):
     # Hold <Ctrl> to enter drag mode or press <d> to toggle.
     if keys.CONTROL in event.modifiers or self.drag_mode:
-      # Temporarily disable the interactive flag of the ViewBox because it
-      # is masking all the visuals. See details at:
-      # https://github.com/vispy/vispy/issues/1336
-      self.view.interactive = False
-      hover_on = self.visual_at(event.pos)
-
       if event.button == 1:
+        # No picking while dragging, the selection does not change.
         if self.selected is not None:
-          self.selected.drag_visual_node(event)
+          if self.coalesce_updates \
+              and isinstance(self.selected, AxisAlignedImage):
+            # Only record the target, the move is applied at the next frame.
+            if self.frame_stats is not None:
+              with self.frame_stats.timer('drag'):
+                target = self.selected.drag_target(event)
+            else:
+              target = self.selected.drag_target(event)
+            if self.update_scheduler.request(self.selected, target):
+              self.update()
+          else:
+            self.selected.drag_visual_node(event)
       else:
         # If the left cilck is released, update highlight to the new visual
         # node that mouse hovers on.
+        hover_on = self.pick(event.pos)
         if hover_on != self.hover_on:
           if self.hover_on is not None: # de-highlight previous hover_on
             self.hover_on.highlight.visible = False
@@ -152,6 +253,27 @@ class SeismicCanvas(scene.SceneCanvas):
           if self.hover_on is not None: # highlight the new hover_on
             self.hover_on.highlight.visible = True
 
+  def pick(self, pos):
+    """ The draggable visual node (a slice or the axis legend) at the canvas
+    position pos (logical pixels), or None. Picked on the CPU if
+    cpu_picking is set and the scene allows it, otherwise with a picking
+    render.
+    """
+    if self.frame_stats is not None:
+      with self.frame_stats.timer('pick'):
+        return self._pick(pos)
+    return self._pick(pos)
+
+  def _pick(self, pos):
+    if self.cpu_picking and self.picker.supports():
+      return self.picker.pick(pos)
+    # Temporarily disable the interactive flag of the ViewBox because it
+    # is masking all the visuals. See details at:
+    # https://github.com/vispy/vispy/issues/1336
+    self.view.interactive = False
+    try:
+      return self.visual_at(pos)
+    finally:
       # Reenable the ViewBox interactive flag.
       self.view.interactive = True
 
@@ -177,8 +299,7 @@ class SeismicCanvas(scene.SceneCanvas):
           child._update_axis()
     # Press <s> to save a screenshot.
     if event.text == 's':
-      screenshot = _screenshot()
-      io.write_png(self.title + '.png', screenshot)
+      self.save_screenshot().add_done_callback(_report_write_error)
     # Press <d> to toggle drag mode.
     if event.text == 'd':
       if not self.drag_mode:
@@ -190,32 +311,255 @@ class SeismicCanvas(scene.SceneCanvas):
         self._exit_drag_mode()
         self.camera.viewbox.events.mouse_move.connect(
           self.camera.viewbox_mouse_event)
+    # Press <p> to save the frame stats.
+    if event.text == 'p' and self.frame_stats is not None:
+      filenames = self.frame_stats.save(self.title + '_stats')
+      print('Frame stats saved to {}'.format(', '.join(filenames)))
     # Press <a> to get the parameters of all visual nodes.
     if event.text == 'a':
+      state = self.get_view_state()
       print("===== All useful parameters ====")
       # Canvas size.
-      print("Canvas size = {}".format(self.size))
+      print("Canvas size = {}".format(state['size']))
       # Collect camera parameters.
       print("Camera:")
-      camera_state = self.camera.get_state()
-      for key, value in camera_state.items():
+      for key, value in state['camera'].items():
         print(" - {} = {}".format(key, value))
-      print(" - {} = {}".format('zoom factor', self.zoom_factor))
+      print(" - {} = {}".format('zoom factor', state['zoom_factor']))
       # Collect slice parameters.
       print("Slices:")
-      pos_dict = {'x':[], 'y':[], 'z':[]}
-      for node in self.view.scene.children:
-        if type(node) == AxisAlignedImage:
-          pos = node.pos
-          if node.seismic_coord_system and node.axis in ['y', 'z']:
-            pos = node.limit[1] - pos # revert y and z axis
-          pos_dict[node.axis].append(pos)
-      for axis, pos in pos_dict.items():
+      for axis, pos in state['slices'].items():
         print(" - {}: {}".format(axis, pos))
       # Collect the axis legend parameters.
+      if state['xyz_axis_loc'] is not None:
+        print("XYZAxis loc = {}".format(state['xyz_axis_loc']))
+
+  def get_view_state(self):
+    """ Get the parameters that reproduce the current view (the ones
+    printed with the <a> key) as a JSON serializable dict: the canvas size,
+    camera state, zoom factor, slice positions (in the coordinates given to
+    volume_slices) and axis legend location. See 'set_view_state'.
+    """
+    pos_dict = {'x':[], 'y':[], 'z':[]}
+    for node in self.view.scene.children:
+      if isinstance(node, AxisAlignedImage):
+        pos = node.pos
+        if node.seismic_coord_system and node.axis in ['y', 'z']:
+          pos = node.limit[1] - pos # revert y and z axis
+        pos_dict[node.axis].append(int(pos))
+    camera_state = {}
+    for key, value in self.camera.get_state().items():
+      if isinstance(value, tuple): value = [float(v) for v in value]
+      camera_state[key] = value
+    xyz_axis_loc = None
+    for node in self.view.children:
+      if isinstance(node, XYZAxis):
+        xyz_axis_loc = [float(v) for v in node.loc]
+    return {'size': list(self.size), 'camera': camera_state,
+            'zoom_factor': self.zoom_factor, 'slices': pos_dict,
+            'xyz_axis_loc': xyz_axis_loc}
+
+  def set_view_state(self, state):
+    """ Restore a view saved by 'get_view_state' (e.g. loaded from JSON).
+    The slices are matched by axis, in the order they were added.
+    """
+    if 'size' in state:
+      self.size = tuple(state['size'])
+    if 'camera' in state:
+      self.camera.set_state({key: tuple(value) if isinstance(value, list)
+                             else value
+                             for key, value in state['camera'].items()})
+    if 'slices' in state:
+      nodes = {'x':[], 'y':[], 'z':[]}
+      for node in self.view.scene.children:
+        if isinstance(node, AxisAlignedImage):
+          nodes[node.axis].append(node)
+      for axis, positions in state['slices'].items():
+        for node, pos in zip(nodes[axis], positions):
+          if node.seismic_coord_system and node.axis in ['y', 'z']:
+            pos = node.limit[1] - pos
+          node.move_to(pos)
+    if state.get('xyz_axis_loc') is not None:
       for node in self.view.children:
-        if type(node) == XYZAxis:
-          print("XYZAxis loc = {}".format(node.loc))
+        if isinstance(node, XYZAxis):
+          node.loc = tuple(state['xyz_axis_loc'])
+          node._update_axis()
+
+  def save_screenshot(self, filename=None):
+    """ Capture the canvas and save it to filename (default: the canvas
+    title, with the extension of screenshot_format). The image is encoded
+    and written on a background thread, so this returns as soon as the
+    pixels are read back; call 'image_writer.wait()' to make sure that all
+    the screenshots are written, e.g. at the end of a scripted sequence.
+
+    Returns a Future of the written filename.
+    """
+    if filename is None:
+      # Not guessed from the title, which may contain dots ('F3 v1.2').
+      filename = self.title + '.' + self.image_writer.format
+    return self.image_writer.submit(filename, _screenshot())
+
+  def export_image(self, filename, scale=4, tile_size=1024, alpha=True,
+                   compression=6):
+    """ Save the scene at a higher resolution than the window, e.g. 8k ~
+    16k pixels wide for publications and posters. The scene is rendered
+    offscreen as a grid of tiles (each tile is a sub-region of the canvas
+    rendered at full output resolution), and the tiles are written to the
+    file row by row, so the memory usage is bounded by one row of tiles
+    (tile_size x output width pixels) whatever the output size.
+
+    Parameters:
+    filename: str, the image file, '.png' or '.tif'/'.tiff'.
+    scale: float, output size / canvas size.
+    tile_size: int, edge length of the tiles in output pixels.
+    alpha: bool, save the alpha channel (RGBA) or not (RGB).
+    compression: int, zlib compression level (0 ~ 9).
+
+    Returns the output size (width, height).
+    """
+    canvas_w, canvas_h = self.size
+    width = int(round(canvas_w * scale))
+    height = int(round(canvas_h * scale))
+    sx, sy = canvas_w / width, canvas_h / height # canvas px per output px
+    channels = 4 if alpha else 3
+    with open_image_writer(filename, width, height, channels=channels,
+                           compression=compression) as writer:
+      band = np.empty((min(tile_size, height), width, channels),
+                      dtype=np.uint8)
+      for y0 in range(0, height, tile_size):
+        th = min(tile_size, height - y0)
+        for x0 in range(0, width, tile_size):
+          tw = min(tile_size, width - x0)
+          tile = self._render_tile((x0 * sx, y0 * sy, tw * sx, th * sy),
+                                   (tw, th))
+          band[:th, x0:x0+tw] = tile[:, :, :channels]
+        writer.write_rows(band[:th])
+    return width, height
+
+  def _render_tile(self, region, size):
+    """ Render the region (x, y, w, h) of the canvas (logical pixels, from
+    the top-left corner) into an image of the given size (w, h). Same as
+    'render(region, size)', which in the supported vispy versions (see
+    setup.py) ignores the region offset and does not scale the scene when
+    size differs from the region size, hence the framebuffer transform is
+    configured here directly (public TransformSystem and canvas API only).
+    """
+    ps = self.pixel_scale
+    fb_height = self.physical_size[1]
+    x, y, w, h = region
+    # The framebuffer origin is at the bottom-left corner.
+    fb_rect = (x * ps, fb_height - (y + h) * ps, w * ps, h * ps)
+    fbo = gloo.FrameBuffer(color=gloo.RenderBuffer(size[::-1]),
+                           depth=gloo.RenderBuffer(size[::-1]))
+    self.set_current()
+    self.push_fbo(fbo, fb_rect[:2], fb_rect[2:])
+    try:
+      self.transforms.configure(viewport=(0, 0) + tuple(size),
+                                fbo_size=tuple(size), fbo_rect=fb_rect)
+      self.context.clear(color=self.bgcolor, depth=True)
+      self.draw_visual(self.scene)
+      return fbo.read()
+    finally:
+      self.pop_fbo()
+
+  def set_frame_stats(self, frame_stats=True, overlay=None):
+    """ Start (or stop) recording the stage timings of every frame.
+
+    Parameters:
+    frame_stats: bool or FrameStats, True creates a FrameStats, False
+      stops recording.
+    overlay: bool or None, show the summary on the canvas; None keeps the
+      current setting.
+    """
+    if frame_stats is True:
+      frame_stats = FrameStats()
+    elif frame_stats is False:
+      frame_stats = None
+    elif not (frame_stats is None or isinstance(frame_stats, FrameStats)):
+      raise ValueError('Wrong type of frame_stats={}'.format(frame_stats))
+    self.frame_stats = frame_stats
+    for node in self.visual_nodes:
+      if isinstance(node, AxisAlignedImage):
+        node.stats = frame_stats
+
+    if overlay is None:
+      overlay = self.stats_overlay is not None
+    if overlay and frame_stats is not None:
+      if self.stats_overlay is None:
+        # Parent to the view (not view.scene), so it stays on the screen.
+        # The text is anchored at its last line, one line per stage.
+        self.stats_overlay = scene.visuals.Text('', parent=self.view,
+          pos=(8, 8 + 12 * len(STAGES)), anchor_x='left', anchor_y='top',
+          font_size=7, color='gray')
+    elif self.stats_overlay is not None:
+      self.stats_overlay.parent = None
+      self.stats_overlay = None
+    self.update()
+
+  @property
+  def update_stats(self):
+    """ The counters of the coalesced slice updates: mouse move events
+    received, no-op moves skipped, frames drawn and slice updates applied.
+    """
+    return self.update_scheduler.stats
+
+  def _on_close(self, event):
+    self.image_writer.close() # finish writing the pending screenshots
+
+  def _flush_updates(self, event):
+    if self.frame_stats is not None:
+      with self.frame_stats.timer('update'):
+        self.update_scheduler.flush()
+    else:
+      self.update_scheduler.flush()
+
+  def update(self, node=None):
+    """ Schedule a redraw, except for the changes of the stats overlay made
+    at the beginning of a draw, which are drawn in that same frame.
+    """
+    # (getattr: also called by SceneCanvas.__init__, before it is set)
+    if getattr(self, '_refreshing_overlay', False):
+      return
+    scene.SceneCanvas.update(self, node)
+
+  def _on_draw_begin(self, event):
+    if self.frame_stats is None:
+      return
+    self._draw_start = time.perf_counter()
+    if self.stats_overlay is not None \
+        and self._draw_start - self._overlay_updated > 0.5:
+      # This frame is being drawn anyway, do not let the text change
+      # schedule another one.
+      self._refreshing_overlay = True
+      try:
+        self.stats_overlay.text = self.frame_stats.format_summary(last=60)
+      finally:
+        self._refreshing_overlay = False
+      self._overlay_updated = self._draw_start
+
+  def _on_draw_end(self, event):
+    if self.frame_stats is None or self._draw_start is None:
+      return
+    self.frame_stats.end_frame(time.perf_counter() - self._draw_start)
+    self._draw_start = None
+
+  def _on_camera_move(self, event):
+    if not self.lod_meshes:
+      return
+    # Screen pixels per scene unit at the camera center.
+    pixels_per_unit = self.view.size[1] / self.camera.scale_factor
+    for mesh in self.lod_meshes:
+      mesh.set_level(mesh.level_for_scale(pixels_per_unit))
+    if self._camera_idle_timer is None:
+      self._camera_idle_timer = app.Timer(interval=self.mesh_lod_idle,
+        iterations=1, connect=self._on_camera_idle, start=False)
+    self._camera_idle_timer.stop()
+    self._camera_idle_timer.start() # restart the idle countdown
+
+  def _on_camera_idle(self, event):
+    # Show the full detail once the camera stops.
+    if any([mesh.set_level(0) for mesh in self.lod_meshes]):
+      self.update()
 
   def on_key_release(self, event):
     # Cancel selection and highlight if release <Ctrl>.
@@ -227,6 +571,17 @@ class SeismicCanvas(scene.SceneCanvas):
       self.hover_on.highlight.visible = False
       self.hover_on = None
     if self.selected is not None:
+      if isinstance(self.selected, AxisAlignedImage):
+        self.selected.refine()
       self.selected.highlight.visible = False
       self.selected.anchor = None
       self.selected = None
+
+
+def _report_write_error(future):
+  """ Report the error of a screenshot written in the background (<s> key).
+  """
+  error = future.exception()
+  if error is not None:
+    warnings.warn('Failed to save the screenshot: {}'.format(error),
+                  RuntimeWarning)
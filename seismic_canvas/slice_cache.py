@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SliceCache(object):
+  """ A byte-budgeted LRU cache of 2D slice images. The slicing functions
+  generated by volume_slices look up this cache before touching the volume,
+  so that dragging back and forth over the same slices does not repeat the
+  (memmap) reads and the preprocessing functions.
+
+  The keys are tuples (volume token, preproc token, axis, index, ...), see
+  'token' for how the volumes and the preprocessing functions are identified.
+
+  Parameters:
+  max_bytes: int, the total size of the cached arrays is kept below this
+    budget by evicting the least recently used slices.
+  """
+  def __init__(self, max_bytes=512*1024**2):
+    self.max_bytes = int(max_bytes)
+    self.nbytes = 0 # bytes currently held by the cache
+    self._entries = OrderedDict() # key -> np array, ordered by last use
+    self._lock = threading.RLock()
+    # Owner (volume or function) tokens, see 'token'.
+    self._tokens = {}
+    self._pinned = [] # owners that cannot be weak referenced
+    # Keys being loaded by some thread -> threading.Event set when done.
+    self._loading = {}
+
+    # Counters.
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    with self._lock:
+      return key in self._entries
+
+  def token(self, obj):
+    """ Get a hashable token that identifies obj (a volume or a preprocessing
+    function) inside the cache keys. Unlike id(obj) alone, the entries are
+    dropped as soon as obj is garbage collected, so that a new object that
+    reuses the same id() will never read stale slices.
+    """
+    if obj is None:
+      return None
+    obj_id = id(obj)
+    with self._lock:
+      if obj_id not in self._tokens:
+        try:
+          weakref.finalize(obj, self._forget, obj_id)
+        except TypeError:
+          # Not weak referenceable: keep it alive as long as the cache does.
+          self._pinned.append(obj)
+        self._tokens[obj_id] = obj_id
+    return obj_id
+
+  def get(self, key):
+    """ Return the cached slice of key, or None if it is not cached.
+    """
+    with self._lock:
+      value = self._entries.get(key)
+      if value is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key) # mark as most recently used
+      self.hits += 1
+      return value
+
+  def put(self, key, value):
+    """ Cache a slice. The array is stored read-only so that the callers
+    cannot modify the shared copy by accident.
+    """
+    value = np.asarray(value)
+    value.setflags(write=False)
+    with self._lock:
+      if key in self._entries:
+        self.nbytes -= self._entries.pop(key).nbytes
+      if value.nbytes > self.max_bytes:
+        return value # too large to be cached at all
+      self._entries[key] = value
+      self.nbytes += value.nbytes
+      self._evict()
+    return value
+
+  def fetch(self, key, load_func, copy_views=True):
+    """ Return the cached slice of key; on a miss, call load_func() to get
+    the slice, then cache and return it. If another thread (e.g. a
+    SlicePrefetcher worker) is already loading the same key, wait for it
+    instead of loading the slice twice.
+
+    Parameters:
+    copy_views: bool, cache a copy of the views returned by load_func. False
+      caches them as they are, for the views of buffers that load_func owns
+      (e.g. a freshly decompressed chunk).
+    """
+    with self._lock:
+      value = self.get(key)
+      if value is not None:
+        return value
+      loading = self._loading.get(key)
+      if loading is None: # nobody is loading it, we will do it
+        loading = self._loading[key] = threading.Event()
+        is_loader = True
+      else:
+        is_loader = False
+
+    if not is_loader:
+      loading.wait()
+      with self._lock:
+        value = self._entries.get(key)
+      if value is not None:
+        return value
+      # The other loader failed, or the slice is too large to be cached.
+
+    try:
+      value = np.asarray(load_func())
+      if copy_views and value.base is not None:
+        # A view (e.g. of a memmap, which would defer the disk reads, or of
+        # the caller's volume): cache a copy. New arrays are kept as is.
+        value = value.copy()
+      value = self.put(key, value)
+    finally:
+      if is_loader:
+        with self._lock:
+          del self._loading[key]
+        loading.set()
+    return value
+
+  def clear(self):
+    """ Drop all cached slices (the counters are kept).
+    """
+    with self._lock:
+      self._entries.clear()
+      self.nbytes = 0
+
+  def reset_stats(self):
+    with self._lock:
+      self.hits = self.misses = self.evictions = 0
+
+  @property
+  def stats(self):
+    """ A dict of the cache counters, for monitoring the hit rate.
+    """
+    with self._lock:
+      n_lookups = self.hits + self.misses
+      return {'hits': self.hits, 'misses': self.misses,
+              'evictions': self.evictions,
+              'hit_rate': self.hits / n_lookups if n_lookups else 0.,
+              'entries': len(self._entries),
+              'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+  def _evict(self):
+    while self.nbytes > self.max_bytes and self._entries:
+      _, value = self._entries.popitem(last=False) # least recently used
+      self.nbytes -= value.nbytes
+      self.evictions += 1
+
+  def _forget(self, obj_id):
+    """ Remove all entries whose keys refer to a collected owner.
+    """
+    with self._lock:
+      self._tokens.pop(obj_id, None)
+      for key in [k for k in self._entries if obj_id in k[:2]]:
+        self.nbytes -= self._entries.pop(key).nbytes
+
+
+# The cache shared by all volume_slices by default.
+_default_cache = None
+
+def get_default_cache():
+  """ Get the SliceCache shared by all volume_slices calls by default.
+  """
+  global _default_cache
+  if _default_cache is None:
+    _default_cache = SliceCache()
+  return _default_cache
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class _DragState(object):
+  """ Drag history of one AxisAlignedImage, used by SlicePrefetcher.
+  """
+  def __init__(self):
+    self.pos = None # last observed position
+    self.direction = 0 # -1, 0 or +1
+    self.speed = 1. # smoothed number of slices moved per update
+    self.futures = {} # position -> Future of the prefetch task
+
+
+class SlicePrefetcher(object):
+  """ Read the slices ahead of a dragged AxisAlignedImage on background
+  threads. Every time the image moves, the prefetcher estimates the drag
+  direction and speed, then calls the image functions at the next positions
+  on a worker thread. The image functions store their results in the slice
+  cache (see volume_slices), so that when the image arrives there, the slice
+  is already waiting in memory.
+
+  Parameters:
+  depth: int, number of positions to read ahead of the dragged image.
+  n_workers: int, number of worker threads.
+  cancel_on_reverse: bool, cancel the pending reads when the drag direction
+    is reversed (they are behind the image now).
+  speed_smoothing: float in (0, 1], weight of the latest step in the
+    exponential moving average of the drag speed.
+  """
+  def __init__(self, depth=4, n_workers=2, cancel_on_reverse=True,
+               speed_smoothing=0.5):
+    self.depth = depth
+    self.n_workers = n_workers
+    self.cancel_on_reverse = cancel_on_reverse
+    self.speed_smoothing = speed_smoothing
+
+    self._executor = None # created on first use
+    self._states = weakref.WeakKeyDictionary() # image node -> _DragState
+    self._lock = threading.Lock()
+
+    # Counters.
+    self.issued = 0 # prefetch tasks submitted
+    self.cancelled = 0 # tasks cancelled before they started
+    self.hits = 0 # arrived at a position that was already prefetched
+    self.late = 0 # arrived at a position that was still being prefetched
+    self.misses = 0 # arrived at a position that was never prefetched
+
+  def observe(self, node, pos, level=0):
+    """ Tell the prefetcher that node (an AxisAlignedImage) has been moved to
+    pos. This records whether pos was prefetched in time, then schedules the
+    reads ahead of the node, at the given level of detail.
+    """
+    pos = int(np.round(pos))
+    with self._lock:
+      state = self._states.get(node)
+      if state is None:
+        state = self._states[node] = _DragState()
+      if state.pos is None or pos == state.pos:
+        state.pos = pos
+        return
+
+      # Statistics: was the slice waiting for us?
+      future = state.futures.pop(pos, None)
+      if future is None:
+        self.misses += 1
+      elif future.done():
+        self.hits += 1
+      else:
+        self.late += 1
+
+      # Update the direction and speed estimation.
+      step = pos - state.pos
+      direction = int(np.sign(step))
+      if direction != state.direction:
+        if self.cancel_on_reverse:
+          self._cancel(state)
+        else: # let them finish, but they are behind the node now
+          state.futures.clear()
+        state.speed = abs(step)
+      else:
+        state.speed += self.speed_smoothing * (abs(step) - state.speed)
+      state.direction = direction
+      state.pos = pos
+
+      # Forget the tasks that are already behind the node.
+      for p in [p for p in state.futures if (p - pos) * direction <= 0]:
+        self._discard(state, p)
+
+      # Read ahead 'depth' positions, spaced by the current drag speed.
+      stride = max(1, int(np.round(state.speed)))
+      for k in range(1, self.depth + 1):
+        p = pos + direction * stride * k
+        if node.limit is not None \
+            and (p < node.limit[0] or p > node.limit[1]):
+          break
+        if p not in state.futures:
+          state.futures[p] = self._submit(node.image_funcs, p, level)
+
+  def forget(self, node):
+    """ Cancel the pending reads of node and reset its drag history, e.g.
+    when the drag is finished.
+    """
+    with self._lock:
+      state = self._states.pop(node, None)
+      if state is not None:
+        self._cancel(state)
+
+  def shutdown(self, wait=True):
+    """ Stop the worker threads.
+    """
+    with self._lock:
+      for state in self._states.values():
+        self._cancel(state)
+      self._states.clear()
+      executor, self._executor = self._executor, None
+    if executor is not None:
+      executor.shutdown(wait=wait)
+
+  def reset_stats(self):
+    with self._lock:
+      self.issued = self.cancelled = 0
+      self.hits = self.late = self.misses = 0
+
+  @property
+  def stats(self):
+    """ A dict of the prefetching counters. 'hit_rate' is the fraction of
+    drag steps that found their slices already prefetched.
+    """
+    with self._lock:
+      n_steps = self.hits + self.late + self.misses
+      return {'issued': self.issued, 'cancelled': self.cancelled,
+              'hits': self.hits, 'late': self.late, 'misses': self.misses,
+              'hit_rate': self.hits / n_steps if n_steps else 0.}
+
+  def _submit(self, image_funcs, pos, level):
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(max_workers=self.n_workers,
+                                          thread_name_prefix='prefetch')
+    self.issued += 1
+    return self._executor.submit(_load_slices, image_funcs, pos, level)
+
+  def _discard(self, state, pos):
+    if state.futures.pop(pos).cancel():
+      self.cancelled += 1
+
+  def _cancel(self, state):
+    for p in list(state.futures):
+      self._discard(state, p)
+
+
+def _load_slices(image_funcs, pos, level):
+  """ The prefetch task: calling the image functions at pos puts the slices
+  into the slice cache.
+  """
+  for image_func in image_funcs:
+    if level > 0:
+      image_func(pos, level=level)
+    else:
+      image_func(pos)
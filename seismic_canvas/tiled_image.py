@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from vispy import scene, app
+from vispy.visuals.transforms import STTransform
+
+from .axis_aligned_image import AxisAlignedImage, build_pending_textures
+
+
+class TiledAxisAlignedImage(AxisAlignedImage):
+  """ An AxisAlignedImage split into square tiles, for slices too large for
+  one texture (or to upload at once). Each tile is a separate Image visual,
+  fetched lazily from the image functions with only its region of the
+  slice, and decimated to match its size on the screen: the tiles far away
+  are loaded coarse, the ones close to the camera at full resolution. Only
+  the visible tiles are loaded, the ones closest to the screen center
+  first, on background threads, so the UI never waits for a whole slice.
+
+  The image functions must accept 'region=(a0, a1, b0, b1)' (the part
+  [a0:a1, b0:b1] of the slice, in full resolution indexes) together with
+  'level', as the ones from volume_slices(..., tile_size=...) do.
+
+  Parameters:
+  tile_size: int, edge length of the tiles in full resolution pixels, at
+    most the maximum texture size of the GPU.
+  n_workers: int, threads fetching the tiles. 0 fetches them while drawing,
+    at most max_loads_per_frame per frame (None: all the visible tiles, e.g.
+    to render offscreen).
+  max_loads_per_frame: int or None, number of tile fetches started per
+    frame, so that the tiles follow the camera without queueing up.
+  max_tiles: int, the number of loaded tiles (per image) is limited to
+    max_tiles, the ones not visible for the longest time are released.
+  Other parameters: see AxisAlignedImage ('prefetcher' is not supported).
+  """
+  def __init__(self, image_funcs, tile_size=512, n_workers=2,
+               max_loads_per_frame=4, max_tiles=256, **kwargs):
+    if kwargs.get('prefetcher') is not None:
+      raise ValueError('The tiles of TiledAxisAlignedImage cannot be ' +
+                       'prefetched, prefetcher must be None.')
+    # Set before AxisAlignedImage.__init__, which moves to the position.
+    self._tiles = None
+    AxisAlignedImage.__init__(self, image_funcs, **kwargs)
+    self.unfreeze()
+
+    self.tile_size = tile_size
+    self.n_workers = n_workers
+    self.max_loads_per_frame = max_loads_per_frame
+    self.max_tiles = max_tiles
+    # Coarsest level: tiles of at least 16 x 16 samples.
+    self.max_level = max(int(np.log2(tile_size)) - 4, 0)
+
+    # The tile grid over the full resolution image (width, height).
+    width, height = self.image_shape
+    self.a_edges = np.append(np.arange(0, width, tile_size), width)
+    self.b_edges = np.append(np.arange(0, height, tile_size), height)
+    self.grid_shape = (len(self.a_edges) - 1, len(self.b_edges) - 1)
+
+    # {(i_img, ta, tb): tile state dict} of the tiles created so far.
+    self._tiles = {}
+    self._executor = None # created at the first fetch
+    self._pending = {} # {(i_img, ta, tb): (future, pos, level)}
+    self._has_work = False # tiles left to fetch at the last draw
+    self._new_tiles = False # tiles created while drawing, shown next frame
+    self._n_draws = 0
+    self._poll_timer = None # redraws while tiles are being fetched
+
+    self.freeze()
+
+  def _lod_scale(self):
+    # The tiles are scaled by their own transforms, the image itself is
+    # always in full resolution units.
+    return np.ones(2)
+
+  def _update_images(self):
+    """ The tiles are fetched at the next draw for the new position.
+    """
+    if self._tiles is not None:
+      self.update()
+
+  def set_clim(self, clim, i_img=0):
+    """ Change the clim of the i-th image (0: primary image, 1~: overlaid
+    images). Quantized tiles are fetched again.
+    """
+    self.clims[i_img] = clim
+    if self._quantize_dtype is None:
+      self.overlaid_images[i_img].clim = clim # for the new tiles
+    for (i, _, _), tile in self._tiles.items():
+      if i != i_img:
+        continue
+      if self._quantize_dtype is None:
+        tile['image'].clim = clim
+      else:
+        tile['loaded'] = None # quantized against the previous clim
+    self.update()
+
+  def _prepare_draw(self, view):
+    """ Show the fetched tiles, and fetch the visible tiles that are not
+    loaded at the position and level of detail they need.
+    """
+    self._n_draws += 1
+    self._collect()
+    needed = self._needed_tiles(view)
+
+    # Start the fetches, the tiles closest to the screen center first.
+    n_started = 0
+    self._has_work = False
+    for key, level in needed:
+      tile = self._tiles.get(key)
+      wanted = (self.pos, level)
+      if tile is not None and tile['loaded'] == wanted:
+        continue
+      pending = self._pending.get(key)
+      if pending is not None and pending[1:] == wanted:
+        continue
+      if self.max_loads_per_frame is not None \
+          and n_started >= self.max_loads_per_frame:
+        self._has_work = True # continue at the next frame
+        break
+      self._fetch(key, level)
+      n_started += 1
+    self._evict()
+    if self.stats is not None:
+      build_pending_textures([tile['image'] for tile in self._tiles.values()],
+                             self.stats, self)
+
+    if self._pending or self._has_work or self._new_tiles:
+      if self._poll_timer is None:
+        self._poll_timer = app.Timer(interval=1/60., connect=self._on_poll,
+                                     start=False)
+      if not self._poll_timer.running:
+        self._poll_timer.start()
+    return False # the tiles are drawn, not this (empty) image
+
+  def _needed_tiles(self, view):
+    """ The visible tiles, as a list of ((i_img, ta, tb), level) sorted by
+    distance to the screen center, where level matches the size of the
+    tile on the screen.
+    """
+    canvas = self.canvas
+    if canvas is None:
+      return []
+    tr = view.transforms.get_transform('visual', 'canvas')
+    a, b = np.meshgrid(self.a_edges, self.b_edges, indexing='ij')
+    corners = np.stack([a.ravel(), b.ravel(), np.zeros(a.size),
+                        np.ones(a.size)], axis=1)
+    screen = tr.map(corners)
+    in_front = screen[:, 3] > 0
+    screen = screen[:, :2] / np.where(in_front, screen[:, 3], 1)[:, None]
+    screen = screen.reshape(a.shape + (2,))
+    in_front = in_front.reshape(a.shape)
+
+    # The 4 corners of every tile.
+    c00, c10 = screen[:-1, :-1], screen[1:, :-1]
+    c01, c11 = screen[:-1, 1:], screen[1:, 1:]
+    front = in_front[:-1, :-1] & in_front[1:, :-1] & \
+            in_front[:-1, 1:] & in_front[1:, 1:]
+    corners4 = np.stack([c00, c10, c01, c11])
+    lo, hi = corners4.min(axis=0), corners4.max(axis=0)
+    width, height = canvas.size
+    visible = front & (hi[..., 0] >= 0) & (lo[..., 0] <= width) & \
+              (hi[..., 1] >= 0) & (lo[..., 1] <= height)
+
+    # Full resolution pixels per screen pixel along both tile edges; the
+    # level keeps at least one sample per screen pixel along both.
+    size_a = np.diff(self.a_edges)[:, None]
+    size_b = np.diff(self.b_edges)[None, :]
+    edge_a = np.maximum(np.hypot(*(c10 - c00).T).T,
+                        np.hypot(*(c11 - c01).T).T)
+    edge_b = np.maximum(np.hypot(*(c01 - c00).T).T,
+                        np.hypot(*(c11 - c10).T).T)
+    ratio = np.minimum(size_a / np.maximum(edge_a, 1e-6),
+                       size_b / np.maximum(edge_b, 1e-6))
+    levels = np.floor(np.log2(np.maximum(ratio, 1))).astype(int)
+    levels = np.clip(levels + self.level, 0, self.max_level)
+
+    center = (c00 + c11) / 2
+    distance = np.hypot(center[..., 0] - width / 2,
+                        center[..., 1] - height / 2)
+    needed = []
+    for ta, tb in zip(*np.nonzero(visible)):
+      ta, tb = int(ta), int(tb)
+      for i_img in range(len(self.image_funcs)):
+        key = (i_img, ta, tb)
+        tile = self._tiles.get(key)
+        if tile is not None:
+          tile['last_visible'] = self._n_draws
+        needed.append((distance[ta, tb], i_img, key, int(levels[ta, tb])))
+    needed.sort(key=lambda item: item[:2])
+    return [(key, level) for _, _, key, level in needed]
+
+  def _fetch(self, key, level):
+    """ Fetch a tile, in the background if there are workers.
+    """
+    i_img, ta, tb = key
+    region = (int(self.a_edges[ta]), int(self.a_edges[ta + 1]),
+              int(self.b_edges[tb]), int(self.b_edges[tb + 1]))
+    image_func = self.image_funcs[i_img]
+    if self.n_workers == 0:
+      self._show_tile(key, self.pos, level,
+                      *_timed_fetch(image_func, self.pos, level, region))
+      return
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(max_workers=self.n_workers,
+                                          thread_name_prefix='tiles')
+    future = self._executor.submit(_timed_fetch, image_func, self.pos,
+                                   level, region)
+    self._pending[key] = (future, self.pos, level)
+
+  def _collect(self):
+    """ Show the tiles fetched in the background since the last draw.
+    """
+    for key, (future, pos, level) in list(self._pending.items()):
+      if not future.done():
+        continue
+      del self._pending[key]
+      if pos != self.pos:
+        continue # the slice has moved since
+      self._show_tile(key, pos, level, *future.result())
+
+  def _show_tile(self, key, pos, level, data, seconds):
+    """ Set the fetched data (a region of the slice decimated by 2**level)
+    to the Image visual of the tile.
+    """
+    i_img, ta, tb = key
+    if self.stats is not None:
+      self.stats.add('fetch', seconds, self)
+    # A new array for every tile, the textures are uploaded later.
+    image = np.array(data.T, dtype=np.float32, order='C')
+    if self._quantize_dtype is not None:
+      image = self._quantize(i_img, image).copy()
+
+    tile = self._tiles.get(key)
+    if tile is None:
+      source = self.overlaid_images[i_img]
+      visual = scene.visuals.Image(parent=self, cmap=source.cmap,
+                                   clim=source.clim, **self._image_kwargs)
+      visual.set_gl_state(depth_test=True, depth_func='lequal',
+        blend_func=('src_alpha', 'one_minus_src_alpha'))
+      visual.order = i_img # overlaid tiles drawn after the primary ones
+      visual.transform = STTransform()
+      tile = {'image': visual, 'loaded': None,
+              'last_visible': self._n_draws}
+      self._tiles[key] = tile
+      self._new_tiles = True # not in the draw order of the current frame
+    visual = tile['image']
+    visual.set_data(image)
+    # Scale the decimated tile up to its full resolution region.
+    a0, a1 = self.a_edges[ta], self.a_edges[ta + 1]
+    b0, b1 = self.b_edges[tb], self.b_edges[tb + 1]
+    visual.transform.scale = ((a1 - a0) / image.shape[1],
+                              (b1 - b0) / image.shape[0], 1)
+    visual.transform.translate = (a0, b0, 0)
+    tile['loaded'] = (pos, level)
+
+  def _evict(self):
+    """ Release the tiles not visible for the longest time beyond
+    max_tiles loaded tiles per image.
+    """
+    n_images = len(self.image_funcs)
+    excess = len(self._tiles) - self.max_tiles * n_images
+    if excess <= 0:
+      return
+    candidates = sorted((tile['last_visible'], key)
+                        for key, tile in self._tiles.items()
+                        if tile['last_visible'] < self._n_draws)
+    for _, key in candidates[:excess]:
+      self._tiles.pop(key)['image'].parent = None
+
+  def _on_poll(self, event):
+    if any(future.done() for future, _, _ in self._pending.values()) \
+        or self._has_work or self._new_tiles:
+      self._new_tiles = False
+      self.update()
+    if not self._pending and not self._has_work:
+      self._poll_timer.stop()
+
+  def wait(self):
+    """ Wait until the tiles being fetched are ready (they are shown at the
+    next draw).
+    """
+    for future, _, _ in list(self._pending.values()):
+      future.result()
+
+
+def _timed_fetch(image_func, pos, level, region):
+  t0 = time.perf_counter()
+  data = image_func(pos, level=level, region=region)
+  return np.asarray(data), time.perf_counter() - t0
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class UpdateScheduler(object):
+  """ Coalesce the drag updates of the slices. The mouse move events only
+  record the latest target position of each dragged node; the pending moves
+  are applied by 'flush' right before the canvas draws a frame, so that each
+  node fetches and uploads its images at most once per frame, and the moves
+  that do not change the rounded position are skipped altogether.
+
+  The node objects must provide 'pos' and 'move_to(pos)', e.g.
+  AxisAlignedImage.
+  """
+  def __init__(self):
+    self._pending = OrderedDict() # node -> target position
+
+    # Counters.
+    self.events = 0 # move requests received
+    self.noops = 0 # requests that did not change the target position
+    self.coalesced = 0 # requests replacing a pending one in the same frame
+    self.frames = 0 # flushes, i.e. frames drawn
+    self.updates = 0 # moves actually applied (fetch + upload)
+
+  @property
+  def pending(self):
+    return len(self._pending) > 0
+
+  def request(self, node, pos):
+    """ Request to move node to pos at the next frame. Returns True if a
+    redraw is needed.
+    """
+    self.events += 1
+    pos = int(np.round(pos))
+    if pos == self._pending.get(node, node.pos):
+      self.noops += 1
+      return False
+    if node in self._pending:
+      self.coalesced += 1
+    self._pending[node] = pos
+    return True
+
+  def flush(self, frame=True):
+    """ Apply the pending moves, called once per frame before drawing.
+    frame=False applies them out of the frame loop, e.g. when the drag ends.
+    """
+    if frame:
+      self.frames += 1
+    pending, self._pending = self._pending, OrderedDict()
+    for node, pos in pending.items():
+      if node.move_to(pos):
+        self.updates += 1
+
+  def reset_stats(self):
+    self.events = self.noops = self.coalesced = 0
+    self.frames = self.updates = 0
+
+  @property
+  def stats(self):
+    """ A dict of the counters. 'events_per_update' is the number of mouse
+    move events handled per actual slice update.
+    """
+    return {'events': self.events, 'noops': self.noops,
+            'coalesced': self.coalesced, 'frames': self.frames,
+            'updates': self.updates,
+            'events_per_update': self.events / self.updates
+                                 if self.updates else 0.}
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+
+
+class VolumePyramid(object):
+  """ A multi-resolution (level-of-detail) pyramid of a 3D volume. Level 0
+  is the volume itself, level k is the volume decimated by 2**k along all
+  three axes. volume_slices accepts a VolumePyramid in place of a volume,
+  and displays the coarse levels while the slices are being dragged (see
+  the 'drag_lod' parameter of volume_slices).
+
+  Parameters:
+  levels: list of 3D array-like volumes, levels[k] is the volume decimated
+    by 2**k. See 'build' and 'open' to create them.
+  """
+  def __init__(self, levels):
+    self.levels = list(levels)
+    base_shape = self.levels[0].shape
+    for k, level in enumerate(self.levels):
+      assert level.shape == _decimated_shape(base_shape, k), \
+        'Level {} has a wrong shape {}.'.format(k, level.shape)
+
+  @classmethod
+  def build(cls, volume, n_levels=3, directory=None, chunk=64):
+    """ Build the pyramid levels of volume out-of-core. Each level is
+    computed from the previous one, chunk slices at a time.
+
+    Parameters:
+    volume: 3D array-like, the full resolution volume (level 0).
+    n_levels: int, number of levels including level 0.
+    directory: str or None, if given, the levels are saved in this
+      directory as level1.npy, level2.npy, ... and memory-mapped; they can
+      be reopened later with 'VolumePyramid.open'. Otherwise the levels are
+      kept in memory.
+    """
+    if directory is not None:
+      os.makedirs(directory, exist_ok=True)
+    levels = [volume]
+    for k in range(1, n_levels):
+      src = levels[-1]
+      shape = _decimated_shape(src.shape, 1)
+      if directory is None:
+        dst = np.empty(shape, dtype=src.dtype)
+      else:
+        dst = np.lib.format.open_memmap(_level_filename(directory, k),
+          mode='w+', dtype=src.dtype, shape=shape)
+      step = 2 * chunk # source slices per chunk, must be even
+      for i0 in range(0, src.shape[0], step):
+        dst[i0//2:(i0+step)//2] = np.asarray(src[i0:i0+step])[::2, ::2, ::2]
+      if directory is not None:
+        dst.flush()
+      levels.append(dst)
+    return cls(levels)
+
+  @classmethod
+  def open(cls, volume, directory):
+    """ Open the levels saved by 'build' in directory (memory-mapped), with
+    volume as level 0.
+    """
+    levels = [volume]
+    k = 1
+    while os.path.exists(_level_filename(directory, k)):
+      levels.append(np.load(_level_filename(directory, k), mmap_mode='r'))
+      k += 1
+    return cls(levels)
+
+  @property
+  def n_levels(self):
+    return len(self.levels)
+
+  @property
+  def shape(self):
+    return self.levels[0].shape
+
+  @property
+  def dtype(self):
+    return self.levels[0].dtype
+
+  @property
+  def ndim(self):
+    return 3
+
+  def __getitem__(self, key):
+    # Indexing goes to the full resolution volume.
+    return self.levels[0][key]
+
+  def min(self):
+    return self.levels[0].min()
+
+  def max(self):
+    return self.levels[0].max()
+
+  def slice(self, axis, pos, level=0, region=None):
+    """ Get the slice at (full resolution) position pos along axis,
+    decimated by 2**level. Uses the closest precomputed level, and decimates
+    it further on the fly if the pyramid does not have that many levels.
+    region: see _decimated_slice, in full resolution indexes (the start
+    indexes must be multiples of 2**level).
+    """
+    k = min(level, self.n_levels - 1)
+    step = 2 ** (level - k)
+    if region is not None:
+      f = 2 ** k # the region in level k indexes
+      region = (region[0] // f, -(-region[1] // f),
+                region[2] // f, -(-region[3] // f))
+    return _decimated_slice(self.levels[k], axis, pos >> k, step, region)
+
+
+def _decimated_shape(shape, level):
+  f = 2 ** level
+  return tuple((n + f - 1) // f for n in shape)
+
+
+def _decimated_slice(vol, axis, pos, step, region=None):
+  """ The slice at pos along axis, decimated by step. region: (a0, a1, b0,
+  b1) or None, only get the part [a0:a1, b0:b1] of the slice (along its
+  first and second axes).
+  """
+  if region is None:
+    a = b = slice(None, None, step)
+  else:
+    a = slice(region[0], region[1], step)
+    b = slice(region[2], region[3], step)
+  if   axis == 'x': return vol[pos, a, b]
+  elif axis == 'y': return vol[a, pos, b]
+  elif axis == 'z': return vol[a, b, pos]
+
+
+def _level_filename(directory, k):
+  return os.path.join(directory, 'level{:d}.npy'.format(k))
@@ -5,23 +5,59 @@
 # Distributed under the MIT License. See LICENSE for more info.
 # -----------------------------------------------------------------------------
 
+import time
+
 import numpy as np
 from vispy import scene
 
 from .axis_aligned_image import AxisAlignedImage
+from .tiled_image import TiledAxisAlignedImage
+from .slice_cache import SliceCache, get_default_cache
+from .slice_prefetcher import SlicePrefetcher
+from .volume_pyramid import VolumePyramid, _decimated_slice
+from .volume_stats import estimate_clim
+from .frame_stats import active_stats
 
 
 def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
                   preproc_funcs=None,
                   seismic_coord_system=True,
                   cmaps='grays', clims=None,
-                  interpolation='nearest', method='auto'):
+                  interpolation='nearest', method='auto',
+                  cache=True, prefetcher=None, drag_lod=0,
+                  clim_percentiles=None, texture_format='auto',
+                  quantize=None, tile_size=None, tile_workers=2):
   """ Acquire a list of slices in the form of AxisAlignedImage.
   The list can be attached to a SeismicCanvas to visualize the volume
   in 3D interactively.
 
   Parameters:
-
+  cache: bool or SliceCache, the (preprocessed) slices are kept in a LRU
+    cache so that revisiting a slice costs nothing. True uses the cache
+    shared by all volume_slices, False disables caching.
+  prefetcher: bool or SlicePrefetcher, read the slices ahead of a dragged
+    slice on background threads into the cache. True creates a
+    SlicePrefetcher with default settings. Requires the cache.
+  drag_lod: int, level of detail shown while a slice is being dragged, the
+    slices are decimated by 2**drag_lod (full resolution is restored when
+    the mouse is released or stays idle). The decimated slices are read
+    from the precomputed levels if the volume is a VolumePyramid, otherwise
+    they are read from the volume with strides.
+  clim_percentiles: (low, high) percentiles or None, the clim of the
+    volumes whose clim is None or 'auto'. None (the same as (0, 100)) uses
+    the min and max, e.g. (1, 99) clips the outliers. The range is sampled:
+    estimated from at most 64 slices of large volumes (exact for small
+    ones), and saved next to file-backed volumes for the next launch (see
+    estimate_stats).
+  texture_format: str or None, see AxisAlignedImage.
+  quantize: None, 'uint8' or 'uint16', upload the slices as 8/16-bit
+    textures quantized against their clim, see AxisAlignedImage.
+  tile_size: int or None, if given, the slices are TiledAxisAlignedImage
+    split into tiles of tile_size x tile_size samples, loaded in the
+    background at the level of detail they are seen at. For slices larger
+    than the maximum texture size, or too large to be read at once.
+    Incompatible with the prefetcher.
+  tile_workers: int, threads loading the tiles, see TiledAxisAlignedImage.
   """
   # Check whether single volume or multiple volumes are provided.
   if isinstance(volumes, (tuple, list)):
@@ -35,7 +71,9 @@ def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
       and len(cmaps) >= n_vol
     assert isinstance(clims, (tuple, list)) \
       and len(clims) >= n_vol \
-      and len(clims[0]) == 2 or clims[0] is None
+      and all(clim is None or clim == 'auto' or len(clim) == 2
+              for clim in clims[:n_vol])
+    clims = list(clims) # do not modify the caller's list
     for vol in volumes:
       assert vol.shape == volumes[0].shape
   else:
@@ -45,11 +83,31 @@ def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
     clims = [clims]
     n_vol = 1
 
+  # Get the slice cache and the tokens identifying each volume.
+  if cache is True:
+    cache = get_default_cache()
+  elif cache is False:
+    cache = None
+  elif not isinstance(cache, SliceCache):
+    raise ValueError('Wrong type of cache={}'.format(cache))
+  if prefetcher is True:
+    prefetcher = SlicePrefetcher()
+  elif prefetcher is False:
+    prefetcher = None
+  elif not (prefetcher is None or isinstance(prefetcher, SlicePrefetcher)):
+    raise ValueError('Wrong type of prefetcher={}'.format(prefetcher))
+  if prefetcher is not None and cache is None:
+    raise ValueError('prefetcher requires the slice cache, cache cannot ' +
+                     'be False.')
+  if prefetcher is not None and tile_size is not None:
+    raise ValueError('The tiled slices (tile_size) cannot be prefetched, ' +
+                     'prefetcher must be False.')
+  if cache is not None:
+    cache_tokens = [(cache.token(volumes[i_vol]),
+                     cache.token(preproc_funcs[i_vol]))
+                    for i_vol in range(n_vol)]
+
   slices_list = []
-  # z-axis down seismic coordinate system, or z-axis up normal system.
-  if seismic_coord_system:
-    for i_vol in range(n_vol):
-      volumes[i_vol] = volumes[i_vol][:, ::-1, ::-1]
   shape = volumes[0].shape
 
   # Automatically set clim (cmap range) if not specified.
@@ -57,12 +115,8 @@ def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
     clim = clims[i_vol]
     vol = volumes[i_vol]
     if clim is None or clim=='auto':
-      if type(vol) == np.memmap:
-        from warnings import warn
-        warn("cmap='auto' with np.memmap can significantly impact launching " +
-             "time, cmap=(cmin, cmax) is recommended.",
-             UserWarning, stacklevel=2)
-      clims[i_vol] = (vol.min(), vol.max())
+      clims[i_vol] = estimate_clim(vol, percentiles=clim_percentiles
+                                   or (0, 100))
 
   # Function that returns the limitation of slice movement.
   def limit(axis):
@@ -72,24 +126,28 @@ def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
 
   # Function that returns a function that provides the slice image at
   # specified slicing position.
+  # Note: in the z-axis down seismic coordinate system, the y and z axis are
+  # reverted. The volumes are NOT flipped (that would make every slice a
+  # negative-stride view): pos is converted to the index in the volume
+  # here, and AxisAlignedImage flips the images with its transform.
   def get_image_func(axis, i_vol):
-    def slicing_at_axis(pos, get_shape=False):
+    def slicing_at_axis(pos, get_shape=False, level=0, region=None):
       if get_shape: # just return the shape information
         if   axis == 'x': return shape[1], shape[2]
         elif axis == 'y': return shape[0], shape[2]
         elif axis == 'z': return shape[0], shape[1]
       else: # will slice the volume and return an np array image
-        pos = int(np.round(pos))
-        vol = volumes[i_vol]
-        preproc_f = preproc_funcs[i_vol]
-        if preproc_f is not None:
-          if   axis == 'x': return preproc_f(vol[pos, :, :])
-          elif axis == 'y': return preproc_f(vol[:, pos, :])
-          elif axis == 'z': return preproc_f(vol[:, :, pos])
-        else:
-          if   axis == 'x': return vol[pos, :, :]
-          elif axis == 'y': return vol[:, pos, :]
-          elif axis == 'z': return vol[:, :, pos]
+        index = int(np.round(pos))
+        if seismic_coord_system and axis in ('y', 'z'):
+          index = limit(axis)[1] - index
+        if cache is None:
+          return _slice_volume(volumes[i_vol], axis, index,
+                               preproc_funcs[i_vol], level, region)
+        key = (*cache_tokens[i_vol], axis, index, level)
+        if region is not None:
+          key = key + (tuple(region),)
+        return cache.fetch(key, lambda: _slice_volume(volumes[i_vol], axis,
+          index, preproc_funcs[i_vol], level, region))
     return slicing_at_axis
 
   # Organize the slice positions.
@@ -114,11 +172,49 @@ def volume_slices(volumes, x_pos=None, y_pos=None, z_pos=None,
         for i_vol in range(n_vol):
           image_funcs.append(get_image_func(axis, i_vol))
         # Construct the AxisAlignedImage node.
-        image_node = AxisAlignedImage(image_funcs,
-          axis=axis, pos=pos, limit=limit(axis),
+        image_kwargs = dict(axis=axis, pos=pos, limit=limit(axis),
           seismic_coord_system=seismic_coord_system,
           cmaps=cmaps, clims=clims,
-          interpolation=interpolation, method=method)
+          interpolation=interpolation, method=method,
+          drag_lod=drag_lod,
+          texture_format=texture_format, quantize=quantize)
+        if tile_size is None:
+          image_node = AxisAlignedImage(image_funcs, prefetcher=prefetcher,
+                                        **image_kwargs)
+        else:
+          image_node = TiledAxisAlignedImage(image_funcs,
+            tile_size=tile_size, n_workers=tile_workers, **image_kwargs)
         slices_list.append(image_node)
 
   return slices_list
+
+
+def _slice_volume(vol, axis, pos, preproc_f=None, level=0, region=None):
+  """ Slice the volume at integer position pos along axis, decimated by
+  2**level, and apply the preprocessing function to the slice if given.
+  region: (a0, a1, b0, b1) or None, only the part [a0:a1, b0:b1] of the
+  slice (full resolution indexes, see TiledAxisAlignedImage).
+  """
+  active = active_stats() # (FrameStats, node) if the stages are recorded
+  if active is not None:
+    t0 = time.perf_counter()
+  if isinstance(vol, VolumePyramid):
+    image = vol.slice(axis, pos, level, region)
+  else:
+    image = _decimated_slice(vol, axis, pos, 2**level, region)
+  if preproc_f is not None:
+    if active is not None:
+      t1 = time.perf_counter()
+    image = preproc_f(image)
+    if active is not None:
+      t2 = time.perf_counter()
+      active[0].add('preproc', t2 - t1, active[1])
+      t0 += t2 - t1 # exclude it from 'read'
+  # Convert to native byte order here, i.e. in the prefetcher threads or
+  # before caching, rather than on each upload.
+  image = np.asarray(image)
+  if not image.dtype.isnative:
+    image = image.astype(image.dtype.newbyteorder('='))
+  if active is not None:
+    active[0].add('read', time.perf_counter() - t0, active[1])
+  return image
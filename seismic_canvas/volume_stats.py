@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Sampled statistics of (out-of-core) volumes, used to set the colormap
+range automatically. The statistics of a file-backed volume are saved in a
+sidecar file next to the data ('<filename>.stats.json'), so that opening the
+same volume again gets its clim instantly.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .out_of_core_volume import OutOfCoreVolume, memmap_offset
+
+
+def estimate_stats(vol, percentiles=(1, 99), max_samples=2**20,
+                   max_slices=64, sidecar=True):
+  """ Estimate the min, max and percentiles of a volume in bounded memory.
+  At most max_slices slices, evenly spaced along the first axis (one
+  contiguous read each for a row-major memmap), are read one at a time; the
+  min/max are taken over these slices and the percentiles over at most
+  max_samples values subsampled from them. Small volumes are read entirely,
+  so their statistics are exact.
+
+  Parameters:
+  vol: 3D array-like (np.ndarray, np.memmap, BrickedVolume, ...).
+  percentiles: sequence of percentiles (0 ~ 100) to estimate.
+  sidecar: bool, read/write the statistics from/to the sidecar file of a
+    file-backed volume (i.e. with a 'filename' attribute).
+
+  Returns a dict {'min', 'max', 'percentiles': {p: value}, 'n_samples',
+  'exact'}.
+  """
+  percentiles = [float(p) for p in percentiles]
+  filename = getattr(vol, 'filename', None) if sidecar else None
+  if isinstance(vol, np.memmap) and memmap_offset(vol) is None:
+    filename = None # not sure where the data is in the file
+  if filename is not None:
+    stats = _read_sidecar(vol, filename)
+    if stats is not None and all(str(p) in stats['percentiles']
+                                 for p in percentiles):
+      stats['percentiles'] = {p: stats['percentiles'][str(p)]
+                              for p in percentiles}
+      return stats
+
+  n0, n1, n2 = vol.shape
+  n_slices = min(n0, max_slices)
+  slice_positions = np.unique(np.linspace(0, n0-1, n_slices).astype(int))
+  # Subsample each slice with in-plane strides to respect max_samples.
+  per_slice = max(1, max_samples // len(slice_positions))
+  stride = max(1, int(np.ceil(np.sqrt(n1 * n2 / per_slice))))
+
+  samples = []
+  vmin, vmax = np.inf, -np.inf
+  for pos in slice_positions:
+    image = np.asarray(vol[int(pos)])
+    vmin = min(vmin, float(np.nanmin(image)))
+    vmax = max(vmax, float(np.nanmax(image)))
+    samples.append(image[::stride, ::stride].astype(np.float64).ravel())
+  samples = np.concatenate(samples)
+
+  stats = {'min': float(vmin), 'max': float(vmax),
+           'percentiles': dict(zip(percentiles, [float(v) for v in
+             np.nanpercentile(samples, percentiles)])),
+           'n_samples': int(samples.size),
+           'exact': bool(len(slice_positions) == n0 and stride == 1)}
+  if filename is not None:
+    _write_sidecar(vol, filename, stats)
+  return stats
+
+
+def estimate_clim(vol, percentiles=(1, 99), **kwargs):
+  """ Get a robust colormap range (clim) of a volume from its estimated
+  percentiles, see 'estimate_stats'. percentiles=(0, 100) gives the min and
+  max. The range is sampled: it is only exact for the volumes small enough
+  to be read entirely.
+  """
+  stats = estimate_stats(vol, percentiles=percentiles, **kwargs)
+  low, high = [float(p) for p in percentiles]
+  clim = (stats['min'] if low == 0 else stats['percentiles'][low],
+          stats['max'] if high == 100 else stats['percentiles'][high])
+  if clim[0] == clim[1]: # constant volume, avoid an empty range
+    clim = (clim[0] - 0.5, clim[1] + 0.5)
+  return clim
+
+
+def sidecar_filename(filename):
+  return filename + '.stats.json'
+
+
+def _file_signature(vol, filename):
+  """ Describe the data file and how the volume is read from it, the sidecar
+  is only valid for the same signature. Views of the same file (e.g.
+  vol[100:200] and vol[200:300]) have different signatures.
+  """
+  st = os.stat(filename)
+  signature = {'size': st.st_size, 'mtime': st.st_mtime,
+               'shape': list(vol.shape), 'dtype': np.dtype(vol.dtype).str,
+               'offset': int(getattr(vol, 'offset', 0))}
+  if isinstance(vol, np.memmap):
+    offset = memmap_offset(vol)
+    signature['offset'] = None if offset is None else int(offset)
+    signature['strides'] = list(vol.strides)
+  elif isinstance(vol, OutOfCoreVolume):
+    signature['ranges'] = [[r.start, r.stop, r.step] for r in vol._ranges]
+  return signature
+
+
+def _read_sidecar(vol, filename):
+  try:
+    with open(sidecar_filename(filename), 'r') as f:
+      content = json.load(f)
+    if content['signature'] != _file_signature(vol, filename):
+      return None # the data file changed, or is read differently
+    return content['stats']
+  except (OSError, ValueError, KeyError):
+    return None
+
+
+def _write_sidecar(vol, filename, stats):
+  # Merge the percentiles already saved for other requests.
+  old_stats = _read_sidecar(vol, filename)
+  percentiles = {str(p): v for p, v in stats['percentiles'].items()}
+  if old_stats is not None:
+    percentiles = dict(old_stats['percentiles'], **percentiles)
+  content = {'signature': _file_signature(vol, filename),
+             'stats': dict(stats, percentiles=percentiles)}
+  try:
+    with open(sidecar_filename(filename), 'w') as f:
+      json.dump(content, f, indent=2)
+  except OSError:
+    pass # e.g. read-only data directory, just do not persist
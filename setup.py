@@ -37,7 +37,10 @@ setup(
     # Package info
     packages=find_packages(),
     include_package_data=True,
-    install_requires=['numpy', 'vispy', 'PyQt5', 'PyOpenGL', 'matplotlib'],
+    python_requires='>=3.7',
+    # vispy 0.7 added texture_format, see AxisAlignedImage.
+    install_requires=['numpy', 'vispy>=0.7', 'PyQt5', 'PyOpenGL',
+                      'matplotlib'],
 
     zip_safe=True,
 
@@ -48,7 +51,6 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from seismic_canvas import volume_slices
+
+
+def _quantized_slice(values, quantize, clim):
+  """ A x slice of the given values (a 2D array) quantized against clim,
+  and the node showing it.
+  """
+  vol = np.asarray(values, dtype=np.float32)[None]
+  node, = volume_slices(vol, x_pos=0, clims=clim, cache=False,
+                        seismic_coord_system=False, quantize=quantize)
+  return node._data.T, node # the image is stored transposed
+
+
+@pytest.mark.parametrize('quantize', ['uint8', 'uint16'])
+def test_quantize_bounds_and_clipping(quantize):
+  levels = np.iinfo(quantize).max
+  step = 1. / levels # one quantization level, clim (0, 1)
+  values = [[0., step * 0.49, step * 0.51, 0.5],
+            [1. - step * 0.49, 1., -3., 7.],
+            [np.nan, 1. - step * 0.51, step, 1. - step]]
+  image, node = _quantized_slice(values, quantize, (0., 1.))
+  assert image.dtype == np.dtype(quantize)
+  assert node.clim == (0, levels)
+  np.testing.assert_array_equal(image, [
+    [0, 0, 1, np.round(0.5 * levels)],
+    [levels, levels, 0, levels], # clipped outside of the clim
+    [0, levels - 1, 1, levels - 1]]) # NaN shown as cmin
+
+
+def test_set_clim_requantizes():
+  values = np.linspace(-1., 1., 12).reshape(3, 4)
+  image, node = _quantized_slice(values, 'uint8', (-1., 1.))
+  np.testing.assert_array_equal(image, np.round((values + 1) / 2 * 255))
+  node.image_funcs = None # requantized without fetching the image again
+  node.set_clim((0., 0.5))
+  image = node._data.T
+  np.testing.assert_array_equal(
+    image, np.round(np.clip(values / 0.5, 0, 1) * 255))
+  assert node.clims[0] == (0., 0.5)
+  assert node.clim == (0, 255) # the displayed range stays the integers
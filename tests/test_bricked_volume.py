@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+
+from seismic_canvas import volume_slices
+from seismic_canvas.bricked_volume import BrickedVolume, convert_to_bricked
+
+
+def test_round_trip_from_big_endian_memmap(tmp_path):
+  shape = (37, 21, 18) # not multiples of the brick size
+  src = str(tmp_path / 'seismic.dat')
+  m = np.memmap(src, dtype='>f4', mode='w+', shape=shape)
+  m[:] = np.random.RandomState(0).randn(*shape)
+  m.flush()
+  del m
+  source = np.memmap(src, dtype='>f4', mode='r', shape=shape)
+
+  vol = convert_to_bricked(src, str(tmp_path / 'seismic.bvol'), shape=shape,
+                           brick_size=8)
+  assert isinstance(vol, BrickedVolume)
+  assert vol.shape == shape and vol.dtype == np.float32
+  np.testing.assert_array_equal(np.asarray(vol), source)
+  # Also from the memmap itself.
+  vol = convert_to_bricked(source, str(tmp_path / 'memmap.bvol'),
+                           brick_size=16)
+  np.testing.assert_array_equal(np.asarray(vol), source)
+
+  # The slices shown by volume_slices, at the edges and across bricks.
+  nodes = volume_slices(BrickedVolume(vol.filename), x_pos=0, y_pos=0,
+                        z_pos=0, clims=(-1, 1), cache=False,
+                        seismic_coord_system=False)
+  for node in nodes:
+    axis = 'xyz'.index(node.axis)
+    slicing_at_axis = node.image_funcs[0]
+    for pos in (0, 7, 8, 15, 16, shape[axis] - 1):
+      expected = np.take(source, pos, axis=axis)
+      np.testing.assert_array_equal(slicing_at_axis(pos), expected)
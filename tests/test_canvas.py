@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" Offscreen canvas tests, skipped without a headless OpenGL backend.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from seismic_canvas.offscreen import use_headless_backend
+
+
+@pytest.fixture(scope='module')
+def headless():
+  try:
+    use_headless_backend()
+  except RuntimeError as e:
+    pytest.skip(str(e))
+
+
+def _read_png(filename):
+  """ Decode the PNG files written by PNGWriter (8-bit, filter type 0).
+  """
+  with open(filename, 'rb') as f:
+    data = f.read()
+  pos, idat = 8, []
+  while pos < len(data):
+    length, = struct.unpack('>I', data[pos:pos+4])
+    chunk_type = data[pos+4:pos+8]
+    chunk = data[pos+8:pos+8+length]
+    if chunk_type == b'IHDR':
+      width, height, _, color_type = struct.unpack('>IIBB', chunk[:10])
+    elif chunk_type == b'IDAT':
+      idat.append(chunk)
+    pos += 12 + length
+  channels = 4 if color_type == 6 else 3
+  rows = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8)
+  rows = rows.reshape(height, 1 + width * channels)
+  assert np.all(rows[:, 0] == 0)
+  return rows[:, 1:].reshape(height, width, channels)
+
+
+def _canvas(canvas_kwargs={}, **kwargs):
+  from seismic_canvas import SeismicCanvas, volume_slices
+  vol = np.random.RandomState(0).rand(60, 50, 40).astype(np.float32)
+  nodes = volume_slices(vol, x_pos=10, y_pos=20, z_pos=30, clims=(0, 1),
+                        cache=False, **kwargs)
+  canvas = SeismicCanvas(size=(300, 200), visual_nodes=nodes, show=False,
+                         **canvas_kwargs)
+  return canvas, nodes
+
+
+def test_export_image_tiles_match_render(headless, tmp_path):
+  canvas, _ = _canvas()
+  try:
+    reference = canvas.render()
+    filename = str(tmp_path / 'export.png')
+    # Several tiles, including partial ones on the right and bottom edges.
+    assert canvas.export_image(filename, scale=1, tile_size=128) == (300, 200)
+    exported = _read_png(filename).astype(int)
+    assert np.abs(exported - reference).max(axis=-1).mean() < 1
+  finally:
+    canvas.close()
+
+
+def test_stats_overlay_does_not_schedule_frames(headless, monkeypatch):
+  from vispy import app
+  canvas, _ = _canvas(canvas_kwargs=dict(frame_stats=True,
+                                         stats_overlay=True))
+  try:
+    canvas.events.draw(region=None)
+    requests = []
+    monkeypatch.setattr(app.Canvas, 'update',
+                        lambda self, *args: requests.append(self))
+    canvas._overlay_updated = 0. # refresh the overlay at the next frame
+    canvas.events.draw(region=None)
+    assert '(1 frames)' in canvas.stats_overlay.text # refreshed
+    assert requests == []
+    # The other changes still schedule a frame.
+    canvas.stats_overlay.text = 'changed'
+    assert requests == [canvas]
+  finally:
+    canvas.close()
+
+
+def test_view_state_tiled_slices(headless):
+  canvas, nodes = _canvas(tile_size=16, tile_workers=0)
+  try:
+    state = canvas.get_view_state()
+    assert state['slices'] == {'x': [10], 'y': [20], 'z': [30]}
+    state['slices'] = {'x': [5], 'y': [25], 'z': [35]}
+    canvas.set_view_state(state)
+    assert canvas.get_view_state()['slices'] == state['slices']
+    assert [node.pos for node in nodes if node.axis == 'x'] == [5]
+  finally:
+    canvas.close()
+
+
+def test_screenshot_title_with_dots(headless, tmp_path, monkeypatch):
+  monkeypatch.chdir(tmp_path)
+  canvas, _ = _canvas(canvas_kwargs=dict(title='F3 v1.2'))
+  try:
+    canvas.render()
+    filename = canvas.save_screenshot().result()
+    assert filename == 'F3 v1.2.png'
+    assert _read_png(str(tmp_path / filename)).shape[2] in (3, 4)
+  finally:
+    canvas.close()
+
+
+def test_screenshot_errors_are_warnings():
+  from concurrent.futures import Future
+  from seismic_canvas.seismic_canvas import _report_write_error
+  future = Future()
+  future.set_exception(ValueError('Wrong image format: .2'))
+  with pytest.warns(RuntimeWarning, match='Wrong image format'):
+    _report_write_error(future)
+
+
+@pytest.mark.parametrize('axis', ['x', 'y', 'z'])
+def test_seismic_flip_matches_flipped_volume(headless, axis):
+  """ The images flipped by the transform are displayed like the slices of
+  the volume flipped along y and z, as volume_slices used to do.
+  """
+  from seismic_canvas import SeismicCanvas, volume_slices
+  vol = np.random.RandomState(1).rand(30, 40, 50).astype(np.float32)
+  flipped = np.ascontiguousarray(vol[:, ::-1, ::-1])
+  pos = {'x': 10, 'y': 15, 'z': 20}[axis]
+  if axis == 'x':
+    flipped_pos = pos
+  else:
+    flipped_pos = vol.shape['xyz'.index(axis)] - 1 - pos
+  renders = []
+  for volume, seismic, slice_pos in [(vol, True, pos),
+                                     (flipped, False, flipped_pos),
+                                     (vol, False, pos)]:
+    nodes = volume_slices(volume, clims=(0, 1), cache=False,
+                          seismic_coord_system=seismic,
+                          **{axis + '_pos': slice_pos})
+    canvas = SeismicCanvas(size=(200, 160), visual_nodes=nodes, show=False)
+    try:
+      renders.append(canvas.render().astype(int))
+    finally:
+      canvas.close()
+  seismic, baseline, unflipped = renders
+  # The same pixels, but for a few on the edges of the slice.
+  diff = np.abs(seismic - baseline).max(axis=-1)
+  assert diff.mean() < 1 and (diff > 0).mean() < 0.02
+  # The flip is visible: not the same image as without it.
+  assert np.abs(seismic - unflipped).max(axis=-1).mean() > 10
+
+
+def test_ray_picking_matches_visual_at(headless):
+  from seismic_canvas import SeismicCanvas, XYZAxis, volume_slices
+  vol = np.random.RandomState(0).rand(60, 50, 40).astype(np.float32)
+  nodes = volume_slices(vol, x_pos=10, y_pos=20, z_pos=30, clims=(0, 1),
+                        cache=False)
+  xyz_axis = XYZAxis(loc=(40, 40), size=25)
+  canvas = SeismicCanvas(size=(300, 200), visual_nodes=nodes,
+                         xyz_axis=xyz_axis, show=False)
+
+  def pick(pos):
+    canvas.cpu_picking = True
+    ray_pick = canvas.pick(pos)
+    assert canvas.picker.supports()
+    canvas.cpu_picking = False
+    return ray_pick, canvas.pick(pos) # the latter from visual_at
+
+  try:
+    canvas.render()
+    # The pixels over points of each slice, away from the lines where the
+    # slices cross (there, either slice may win the depth test).
+    for node in nodes:
+      tr = node.node_transform(canvas.scene)
+      width, height = np.asarray(node.image_shape) / node._lod_scale()
+      picked = []
+      for fx in (0.3, 0.55, 0.9):
+        for fy in (0.3, 0.55, 0.9):
+          pos = tr.map([fx * width, fy * height, 0, 1])
+          ray_pick, gpu_pick = pick(pos[:2] / pos[3])
+          assert ray_pick is gpu_pick
+          picked.append(ray_pick)
+      assert node in picked # not hidden by the other slices everywhere
+    # The center of the axis legend (drawn over the slices), and the
+    # background.
+    assert pick(xyz_axis.loc) == (xyz_axis, xyz_axis)
+    assert pick((5, 195)) == (None, None)
+    # The whole disc is picked on the CPU, not only the axis lines.
+    assert pick((55, 40))[0] is xyz_axis
+  finally:
+    canvas.close()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import threading
+
+import numpy as np
+import pytest
+
+from seismic_canvas import chunked_volume
+from seismic_canvas.chunked_volume import (ChunkedVolume, ChunkedVolumeWriter,
+                                           convert_to_chunked)
+
+
+@pytest.fixture
+def source(tmp_path):
+  shape = (37, 21, 18) # not multiples of the chunk size
+  filename = str(tmp_path / 'seismic.dat')
+  m = np.memmap(filename, dtype='>f4', mode='w+', shape=shape)
+  m[:] = np.random.RandomState(0).randn(*shape)
+  m.flush()
+  del m
+  return np.memmap(filename, dtype='>f4', mode='r', shape=shape)
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma', 'none'])
+@pytest.mark.parametrize('shuffle', [True, False])
+def test_round_trip(tmp_path, source, codec, shuffle):
+  vol = convert_to_chunked(source.filename, str(tmp_path / 'seismic.cvol'),
+                           shape=source.shape, chunk_size=8, codec=codec,
+                           shuffle=shuffle)
+  assert isinstance(vol, ChunkedVolume)
+  assert vol.shape == source.shape and vol.dtype == np.float32
+  assert (vol.codec, vol.shuffle) == (codec, shuffle)
+  np.testing.assert_array_equal(np.asarray(vol), source)
+  np.testing.assert_array_equal(vol[5, 3:17, :], source[5, 3:17, :])
+  np.testing.assert_array_equal(np.asarray(vol[:, :, 17]), source[:, :, 17])
+
+
+def test_cached_chunks_are_not_copied(tmp_path, source):
+  vol = convert_to_chunked(source, str(tmp_path / 'seismic.cvol'),
+                           chunk_size=8)
+  chunk = vol.chunk((1, 2, 0))
+  assert chunk.base is not None # a view of the decompressed buffer
+  assert not chunk.flags.writeable
+  assert vol.chunk((1, 2, 0)) is chunk
+  np.testing.assert_array_equal(chunk[:, :5], source[8:16, 16:21, :8])
+
+
+def test_concurrent_reads_share_one_pool(tmp_path, source):
+  vol = convert_to_chunked(source, str(tmp_path / 'seismic.cvol'),
+                           chunk_size=8)
+  vol = ChunkedVolume(vol.filename, cache=False, n_workers=2)
+  errors, pools = [], set()
+  start = threading.Barrier(4)
+
+  def read(i):
+    try:
+      start.wait()
+      np.testing.assert_array_equal(vol[i], source[i])
+      pools.add(id(vol._executor))
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=read, args=(i,)) for i in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert not errors and len(pools) == 1
+
+
+def test_missing_lz4(tmp_path, source, monkeypatch):
+  if chunked_volume._lz4 is not None:
+    vol = convert_to_chunked(source, str(tmp_path / 'lz4.cvol'),
+                             chunk_size=8, codec='lz4')
+    np.testing.assert_array_equal(np.asarray(vol), source)
+  monkeypatch.setattr(chunked_volume, '_lz4', None)
+  with pytest.raises(ImportError, match='lz4'):
+    ChunkedVolumeWriter(str(tmp_path / 'lz4.cvol'), source.shape,
+                        codec='lz4')
+  # A file written with lz4 cannot be opened without it.
+  filename = str(tmp_path / 'seismic.cvol')
+  with ChunkedVolumeWriter(filename, source.shape, codec='none'):
+    pass
+  with open(filename, 'rb') as f:
+    content = f.read()
+  with open(filename, 'wb') as f:
+    # Same header length, the extra space is JSON whitespace.
+    f.write(content.replace(b'"codec": "none"', b'"codec": "lz4" '))
+  with pytest.raises(ImportError, match='lz4'):
+    ChunkedVolume(filename)
+  with pytest.raises(ValueError, match='codec'):
+    ChunkedVolumeWriter(filename, source.shape, codec='gzip')
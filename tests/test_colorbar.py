@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('matplotlib')
+
+from seismic_canvas import colorbar_MPL
+from seismic_canvas.colorbar_MPL import Colorbar
+
+
+@pytest.fixture(autouse=True)
+def empty_memory_cache(monkeypatch):
+  monkeypatch.setattr(colorbar_MPL, '_memory_cache', {})
+
+
+def test_no_disk_cache_by_default(tmp_path, monkeypatch):
+  monkeypatch.setattr(colorbar_MPL, 'CACHE_DIR', str(tmp_path / 'colorbars'))
+  Colorbar(cmap='viridis', clim=(-1, 1))
+  assert not os.path.exists(str(tmp_path / 'colorbars'))
+
+
+def test_disk_cache(tmp_path):
+  directory = str(tmp_path / 'colorbars')
+  colorbar = Colorbar(cmap='viridis', clim=(-1, 1), disk_cache=directory)
+  assert len(os.listdir(directory)) == 1
+  colorbar_MPL._memory_cache.clear()
+  again = Colorbar(cmap='viridis', clim=(-1, 1), disk_cache=directory)
+  np.testing.assert_array_equal(again._data, colorbar._data)
+
+
+def test_read_only_disk_cache(tmp_path):
+  directory = tmp_path / 'read_only'
+  directory.mkdir()
+  directory.chmod(0o500)
+  try:
+    Colorbar(cmap='viridis', clim=(-1, 1), disk_cache=str(directory / 'x'))
+  finally:
+    directory.chmod(0o700)
+
+
+def test_crop_keeps_every_drawn_pixel(monkeypatch):
+  rendered = []
+  render_agg = Colorbar._render_agg
+  def spy(self, *args):
+    result = render_agg(self, *args)
+    rendered.append(result[0])
+    return result
+  monkeypatch.setattr(Colorbar, '_render_agg', spy)
+  for label in ('', 'Colorbar'):
+    image = Colorbar(cmap='grays', clim=(0, 1), label_str=label,
+                     cache=False)._data
+    # The tight crop must not cut any (partially) opaque pixel.
+    full_alpha = rendered[-1][..., 3].astype(np.float64).sum() / 255
+    assert np.isclose(image[..., 3].astype(np.float64).sum(), full_alpha)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" The fault skin reader against the original per-cell implementation
+(struct.unpack and one FaultCell object per cell), the merged mesh loader
+and the levels of detail, on synthetic skins.
+"""
+
+import os
+from struct import unpack, calcsize
+
+import numpy as np
+import pytest
+
+from seismic_canvas.fault_skin import FaultCell, FaultSkin
+
+
+def _write_skin(filename, n_rows=12, n_cols=15, holes=0.15, seed=0):
+  """ Write a skin file of a wavy n_rows x n_cols grid of cells, stored in
+  a random order, with some cells removed (holes and ragged boundaries).
+  """
+  rng = np.random.RandomState(seed)
+  keep = rng.rand(n_rows, n_cols) >= holes
+  keep[:, 0] = keep[0] = True # a (row, col) = (0, 0) cell to start from
+  rows, cols = np.nonzero(keep)
+  n = len(rows)
+  order = rng.permutation(n)
+  rows, cols = rows[order], cols[order]
+  grid = -np.ones((n_rows + 2, n_cols + 2), dtype=int) # padded with -1
+  grid[rows + 1, cols + 1] = np.arange(n)
+
+  params = np.zeros((n, 9))
+  params[:, 0] = rows + 0.1 * rng.rand(n) # z
+  params[:, 1] = cols * 0.5 + 2 * np.sin(cols / 3.) # y
+  params[:, 2] = cols * 0.8 + 0.1 * rng.rand(n) # x
+  params[:, 3:] = rng.rand(n, 6) * 90
+  r, c = rows + 1, cols + 1
+  neighbors = np.stack([grid[r-1, c], grid[r+1, c],
+                        grid[r, c-1], grid[r, c+1]], axis=1)
+
+  with open(filename, 'wb') as f:
+    f.write(np.array([n], dtype='>i4').tobytes())
+    f.write(params.astype('>f4').tobytes())
+    f.write(neighbors.astype('>i4').tobytes())
+  return n
+
+
+def _baseline_cells(filename):
+  """ The original reader: one FaultCell per cell, linked to its neighbors,
+  with the strikes smoothed cell by cell.
+  """
+  with open(filename, 'br') as f:
+    num_cells = unpack('>i', f.read(calcsize('>i')))[0]
+    fmt = '>{:d}f'.format(9 * num_cells)
+    cell_params = unpack(fmt, f.read(calcsize(fmt)))
+    cells = []
+    for i in range(num_cells):
+      param = cell_params[9*i: 9*(i+1)]
+      cells.append(FaultCell(i, pos=(param[2], param[1], param[0]),
+        likelihood=param[3], strike=param[4], dip=param[5],
+        slip=(param[8], param[7], param[6])))
+    fmt = '>{:d}i'.format(4 * num_cells)
+    cell_neighbors = unpack(fmt, f.read(calcsize(fmt)))
+  for i in range(num_cells):
+    if cell_neighbors[4*i] >= 0:
+      cells[i].above = cells[cell_neighbors[4*i]]
+    if cell_neighbors[4*i+1] >= 0:
+      cells[i].below = cells[cell_neighbors[4*i+1]]
+    if cell_neighbors[4*i+2] >= 0:
+      cells[i].left = cells[cell_neighbors[4*i+2]]
+    if cell_neighbors[4*i+3] >= 0:
+      cells[i].right = cells[cell_neighbors[4*i+3]]
+  for cell in cells:
+    cell.smooth_strike()
+  return cells
+
+
+def _index(cell):
+  return -1 if cell is None else cell.index
+
+
+@pytest.fixture
+def skin_file(tmp_path):
+  filename = str(tmp_path / 'skin0001.dat')
+  _write_skin(filename)
+  return filename
+
+
+def test_columnar_reader_matches_baseline(skin_file):
+  expected = _baseline_cells(skin_file)
+  skin = FaultSkin(skin_file)
+  assert skin.n_cells == len(skin.cells) == len(expected)
+
+  # The arrays, cell by cell.
+  np.testing.assert_array_equal(skin.pos, [c.pos for c in expected])
+  np.testing.assert_array_equal(skin.likelihood,
+                                [c.likelihood for c in expected])
+  np.testing.assert_array_equal(skin.dip, [c.dip for c in expected])
+  np.testing.assert_array_equal(skin.slip, [c.slip for c in expected])
+  np.testing.assert_array_equal(skin.neighbors,
+    [[_index(c.above), _index(c.below), _index(c.left), _index(c.right)]
+     for c in expected])
+
+  # The FaultCell-like views, with their neighbor links.
+  for view, cell in zip(skin.cells, expected):
+    assert view.index == cell.index
+    assert view.pos == cell.pos and view.slip == cell.slip
+    assert (view.likelihood, view.dip) == (cell.likelihood, cell.dip)
+    for link in ('above', 'below', 'left', 'right'):
+      assert _index(getattr(view, link)) == _index(getattr(cell, link))
+
+
+def _baseline_mesh(cells):
+  """ The original FaultSkin.get_vertices_and_faces loop.
+  """
+  vertices = np.array([cell.pos for cell in cells])
+  faces = []
+  for i, cell in enumerate(cells):
+    R = cell.right
+    if R is not None: RB = R.below
+    B = cell.below
+    if B is not None: BR = B.right
+    if R and RB:
+      faces.append([i, RB.index, R.index])
+    if B and BR:
+      faces.append([i, B.index, BR.index])
+  return vertices, np.array(faces).astype(int)
+
+
+@pytest.mark.parametrize('holes', [0., 0.15, 0.4])
+def test_vectorized_smoothing_and_triangulation(tmp_path, holes):
+  filename = str(tmp_path / 'skin.dat')
+  _write_skin(filename, holes=holes, seed=1)
+  cells = _baseline_cells(filename)
+  skin = FaultSkin(filename)
+  # Isolated cells (no left nor right neighbor) keep their strike.
+  np.testing.assert_array_equal(skin.strike, [c.strike for c in cells])
+
+  expected_vertices, expected_faces = _baseline_mesh(cells)
+  vertices, faces = skin.get_vertices_and_faces()
+  np.testing.assert_array_equal(vertices, expected_vertices)
+  np.testing.assert_array_equal(faces, expected_faces)
+  assert faces.dtype == expected_faces.dtype
+
+
+def _skin_directory(tmp_path, n_skins=3):
+  directory = tmp_path / 'skins'
+  directory.mkdir()
+  for k in range(n_skins):
+    _write_skin(str(directory / 'skin{:04d}.dat'.format(k)),
+                n_rows=8 + k, n_cols=10, seed=k)
+  (directory / 'other.dat').write_bytes(b'not a skin')
+  return str(directory)
+
+
+def _merged_one_by_one(directory, attribute='strike'):
+  from glob import glob
+  vertices, faces, values, n = [], [], [], 0
+  for filename in sorted(glob(directory + '/skin*.dat')):
+    skin = FaultSkin(filename)
+    skin_vertices, skin_faces = skin.get_vertices_and_faces()
+    vertices.append(skin_vertices)
+    faces.append(skin_faces + n)
+    values.append(getattr(skin, attribute))
+    n += skin.n_cells
+  return (np.concatenate(vertices).astype(np.float32),
+          np.concatenate(faces).astype(np.int32),
+          np.concatenate(values).astype(np.float32))
+
+
+def _assert_mesh_equal(mesh, expected):
+  for array, expected_array in zip(mesh, expected):
+    assert array.dtype == expected_array.dtype
+    np.testing.assert_array_equal(array, expected_array)
+
+
+def test_load_fault_skins_cache(tmp_path, monkeypatch):
+  from seismic_canvas import fault_skin
+  directory = _skin_directory(tmp_path)
+  cache_dir = os.path.join(directory, 'merged_skins')
+
+  # First load, in worker processes: the same as the skins one by one.
+  mesh = fault_skin.load_fault_skins(directory, n_workers=2)
+  _assert_mesh_equal(mesh, _merged_one_by_one(directory))
+  assert os.path.exists(os.path.join(cache_dir, 'manifest.json'))
+
+  # Cache hit: the skins are not read again.
+  def fail(*args):
+    raise AssertionError('the skins were read again')
+  monkeypatch.setattr(fault_skin, '_read_skin_mesh', fail)
+  cached = fault_skin.load_fault_skins(directory, n_workers=1)
+  assert all(isinstance(array, np.memmap) for array in cached)
+  _assert_mesh_equal(cached, mesh)
+  # Another attribute is not in the cache.
+  with pytest.raises(AssertionError, match='read again'):
+    fault_skin.load_fault_skins(directory, attribute='dip', n_workers=1)
+  monkeypatch.undo()
+
+  # A skin file changed: the cache is rebuilt.
+  _write_skin(os.path.join(directory, 'skin0001.dat'), n_rows=5, n_cols=7,
+              seed=10)
+  mesh = fault_skin.load_fault_skins(directory, n_workers=1)
+  _assert_mesh_equal(mesh, _merged_one_by_one(directory))
+  monkeypatch.setattr(fault_skin, '_read_skin_mesh', fail)
+  _assert_mesh_equal(fault_skin.load_fault_skins(directory, n_workers=1),
+                     mesh)
+
+
+def test_lod_faces(tmp_path):
+  filename = str(tmp_path / 'skin.dat')
+  _write_skin(filename, n_rows=33, n_cols=40, holes=0.02, seed=2)
+  skin = FaultSkin(filename)
+  vertices, faces = skin.get_vertices_and_faces()
+  lod_faces = skin.get_lod_faces(4)
+  assert len(lod_faces) == 4
+  np.testing.assert_array_equal(lod_faces[0], faces)
+  for coarse, fine in zip(lod_faces[1:], lod_faces[:-1]):
+    assert 0 < len(coarse) < len(fine)
+    assert coarse.min() >= 0 and coarse.max() < len(vertices)
+
+
+def test_lod_mesh_levels(tmp_path):
+  from seismic_canvas.lod_mesh import LODMesh
+  filename = str(tmp_path / 'skin.dat')
+  _write_skin(filename, n_rows=33, n_cols=40, holes=0.02, seed=2)
+  skin = FaultSkin(filename)
+  vertices, _ = skin.get_vertices_and_faces()
+  lod_faces = skin.get_lod_faces(3)
+  mesh = LODMesh(vertices, lod_faces, vertex_values=skin.strike)
+  assert mesh.n_levels == 3 and mesh.level == 0
+  for k, faces in enumerate(lod_faces):
+    data = mesh.meshes[k].mesh_data
+    if k == 0: # the full mesh
+      np.testing.assert_array_equal(data.get_vertices(), vertices)
+    # Each level draws the same triangles, with only the vertices it uses.
+    np.testing.assert_allclose(data.get_vertices(indexed='faces'),
+                               vertices[faces])
+    assert mesh.meshes[k].visible == (k == 0)
+  assert mesh.set_level(5) and mesh.level == 2
+  assert mesh.meshes[2].visible and not mesh.meshes[0].visible
+  assert not mesh.set_level(2)
+  assert mesh.level_for_scale(4.) == 0 # 1 unit = max_pixels
+  assert mesh.level_for_scale(1.) == 2
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pytest
+
+from seismic_canvas.image_io import ImageWriter
+
+
+def test_wait_raises_background_write_error(tmp_path):
+  image = np.zeros((4, 5, 3), dtype=np.uint8)
+  writer = ImageWriter()
+  bad = writer.submit(str(tmp_path / 'missing_dir' / 'bad.png'), image)
+  bad.exception() # wait until it has failed
+  # Later submissions must not drop the failed write.
+  good = writer.submit(str(tmp_path / 'good.png'), image)
+  assert good.result() == str(tmp_path / 'good.png')
+  writer.submit(str(tmp_path / 'good2'), image)
+  with pytest.raises(OSError):
+    writer.wait()
+  assert os.path.exists(str(tmp_path / 'good2.png'))
+  writer.wait() # the error is only raised once
+  writer.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from seismic_canvas.precompute import precompute_volume, _picklable_source
+
+
+@pytest.fixture
+def ramp(tmp_path):
+  filename = str(tmp_path / 'ramp.dat')
+  shape = (6, 5, 6)
+  m = np.memmap(filename, dtype='>f4', mode='w+', shape=shape, offset=16)
+  m[:] = np.arange(np.prod(shape)).reshape(shape)
+  m.flush()
+  return np.memmap(filename, dtype='>f4', mode='r', shape=shape, offset=16)
+
+
+def test_picklable_source_of_view(ramp):
+  filename, dtype, shape, offset = _picklable_source(ramp[2:4])
+  assert shape == (2, 5, 6)
+  assert offset == 16 + 2 * 30 * 4
+  assert _picklable_source(ramp[:, 1:3]) is None # not contiguous
+
+
+@pytest.mark.parametrize('ext', ['.dat', '.npy', '.bvol', '.cvol'])
+def test_precompute_memmap_view(ramp, tmp_path, ext):
+  # np.negative can be pickled, so the chunks run in worker processes.
+  out = precompute_volume(ramp[2:4], np.negative, str(tmp_path / ('out' +
+                          ext)), chunk=1, n_workers=2)
+  np.testing.assert_array_equal(np.asarray(out), -np.asarray(ramp[2:4]))
+  assert np.asarray(out)[0, 0, 0] == -60.
+
+
+def _fail_on_third_slice(block):
+  if (block == 60.).any():
+    raise RuntimeError('bad chunk')
+  return block
+
+
+@pytest.mark.parametrize('ext', ['.dat', '.npy', '.bvol', '.cvol'])
+def test_precompute_error_removes_output(ramp, tmp_path, ext):
+  dst = tmp_path / ('out' + ext)
+  with pytest.raises(RuntimeError, match='bad chunk'):
+    precompute_volume(ramp, _fail_on_third_slice, str(dst), chunk=1,
+                      n_workers=2, brick_size=2)
+  assert not dst.exists()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import os
+
+import numpy as np
+import pytest
+
+from seismic_canvas.segy_volume import SegyVolume, write_segy, \
+                                       ibm_to_ieee, ieee_to_ibm
+
+
+_HEADERS_SIZE = 3200 + 400 # text and binary headers
+
+
+def _volume(format, shape=(4, 3, 7)):
+  values = np.arange(np.prod(shape)).reshape(shape) - 30
+  if format in (1, 5):
+    return (values * 0.37).astype(np.float32)
+  return values.astype({2: np.int32, 3: np.int16, 8: np.int8}[format])
+
+
+def _traces(filename, n_samples):
+  """ The trace records of a file written by write_segy, as raw bytes.
+  """
+  with open(filename, 'rb') as f:
+    headers, data = f.read(_HEADERS_SIZE), f.read()
+  trace_size = 240 + 4 * n_samples
+  return headers, np.frombuffer(data, np.uint8).reshape(-1, trace_size)
+
+
+@pytest.mark.parametrize('format', [1, 2, 3, 5, 8])
+def test_round_trip(tmp_path, format):
+  vol = _volume(format)
+  filename = str(tmp_path / 'survey.sgy')
+  write_segy(filename, vol, format=format, sample_interval=2000,
+             first_inline=100, first_crossline=7)
+  segy = SegyVolume(filename, index=False)
+  assert segy.shape == vol.shape
+  assert segy.format == format and segy.sample_interval == 2000
+  assert segy.complete
+  assert list(segy.inlines) == [100, 101, 102, 103]
+  assert list(segy.crosslines) == [7, 8, 9]
+  if format == 1: # 24-bit hexadecimal mantissa
+    np.testing.assert_allclose(np.asarray(segy), vol, rtol=1e-6)
+  else:
+    assert segy.dtype == vol.dtype
+    np.testing.assert_array_equal(np.asarray(segy), vol)
+  np.testing.assert_array_equal(segy[1:3, :, 2:5],
+                                np.asarray(segy)[1:3, :, 2:5])
+
+
+def test_shuffled_and_missing_traces(tmp_path):
+  vol = _volume(5)
+  filename = str(tmp_path / 'survey.sgy')
+  write_segy(filename, vol, format=5)
+  headers, traces = _traces(filename, vol.shape[2])
+  # Drop the traces (0, 1) and (2, 2), and shuffle the others.
+  keep = np.delete(np.arange(len(traces)), [1, 8])
+  keep = np.random.RandomState(0).permutation(keep)
+  with open(filename, 'wb') as f:
+    f.write(headers)
+    f.write(traces[keep].tobytes())
+
+  segy = SegyVolume(filename, index=False)
+  assert segy.shape == vol.shape
+  assert not segy.complete
+  expected = vol.copy()
+  expected[0, 1] = 0
+  expected[2, 2] = 0
+  np.testing.assert_array_equal(np.asarray(segy), expected)
+  np.testing.assert_array_equal(segy[:, 2, 3], expected[:, 2, 3])
+
+
+def test_index_reuse_and_invalidation(tmp_path, monkeypatch):
+  vol = _volume(3)
+  filename = str(tmp_path / 'survey.sgy')
+  write_segy(filename, vol, format=3)
+  SegyVolume(filename)
+  assert os.path.exists(filename + '.index.npz')
+
+  scans = []
+  scan = SegyVolume._scan
+  def counted_scan(self):
+    scans.append(self)
+    return scan(self)
+  monkeypatch.setattr(SegyVolume, '_scan', counted_scan)
+
+  segy = SegyVolume(filename)
+  assert scans == [] # the saved index is used
+  np.testing.assert_array_equal(np.asarray(segy), vol)
+  # Indexed with other byte locations: scanned again.
+  SegyVolume(filename, iline=193, xline=189)
+  assert len(scans) == 1
+  # The file changed (same size, new modification time): scanned again.
+  st = os.stat(filename)
+  os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+  segy = SegyVolume(filename)
+  assert len(scans) == 2
+  np.testing.assert_array_equal(np.asarray(segy), vol)
+  SegyVolume(filename)
+  assert len(scans) == 2
+
+
+def test_custom_header_locations(tmp_path):
+  vol = _volume(2)
+  filename = str(tmp_path / 'survey.sgy')
+  write_segy(filename, vol, format=2, first_inline=11, first_crossline=21)
+  headers, traces = _traces(filename, vol.shape[2])
+  # Move the inline and crossline numbers from the bytes 189 and 193 to
+  # the bytes 9 and 21 (1-based), and clear them at the standard ones.
+  traces = traces.copy()
+  traces[:, 8:12] = traces[:, 188:192]
+  traces[:, 20:24] = traces[:, 192:196]
+  traces[:, 188:196] = 0
+  with open(filename, 'wb') as f:
+    f.write(headers)
+    f.write(traces.tobytes())
+
+  segy = SegyVolume(filename, iline=9, xline=21, index=False)
+  assert list(segy.inlines) == [11, 12, 13, 14]
+  assert list(segy.crosslines) == [21, 22, 23]
+  np.testing.assert_array_equal(np.asarray(segy), vol)
+  # All the traces are at (0, 0) with the standard locations.
+  segy = SegyVolume(filename, index=False)
+  assert segy.shape == (1, 1, vol.shape[2])
+
+
+def test_ibm_known_values():
+  words = np.array([0xC276A000, 0x42640000, 0x41100000, 0x40800000,
+                    0x00000000, 0x80000000], dtype=np.uint32)
+  values = np.array([-118.625, 100., 1., 0.5, 0., -0.], dtype=np.float32)
+  np.testing.assert_array_equal(ibm_to_ieee(words), values)
+  np.testing.assert_array_equal(ieee_to_ibm(values[:5]), words[:5])
+  # The bytes as they are in the files (big-endian words).
+  raw = np.frombuffer(words.astype('>u4').tobytes(), dtype='>u4')
+  np.testing.assert_array_equal(ibm_to_ieee(raw), values)
+
+
+def test_ibm_round_trip_limits():
+  tiny = np.finfo(np.float32).tiny # smallest normal float32
+  big = np.finfo(np.float32).max
+  values = np.array([big, -big, big / 3, tiny, -tiny, tiny * 3, 1e-30,
+                     -7.5e37, 0.1, np.pi], dtype=np.float32)
+  np.testing.assert_allclose(ibm_to_ieee(ieee_to_ibm(values)), values,
+                             rtol=2**-21)
+  # Exactly representable with a 24-bit hexadecimal mantissa.
+  exact = np.array([big, 2**-126, 2**100, -2**-100], dtype=np.float32)
+  np.testing.assert_array_equal(ibm_to_ieee(ieee_to_ibm(exact)), exact)
+
+  # Out of the float32 range: +-inf and 0.
+  words = np.array([0x61100000, 0xFFFFFFFF, 0x00100000], dtype=np.uint32)
+  np.testing.assert_array_equal(ibm_to_ieee(words), [np.inf, -np.inf, 0])
+  # Out of the IBM range: clipped to the largest value, or 0.
+  np.testing.assert_array_equal(ieee_to_ibm([1e80, -1e80, 1e-80]),
+                                [0x7FFFFFFF, 0xFFFFFFFF, 0])
+
+
+def test_ibm_scalars():
+  assert ibm_to_ieee(np.uint32(0xC276A000)) == -118.625
+  assert ibm_to_ieee(0x61100000) == np.inf # 16**32 = 2**128
+  assert ieee_to_ibm(-118.625) == 0xC276A000
+  assert ieee_to_ibm(1e80) == 0x7FFFFFFF
+  assert ieee_to_ibm(np.float32(1e-80)) == 0
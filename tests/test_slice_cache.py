@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import gc
+import threading
+
+import numpy as np
+
+from seismic_canvas.slice_cache import SliceCache
+
+
+def test_fetch_copies_views_only():
+  cache = SliceCache()
+  vol = np.arange(60, dtype=np.float32).reshape(3, 4, 5)
+  image = np.ones((4, 5), dtype=np.float32)
+  # A new array (e.g. byte swapped or preprocessed) is cached as is.
+  assert cache.fetch('new', lambda: image) is image
+  assert not image.flags.writeable
+  # A view of the volume is copied, the cache does not keep vol alive.
+  value = cache.fetch('view', lambda: vol[1])
+  assert not np.shares_memory(value, vol)
+  np.testing.assert_array_equal(value, vol[1])
+
+
+def _image(value, nbytes=400):
+  return np.full(nbytes // 4, value, dtype=np.float32)
+
+
+def test_lru_eviction_order():
+  cache = SliceCache(max_bytes=1000)
+  for i, key in enumerate('abc'): # 1200 bytes: 'a' is evicted
+    cache.put(key, _image(i))
+  assert 'a' not in cache and cache.nbytes == 800
+  assert cache.get('b') is not None # 'b' becomes the most recently used
+  cache.put('d', _image(0))
+  assert 'c' not in cache and 'b' in cache and 'd' in cache
+  assert cache.evictions == 2 and cache.nbytes <= cache.max_bytes
+  # Too large to be cached at all, returned anyway.
+  assert cache.put('e', _image(0, 2000)).nbytes == 2000
+  assert 'e' not in cache and len(cache) == 2
+  stats = cache.stats
+  assert (stats['hits'], stats['misses']) == (1, 0)
+
+
+class _Volume(object):
+  pass
+
+
+def test_token_invalidation_on_collection():
+  cache = SliceCache()
+  vol, other = _Volume(), _Volume()
+  token = cache.token(vol)
+  assert cache.token(vol) == token
+  cache.put((token, None, 'x', 0), _image(1))
+  cache.put((None, token, 'x', 1), _image(2)) # as a preprocessing token
+  cache.put((cache.token(other), None, 'x', 0), _image(3))
+  del vol
+  gc.collect()
+  assert len(cache) == 1 and cache.nbytes == 400
+  # Objects without weak references are pinned instead.
+  pinned = [1, 2]
+  cache.token(pinned)
+  assert pinned in cache._pinned
+
+
+def test_fetch_from_threads():
+  cache = SliceCache(max_bytes=10 * 400)
+  loads = []
+  start = threading.Barrier(8)
+  errors = []
+
+  def load(key):
+    loads.append(key)
+    return _image(key)
+
+  def worker(seed):
+    try:
+      start.wait()
+      rng = np.random.RandomState(seed)
+      for key in rng.randint(0, 20, 200):
+        value = cache.fetch(int(key), lambda: load(int(key)))
+        assert value[0] == key
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert not errors
+  assert cache.nbytes == sum(v.nbytes for v in cache._entries.values())
+  assert cache.nbytes <= cache.max_bytes and not cache._loading
+  assert len(loads) <= cache.misses
+  assert cache.hits + cache.misses >= 8 * 200
+
+
+def test_concurrent_fetch_loads_once():
+  cache = SliceCache()
+  release = threading.Event()
+  loads = []
+
+  def load():
+    loads.append(1)
+    release.wait()
+    return _image(1)
+
+  results = []
+  threads = [threading.Thread(target=lambda: results.append(
+    cache.fetch('key', load))) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  release.set()
+  for thread in threads:
+    thread.join()
+  assert len(loads) == 1 and len(results) == 4
+  assert all(r is results[0] for r in results)
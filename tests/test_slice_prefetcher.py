@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import threading
+
+from seismic_canvas.slice_prefetcher import SlicePrefetcher
+
+
+class _Node(object):
+  """ Stands for an AxisAlignedImage: its image function records the
+  positions it is called at, and blocks while 'unblocked' is cleared.
+  """
+  def __init__(self, limit=None):
+    self.limit = limit
+    self.calls = []
+    self.unblocked = threading.Event()
+    self.unblocked.set()
+    self.started = threading.Event() # set when a read starts
+    self.image_funcs = [self.image_func]
+
+  def image_func(self, pos, level=0):
+    self.started.set()
+    self.unblocked.wait()
+    self.calls.append((pos, level))
+
+
+def _wait(prefetcher, node):
+  for future in list(prefetcher._states[node].futures.values()):
+    future.result()
+
+
+def _positions(node):
+  return sorted(pos for pos, _ in node.calls)
+
+
+def test_depth_from_direction_and_speed():
+  prefetcher = SlicePrefetcher(depth=4, speed_smoothing=0.5)
+  node = _Node(limit=(0, 19))
+  prefetcher.observe(node, 10) # first position, nothing to predict
+  assert node.calls == [] and prefetcher.issued == 0
+  prefetcher.observe(node, 11)
+  _wait(prefetcher, node)
+  assert _positions(node) == [12, 13, 14, 15]
+
+  # Faster: the speed average goes 1 -> 2, so the stride is 2; the last
+  # positions are past the limit.
+  del node.calls[:]
+  prefetcher.observe(node, 14)
+  _wait(prefetcher, node)
+  assert _positions(node) == [16, 18]
+
+  # Backwards, at a level of detail.
+  del node.calls[:]
+  prefetcher.observe(node, 13, level=1)
+  _wait(prefetcher, node)
+  assert sorted(node.calls) == [(9, 1), (10, 1), (11, 1), (12, 1)]
+  assert prefetcher.issued == 10
+  prefetcher.shutdown()
+
+
+def test_hit_late_miss_counters():
+  prefetcher = SlicePrefetcher(depth=2, n_workers=1)
+  node = _Node()
+  prefetcher.observe(node, 10)
+  prefetcher.observe(node, 11) # miss
+  _wait(prefetcher, node)
+  prefetcher.observe(node, 12) # hit
+  node.unblocked.clear()
+  prefetcher.observe(node, 13) # hit, then reads 14 and 15 (blocked)
+  prefetcher.observe(node, 14) # late
+  assert prefetcher.stats['hits'] == 2
+  assert (prefetcher.late, prefetcher.misses) == (1, 1)
+  assert prefetcher.stats['hit_rate'] == 0.5
+  node.unblocked.set()
+  prefetcher.shutdown()
+  prefetcher.reset_stats()
+  assert prefetcher.hits == prefetcher.late == prefetcher.misses == 0
+
+
+def _reverse_while_blocked(prefetcher):
+  node = _Node()
+  prefetcher.observe(node, 10)
+  node.unblocked.clear()
+  prefetcher.observe(node, 11) # reads 12 (running, blocked), 13..15 queued
+  node.started.wait()
+  prefetcher.observe(node, 10) # reverse: reads 9..6
+  node.unblocked.set()
+  _wait(prefetcher, node)
+  prefetcher.shutdown()
+  return node
+
+
+def test_cancel_on_reverse():
+  prefetcher = SlicePrefetcher(depth=4, n_workers=1, cancel_on_reverse=True)
+  node = _reverse_while_blocked(prefetcher)
+  assert prefetcher.cancelled == 3
+  assert _positions(node) == [6, 7, 8, 9, 12]
+
+  # Otherwise the reads behind are still done (and cached).
+  prefetcher = SlicePrefetcher(depth=4, n_workers=1, cancel_on_reverse=False)
+  node = _reverse_while_blocked(prefetcher)
+  assert prefetcher.cancelled == 0
+  assert _positions(node) == [6, 7, 8, 9, 12, 13, 14, 15]
+
+
+def test_forget_cancels_pending_reads():
+  prefetcher = SlicePrefetcher(depth=3, n_workers=1)
+  node = _Node()
+  prefetcher.observe(node, 0)
+  node.unblocked.clear()
+  prefetcher.observe(node, 1)
+  node.started.wait()
+  prefetcher.forget(node)
+  node.unblocked.set()
+  prefetcher.shutdown()
+  assert prefetcher.cancelled == 2 and _positions(node) == [2]
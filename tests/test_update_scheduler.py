@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+from seismic_canvas.update_scheduler import UpdateScheduler
+
+
+class _Node(object):
+  """ Stands for an AxisAlignedImage, records its moves.
+  """
+  def __init__(self, pos=0):
+    self.pos = pos
+    self.moves = []
+
+  def move_to(self, pos):
+    if pos == self.pos:
+      return False
+    self.pos = pos
+    self.moves.append(pos)
+    return True
+
+
+def test_requests_coalesce_into_one_update():
+  scheduler = UpdateScheduler()
+  x, z = _Node(10), _Node(5)
+  assert scheduler.request(x, 11)
+  assert scheduler.request(x, 12.4) # rounded to 12
+  assert not scheduler.request(x, 11.6) # 12 again: nothing to do
+  assert scheduler.request(x, 14)
+  assert scheduler.request(z, 6)
+  assert scheduler.pending and x.moves == [] # nothing moved before the frame
+
+  scheduler.flush()
+  assert x.moves == [14] and z.moves == [6]
+  assert not scheduler.pending
+  assert scheduler.stats == {'events': 5, 'noops': 1, 'coalesced': 2,
+                             'frames': 1, 'updates': 2,
+                             'events_per_update': 2.5}
+
+  # Back to the current position before the frame: no update at all.
+  assert not scheduler.request(x, 14.2)
+  assert scheduler.request(x, 15) and scheduler.request(x, 14)
+  scheduler.flush(frame=False)
+  assert x.moves == [14] and scheduler.frames == 1
+  assert scheduler.updates == 2
+  scheduler.reset_stats()
+  assert scheduler.stats['events'] == scheduler.stats['updates'] == 0
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+""" The vispy internals seismic_canvas relies on. A failure here means that
+the installed vispy changed them: the texture uploads are then no longer
+timed in the frame stats (see build_pending_textures).
+"""
+
+import numpy as np
+from vispy import scene
+
+from seismic_canvas.axis_aligned_image import TEXTURE_HOOKS
+
+
+def test_image_texture_hooks():
+  image = scene.visuals.Image(np.zeros((4, 4), dtype=np.float32))
+  for name in TEXTURE_HOOKS:
+    assert hasattr(image, name), name
+  assert image._need_texture_upload
+  assert callable(image._build_texture)
+  # The draw hook overridden by AxisAlignedImage and TiledAxisAlignedImage.
+  assert callable(getattr(scene.visuals.Image, '_prepare_draw'))
+
+
+def test_float_slices_scaled_on_gpu():
+  from seismic_canvas import volume_slices
+  vol = np.ones((5, 6, 7), dtype='>f4')
+  node, = volume_slices(vol, x_pos=1, cache=False)
+  # The staged float32 images are uploaded without a CPU rescaled copy.
+  assert type(node._texture).__name__ == 'GPUScaledTexture2D'
+  assert node._data.dtype == np.float32 and node._data.dtype.isnative
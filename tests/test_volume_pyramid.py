@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+import pytest
+
+from seismic_canvas.volume_pyramid import VolumePyramid
+
+
+@pytest.fixture
+def vol():
+  shape = (37, 22, 19) # odd sizes, so the levels round up
+  return np.random.RandomState(0).randn(*shape).astype(np.float32)
+
+
+def _take(vol, axis, pos):
+  return np.take(vol, pos, axis='xyz'.index(axis))
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_build_levels(vol, tmp_path, on_disk):
+  directory = str(tmp_path / 'pyramid') if on_disk else None
+  # chunk=4: the levels are built from several chunks of source slices.
+  pyramid = VolumePyramid.build(vol, n_levels=3, directory=directory,
+                                chunk=4)
+  assert pyramid.n_levels == 3 and pyramid.shape == vol.shape
+  assert [level.shape for level in pyramid.levels] == \
+    [(37, 22, 19), (19, 11, 10), (10, 6, 5)]
+  for k, level in enumerate(pyramid.levels):
+    s = 2 ** k
+    np.testing.assert_array_equal(level, vol[::s, ::s, ::s])
+  if on_disk:
+    reopened = VolumePyramid.open(vol, directory)
+    assert reopened.n_levels == 3
+    assert isinstance(reopened.levels[2], np.memmap)
+    np.testing.assert_array_equal(reopened.levels[2], pyramid.levels[2])
+
+
+@pytest.mark.parametrize('axis', ['x', 'y', 'z'])
+def test_decimated_slices(vol, axis):
+  pyramid = VolumePyramid.build(vol, n_levels=3, chunk=4)
+  # Level 3 is decimated further on the fly from level 2.
+  for level in range(4):
+    s = 2 ** level
+    for pos in range(0, vol.shape['xyz'.index(axis)], s):
+      expected = _take(vol[::s, ::s, ::s], axis, pos // s)
+      np.testing.assert_array_equal(pyramid.slice(axis, pos, level),
+                                    expected)
+      # A region, with start indexes multiple of 2**level.
+      region = (s, 17, 0, 9)
+      expected = _take(vol, axis, pos)[s:17:s, 0:9:s]
+      np.testing.assert_array_equal(
+        pyramid.slice(axis, pos, level, region=region), expected)
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Copyright (C) 2019 Yunzhi Shi @ The University of Texas at Austin.
+# All rights reserved.
+# Distributed under the MIT License. See LICENSE for more info.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+
+from seismic_canvas.out_of_core_volume import memmap_offset
+from seismic_canvas.volume_stats import estimate_clim
+
+
+def _ramp_memmap(tmp_path, shape=(4, 5, 6), offset=0):
+  filename = str(tmp_path / 'ramp.dat')
+  m = np.memmap(filename, dtype='>f4', mode='w+', shape=shape, offset=offset)
+  m[:] = np.arange(np.prod(shape)).reshape(shape)
+  m.flush()
+  return np.memmap(filename, dtype='>f4', mode='r', shape=shape,
+                   offset=offset)
+
+
+def test_memmap_offset_of_views(tmp_path):
+  m = _ramp_memmap(tmp_path, offset=100)
+  assert memmap_offset(m) == 100
+  assert memmap_offset(m[2:4]) == 100 + 2 * 30 * 4
+  assert memmap_offset(m[:, 1]) == 100 + 6 * 4
+  assert memmap_offset(np.asarray(m) + 1) is None
+
+
+def test_sidecar_not_shared_by_views(tmp_path):
+  m = _ramp_memmap(tmp_path)
+  assert estimate_clim(m[0:2], (0, 100)) == (0., 59.)
+  assert estimate_clim(m[2:4], (0, 100)) == (60., 119.)
+  assert estimate_clim(m[:, :, ::2], (0, 100)) == (0., 118.)
+  # The sidecar is still reused for the same view.
+  assert estimate_clim(m[2:4], (0, 100)) == (60., 119.)
+
+
+def test_volume_slices_default_clim_is_min_max():
+  from seismic_canvas import volume_slices
+  vol = np.random.RandomState(0).randn(20, 8, 9).astype(np.float32)
+  nodes = volume_slices(vol, x_pos=0, cache=False)
+  assert tuple(nodes[0].clims[0]) == (vol.min(), vol.max())
+  nodes = volume_slices(vol, x_pos=0, cache=False, clim_percentiles=(1, 99))
+  low, high = np.percentile(vol, (1, 99))
+  np.testing.assert_allclose(nodes[0].clims[0], (low, high))